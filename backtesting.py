@@ -1,72 +1,88 @@
 from data_collector import DataCollector
+from feature_store import FeatureStore
+from engine import (TradingEngine, ModelStrategy, SimulatedBroker, SimulatedClock, ReplayFeed,
+                    candles_from_dataframe, periods_per_year)
+from robustness import RobustnessAnalyzer, print_report
+from metrics import compute_metrics, trade_metrics, closed_trades
+from results_store import ResultsStore
+from config import ROBUSTNESS_PATHS, SYMBOL, QUANTIZATION_ENABLED
 from model import TradingModel
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 
 class Backtester:
-    def __init__(self, initial_balance=10000):
+    def __init__(self, initial_balance=10000, results_store=None):
         self.initial_balance = initial_balance
         self.balance = initial_balance
         self.btc_balance = 0
         self.trades = []
         self.collector = DataCollector()
         self.model = TradingModel()
+        self.feature_store = FeatureStore(collector=self.collector)
         self.historical_days = 730  # 2 anos de dados históricos
+        self.results_store = results_store or ResultsStore()
+        self.timeframe = None
+        self.quantized_model = None
 
     def run_backtest(self, start_date, end_date, timeframe='1d'):
         """Executa o backtesting no período especificado"""
+        self.timeframe = timeframe
         # Coleta dados históricos
         df = self.collector.fetch_ohlcv_data(timeframe=timeframe, limit=self.historical_days)
-        df = self.collector.calculate_indicators(df)
+        df = self.feature_store.update(df, timeframe=timeframe)
         
         # Prepara e treina o modelo com dados anteriores ao período de teste
         train_data = df[df['timestamp'] < start_date]
         X_train, y_train = self.model.prepare_data(train_data)
         self.model.train(X_train, y_train, epochs=20)
+        if QUANTIZATION_ENABLED:
+            # O artefato de QUANTIZED_MODEL_PATH é de outros pesos: converte o modelo recém-treinado
+            from quantization import QuantizedModel
+            self.quantized_model = QuantizedModel.from_trading_model(self.model, X_train)
         
         # Filtra dados para o período de teste
         test_data = df[(df['timestamp'] >= start_date) & (df['timestamp'] <= end_date)]
         
-        # Simula trading
-        for i in range(len(test_data) - 1):
-            current_data = test_data.iloc[i]
-            next_data = test_data.iloc[i + 1]
-            
-            # Prepara dados para previsão
-            features = current_data[['close', 'volume', 'rsi', 'macd', 'bollinger_upper', 'bollinger_lower']].values.reshape(1, -1)
-            prediction = self.model.predict(features)
-            
-            # Simula decisões de trading
-            if prediction > 0.7 and self.btc_balance == 0:
-                # Compra
-                price = current_data['close']
-                amount = (self.balance * 0.95) / price  # Usa 95% do saldo disponível
-                self.btc_balance = amount
-                self.balance -= amount * price
-                self.trades.append({
-                    'timestamp': current_data['timestamp'],
-                    'type': 'BUY',
-                    'price': price,
-                    'amount': amount,
-                    'balance': self.balance + (self.btc_balance * price)
-                })
-                
-            elif prediction < 0.3 and self.btc_balance > 0:
-                # Vende
-                price = current_data['close']
-                amount = self.btc_balance
-                self.balance += amount * price
-                self.btc_balance = 0
-                self.trades.append({
-                    'timestamp': current_data['timestamp'],
-                    'type': 'SELL',
-                    'price': price,
-                    'amount': amount,
-                    'balance': self.balance
-                })
+        # Simula trading com o mesmo motor usado pelo bot ao vivo
+        return self.replay(ReplayFeed.from_dataframe(test_data, timeframe),
+                           warmup=candles_from_dataframe(train_data.tail(self.model.lookback), timeframe))
+
+    def replay(self, feed, warmup=()):
+        """Executa a estratégia sobre um feed de replay (candles e ticks gravados)"""
+        broker = SimulatedBroker(self.balance)
+        self.engine = TradingEngine(ModelStrategy(self.model, quantized_model=self.quantized_model), broker, SimulatedClock())
+        self.engine.warmup(warmup)
+        self.replay_stats = self.engine.run(feed)
+        
+        self.balance = broker.balance
+        self.btc_balance = broker.btc_balance
+        self.trades = broker.trades
+        stats = self.calculate_statistics()
         
-        return self.calculate_statistics()
+        # Toda execução vai para o banco de resultados, com operações e curva de patrimônio
+        self.run_id = self.results_store.record_run('backtest', self.run_params(), stats, self.trades,
+                                                    broker.equity_curve, broker.exposure, symbol=SYMBOL,
+                                                    timeframe=self.timeframe)
+        return stats
+
+    def run_params(self):
+        """Configuração que identifica a execução no banco de resultados"""
+        strategy, broker = self.engine.strategy, self.engine.broker
+        return {
+            'initial_balance': self.initial_balance,
+            'timeframe': self.timeframe,
+            'units': list(self.model.units),
+            'dropout': self.model.dropout,
+            'dense_units': self.model.dense_units,
+            'lookback': self.model.lookback,
+            'features': list(self.model.features),
+            'indicator_params': self.feature_store.indicator_params,
+            'buy_threshold': strategy.buy_threshold,
+            'sell_threshold': strategy.sell_threshold,
+            'fee_rate': broker.fee_rate,
+            'latency_ns': broker.latency,
+        }
     
     def calculate_statistics(self):
         """Calcula estatísticas do backtest"""
@@ -77,8 +93,6 @@ class Backtester:
                 'return_percentage': 0
             }
         
-        trades_df = pd.DataFrame(self.trades)
-        
         # Calcula o valor final (incluindo BTC não vendido ao último preço)
         final_balance = self.balance + (self.btc_balance * self.trades[-1]['price'])
         
@@ -86,12 +100,48 @@ class Backtester:
             'total_trades': len(self.trades),
             'profit_loss': final_balance - self.initial_balance,
             'return_percentage': ((final_balance - self.initial_balance) / self.initial_balance) * 100,
-            'winning_trades': len(trades_df[trades_df['type'] == 'SELL'][trades_df['balance'] > trades_df['balance'].shift(1)]),
-            'average_trade_duration': trades_df['timestamp'].diff().mean() if len(trades_df) > 1 else 0
+            'winning_trades': 0,
+            'average_trade_duration': 0
         }
         
+        # Operações fechadas, casadas pelo id da posição (uma posição ainda aberta fica de fora)
+        closed = closed_trades(self.trades)
+        if closed:
+            trades = trade_metrics(
+                entry_index=[b['bar'] for b, _ in closed],
+                exit_index=[s['bar'] for _, s in closed],
+                entry_price=[b['price'] for b, _ in closed],
+                exit_price=[s['price'] for _, s in closed],
+                high=self.engine.broker.highs,
+                low=self.engine.broker.lows,
+                fees=[(b['fee'] + s['fee']) / (b['amount'] * b['price']) for b, s in closed],
+                entry_fill=[b.get('fill', 'open') for b, _ in closed],
+                exit_fill=[s.get('fill', 'open') for _, s in closed]
+            )
+            stats.update({
+                'winning_trades': trades['winning_trades'],
+                'losing_trades': trades['losing_trades'],
+                'profit_factor': trades['profit_factor'],
+                'average_trade_duration': pd.to_timedelta([s['timestamp'] - b['timestamp'] for b, s in closed]).mean(),
+                'average_holding_bars': float(trades['holding_periods'].mean()),
+                'average_mae': float(trades['mae'].mean()),
+                'average_mfe': float(trades['mfe'].mean()),
+            })
+        
+        # Métricas de risco sobre a curva de patrimônio marcada a mercado
+        if len(self.engine.broker.equity_curve) > 1:
+            stats.update(compute_metrics(np.array(self.engine.broker.equity_curve),
+                                         np.array(self.engine.broker.exposure),
+                                         periods_per_year=periods_per_year(self.timeframe or '1d')))
+        
         return stats
 
+    def analyze_robustness(self, n_paths=ROBUSTNESS_PATHS, workers=None):
+        """Reamostra as operações do backtest para estimar a variância dos resultados"""
+        broker = self.engine.broker
+        with RobustnessAnalyzer(n_paths=n_paths, workers=workers) as analyzer:
+            return analyzer.bootstrap_trades(self.trades, fee_rate=broker.fee_rate, allocation=broker.allocation)
+
 if __name__ == "__main__":
     # Exemplo de uso
     backtester = Backtester(initial_balance=10000)
@@ -109,3 +159,12 @@ if __name__ == "__main__":
     print(f"Trades vencedores: {results['winning_trades']}")
     if results['average_trade_duration']:
         print(f"Duração média dos trades: {results['average_trade_duration']}")
+    if 'sharpe' in results:
+        print(f"Drawdown máximo: {results['max_drawdown']:.2%} ({results['max_drawdown_duration']} períodos)")
+        print(f"Sharpe: {results['sharpe']:.2f} | Sortino: {results['sortino']:.2f} | Calmar: {results['calmar']:.2f}")
+        print(f"Tempo exposto: {results['exposure_time']:.2%}")
+    if 'profit_factor' in results:
+        print(f"Profit factor: {results['profit_factor']:.2f}")
+        print(f"MAE médio: {results['average_mae']:.2%} | MFE médio: {results['average_mfe']:.2%}")
+    
+    print_report(backtester.analyze_robustness())
@@ -16,9 +16,27 @@ TAKE_PROFIT_PERCENTAGE = 0.03  # 3%
 
 # Configurações do modelo de IA
 LOOKBACK_PERIOD = 365  # Período de análise em dias (1 ano)
+MODEL_UNITS = [50, 50]  # Unidades de cada camada LSTM (o tamanho da lista define a profundidade)
+MODEL_DROPOUT = 0.2
+MODEL_DENSE_UNITS = 25
 HISTORICAL_DATA_DAYS = 730  # 2 anos de dados históricos
+
+# Perfil de execução: TRADING_BOT_PROFILE=test reduz o modelo para a suíte de testes rodar offline em segundos
+PROFILE = os.getenv('TRADING_BOT_PROFILE', 'production')
+if PROFILE == 'test':
+    LOOKBACK_PERIOD = 30
+    MODEL_UNITS = [8]
+    MODEL_DENSE_UNITS = 8
+# Candles servidos pela LocalExchange nos testes. A fixture versionada é sintética (passeio aleatório de
+# synthetic_ohlcv); record_fixture grava candles reais em RECORDED_FIXTURE_PATH, e TRADING_BOT_FIXTURE
+# aponta os testes para ela
+TEST_FIXTURE_PATH = os.getenv('TRADING_BOT_FIXTURE', 'fixtures/BTCUSDT_1d_synthetic.csv')
+RECORDED_FIXTURE_PATH = 'fixtures/BTCUSDT_1d.csv'
 FEATURES = ['close', 'volume', 'rsi', 'macd', 'macd_hist', 'bollinger_upper', 'bollinger_lower', 
             'sma_50', 'sma_200', 'momentum', 'atr']
+# Features de microestrutura (calculate_indicators com microstructure=...); úteis em timeframes intradiários,
+# onde os buffers cobrem os candles usados no treino
+MICROSTRUCTURE_FEATURES = ['ob_imbalance', 'spread_bps', 'trade_flow_imbalance', 'vwap_deviation']
 
 # Configurações de sinais
 RSI_OVERSOLD = 30
@@ -26,3 +44,118 @@ RSI_OVERBOUGHT = 70
 MACD_THRESHOLD = 0
 PRICE_CHANGE_THRESHOLD = 0.02  # 2% de mudança
 VOLUME_INCREASE_THRESHOLD = 1.5  # 50% de aumento no volume
+
+# Configurações de quantização do modelo
+QUANTIZATION_MODE = 'int8'  # 'int8' (calibrado) ou 'float32' (referência TFLite)
+QUANTIZATION_BATCH_SIZE = 32  # Tamanho de lote fixo do modelo exportado
+QUANTIZATION_MAX_ACCURACY_DRIFT = 0.02  # Desvio máximo de acurácia direcional (2 p.p.)
+QUANTIZED_MODEL_PATH = 'models/trading_model.tflite'
+# Backtest e bot ao vivo servem o modelo TFLite: o backtest converte o modelo que treinou e o bot ao vivo
+# serve o artefato de QUANTIZED_MODEL_PATH, reexportado a cada retreino (recusado se for de outros pesos)
+QUANTIZATION_ENABLED = False
+
+# Parâmetros dos indicadores técnicos (qualquer mudança invalida o cache de features)
+INDICATOR_PARAMS = {
+    'rsi_period': 14,
+    'macd_fast': 12,
+    'macd_slow': 26,
+    'macd_signal': 9,
+    'bollinger_period': 20,
+    'bollinger_std': 2,
+    'sma_short': 50,
+    'sma_long': 200,
+    'momentum_period': 10,
+    'atr_period': 14,
+}
+
+# Configurações do feature store
+FEATURE_STORE_DIR = 'feature_store'
+FEATURE_STORE_VERSION = 1  # Incrementar ao mudar o código de calculate_indicators
+FEATURE_STORE_EMA_TOLERANCE = 1e-12  # Peso máximo do histórico que as EMAs deixam de ver no aquecimento
+
+# Configurações do motor de execução (live e replay)
+BUY_PROBABILITY_THRESHOLD = 0.7  # Sinal de compra forte
+SELL_PROBABILITY_THRESHOLD = 0.3  # Sinal de venda forte
+SIMULATED_FEE_RATE = 0.001  # Taxa spot da Binance (0.1%)
+SIMULATED_LATENCY_SECONDS = 1.0  # Atraso entre a decisão e a execução no replay (com ticks; sem ticks, executa na abertura seguinte)
+SIMULATED_ALLOCATION = 0.95  # Fração do saldo usada em cada compra
+REPLAY_DATA_DIR = 'replay_data'
+
+# Configurações da análise de robustez (Monte Carlo / bootstrap)
+ROBUSTNESS_PATHS = 10000  # Número de caminhos simulados
+ROBUSTNESS_CHUNK_SIZE = 2000  # Caminhos por tarefa do pool de processos
+ROBUSTNESS_BLOCK_SIZE = 10  # Tamanho do bloco no block bootstrap (períodos)
+ROBUSTNESS_CONFIDENCE = 0.95  # Nível do intervalo de confiança
+ROBUSTNESS_SLIPPAGE = 0.001  # Desvio padrão da perturbação do preço de entrada
+ROBUSTNESS_FEE_JITTER = 0.5  # Variação relativa da taxa (+-50%)
+
+# Configurações do journal de posições
+JOURNAL_DIR = 'journal'
+JOURNAL_SYNC_EVERY = 32  # fsync a cada N registros não críticos
+JOURNAL_SYNC_INTERVAL = 1.0  # ...ou a cada N segundos
+JOURNAL_SNAPSHOT_EVERY = 1000  # Registros entre snapshots
+JOURNAL_ORDER_PREFIX = 'bot'  # Prefixo dos clientOrderId gerados pelo bot
+
+# Configurações do retreino incremental
+MODEL_DIR = 'models'
+INCREMENTAL_EPOCHS = 10  # Épocas máximas por ajuste incremental
+INCREMENTAL_REPLAY_RATIO = 1.0  # Janelas antigas reamostradas por janela nova
+INCREMENTAL_VALIDATION_FRACTION = 0.2  # Janelas mais recentes usadas na validação
+INCREMENTAL_PATIENCE = 3  # Épocas sem melhora antes da parada antecipada
+SCALER_UPDATE_POLICY = 'expand'  # 'freeze' mantém a faixa; 'expand' amplia se os dados saírem dela
+SCALER_DRIFT_TOLERANCE = 0.05  # Excedente relativo tolerado antes de ampliar o scaler
+
+# Configurações da busca de hiperparâmetros
+HPO_DB_PATH = 'hpo/search.db'  # Resultados persistidos (permite retomar a busca)
+HPO_TRIALS = 50
+HPO_RUNGS = [3, 9, 27]  # Épocas acumuladas em cada ponto de avaliação para poda
+HPO_MIN_TRIALS_FOR_PRUNING = 4  # Trials concluídos no mesmo ponto antes de começar a podar
+HPO_SEARCH_SPACE = {
+    'units': [32, 50, 64, 128],
+    'depth': [1, 2, 3],
+    'dropout': [0.0, 0.1, 0.2, 0.3],
+    'dense_units': [16, 25, 32],
+    'lookback': [30, 60, 90, 180, 365],
+    'batch_size': [16, 32, 64],
+    'features': {
+        'all': FEATURES,
+        'price_trend': ['close', 'sma_50', 'sma_200', 'bollinger_upper', 'bollinger_lower'],
+        'oscillators': ['close', 'volume', 'rsi', 'macd', 'macd_hist', 'momentum', 'atr'],
+    },
+}
+
+# Configurações da ingestão de microestrutura (livro de ofertas e trades)
+MICROSTRUCTURE_DEPTH_LEVELS = 10  # Níveis do livro guardados por snapshot
+MICROSTRUCTURE_DEPTH_CAPACITY = 10000  # Snapshots mantidos por símbolo
+MICROSTRUCTURE_TRADE_CAPACITY = 100000  # Trades mantidos por símbolo (também a janela de fluxo/VWAP)
+
+# Configurações do banco de resultados (backtests e varreduras)
+RESULTS_DB_PATH = 'results/results.db'
+
+# Configurações dos rótulos de treino
+TRAINING_TARGET = 'direction'  # 'direction' (próximo candle), 'triple_barrier' ou 'forward_return'
+LABEL_MAX_HOLDING = 10  # Barreira de tempo do triple barrier, em candles
+LABEL_HORIZONS = [1, 5, 10, 20]  # Horizontes dos retornos futuros
+LABEL_TARGET_HORIZON = 5  # Horizonte usado quando TRAINING_TARGET = 'forward_return'
+
+# Configurações do processo ao vivo e da telemetria de memória
+LIVE_HISTORY_BARS = 730  # Candles mantidos em memória a cada ciclo
+LIVE_DECISION_HISTORY = 1000  # Decisões guardadas pelo motor ao vivo
+MEMORY_ALERT_CYCLES = 24  # Ciclos seguidos de crescimento antes do alerta
+MEMORY_ALERT_GROWTH_MB = 50  # Crescimento de RSS nessa janela que dispara o alerta
+MEMORY_TRACEMALLOC = False  # tracemalloc tem custo; ativado no teste de longa duração
+MEMORY_OBJECT_COUNT_EVERY = 24  # Contagem de objetos do GC a cada N amostras (percorre o heap); 0 desativa
+
+# Configurações da fila de jobs distribuída (varreduras e walk-forward)
+JOBS_DB_PATH = 'jobs/queue.db'  # Em armazenamento compartilhado quando houver várias máquinas
+JOB_LEASE_SECONDS = 60  # Sem heartbeat nesse prazo, o job volta para a fila
+JOB_HEARTBEAT_SECONDS = 15
+JOB_MAX_ATTEMPTS = 3
+JOB_POLL_SECONDS = 1.0
+
+# Configurações das saídas no cliente (stops móveis, ATR e tempo)
+TRAILING_STOP_PERCENTAGE = 0.03  # Distância do stop móvel abaixo da máxima desde a entrada
+ATR_STOP_MULTIPLIER = 2.0  # Stop a N ATRs da máxima (ou da entrada, se fixo)
+MAX_HOLDING_SECONDS = 7 * 24 * 3600  # Saída por tempo
+EXIT_LATENCY_HISTORY = 10000  # Latências de despacho guardadas (as mais recentes)
+EXIT_COMPACT_FRACTION = 0.5  # Fração de entradas de posições encerradas que dispara a reconstrução dos heaps
@@ -3,11 +3,12 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import time
-from config import API_KEY, API_SECRET, SYMBOL
+from config import API_KEY, API_SECRET, SYMBOL, INDICATOR_PARAMS, MICROSTRUCTURE_FEATURES
 
 class DataCollector:
-    def __init__(self):
-        self.exchange = ccxt.binance({
+    def __init__(self, exchange=None):
+        # Qualquer objeto com fetch_ohlcv no formato do ccxt (ex.: LocalExchange) pode substituir a Binance
+        self.exchange = exchange or ccxt.binance({
             'apiKey': API_KEY,
             'secret': API_SECRET,
             'enableRateLimit': True
@@ -26,37 +27,44 @@ class DataCollector:
             print(f"Erro ao coletar dados: {e}")
             return None
 
-    def calculate_indicators(self, df):
+    def calculate_indicators(self, df, params=INDICATOR_PARAMS, microstructure=None, timeframe='1d'):
         """Calcula indicadores técnicos"""
         # RSI
         delta = df['close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
+        gain = (delta.where(delta > 0, 0)).rolling(window=params['rsi_period']).mean()
+        loss = (-delta.where(delta < 0, 0)).rolling(window=params['rsi_period']).mean()
         rs = gain / loss
         df['rsi'] = 100 - (100 / (1 + rs))
 
         # MACD
-        exp1 = df['close'].ewm(span=12, adjust=False).mean()
-        exp2 = df['close'].ewm(span=26, adjust=False).mean()
+        exp1 = df['close'].ewm(span=params['macd_fast'], adjust=False).mean()
+        exp2 = df['close'].ewm(span=params['macd_slow'], adjust=False).mean()
         df['macd'] = exp1 - exp2
-        df['signal'] = df['macd'].ewm(span=9, adjust=False).mean()
+        df['signal'] = df['macd'].ewm(span=params['macd_signal'], adjust=False).mean()
         df['macd_hist'] = df['macd'] - df['signal']
 
         # Bollinger Bands
-        df['sma'] = df['close'].rolling(window=20).mean()
-        df['std'] = df['close'].rolling(window=20).std()
-        df['bollinger_upper'] = df['sma'] + (df['std'] * 2)
-        df['bollinger_lower'] = df['sma'] - (df['std'] * 2)
+        df['sma'] = df['close'].rolling(window=params['bollinger_period']).mean()
+        df['std'] = df['close'].rolling(window=params['bollinger_period']).std()
+        df['bollinger_upper'] = df['sma'] + (df['std'] * params['bollinger_std'])
+        df['bollinger_lower'] = df['sma'] - (df['std'] * params['bollinger_std'])
         
         # Tendência (Médias Móveis)
-        df['sma_50'] = df['close'].rolling(window=50).mean()
-        df['sma_200'] = df['close'].rolling(window=200).mean()
+        df['sma_50'] = df['close'].rolling(window=params['sma_short']).mean()
+        df['sma_200'] = df['close'].rolling(window=params['sma_long']).mean()
         
         # Momentum
-        df['momentum'] = df['close'].pct_change(periods=10)
+        df['momentum'] = df['close'].pct_change(periods=params['momentum_period'])
         
         # Volatilidade
-        df['atr'] = self.calculate_atr(df)
+        df['atr'] = self.calculate_atr(df, period=params['atr_period'])
+        
+        # Microestrutura (livro de ofertas e fluxo de trades), agregada por candle
+        if microstructure is not None:
+            timestamps = df['timestamp'].values.astype('datetime64[ns]').astype(np.int64)
+            features = microstructure.candle_features(timestamps, pd.Timedelta(timeframe).value)
+            for column in MICROSTRUCTURE_FEATURES:
+                df[column] = features[column].values
         
         return df
         
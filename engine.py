@@ -0,0 +1,338 @@
+import os
+import time
+import heapq
+import hashlib
+from collections import deque, namedtuple
+import numpy as np
+import pandas as pd
+from config import (FEATURES, LOOKBACK_PERIOD, SIMULATED_FEE_RATE, SIMULATED_LATENCY_SECONDS, SIMULATED_ALLOCATION,
+                    BUY_PROBABILITY_THRESHOLD, SELL_PROBABILITY_THRESHOLD, QUANTIZATION_ENABLED,
+                    QUANTIZED_MODEL_PATH)
+
+# Eventos do motor (timestamps em nanossegundos desde a época)
+Candle = namedtuple('Candle', ['timestamp', 'close_time', 'open', 'high', 'low', 'close', 'features'])
+Tick = namedtuple('Tick', ['timestamp', 'price'])
+
+def timeframe_to_ns(timeframe):
+    """Converte um timeframe da exchange ('1h', '1d', '1w') em nanossegundos"""
+    return pd.Timedelta(timeframe).value
+
+def periods_per_year(timeframe):
+    """Candles por ano no timeframe, para anualizar as métricas (mercado cripto: 365 dias)"""
+    return pd.Timedelta(days=365).value / timeframe_to_ns(timeframe)
+
+def candles_from_dataframe(df, timeframe='1d', features=FEATURES):
+    """Converte um DataFrame com indicadores em eventos Candle"""
+    timestamps = df['timestamp'].values.astype('datetime64[ns]').astype(np.int64)
+    duration = timeframe_to_ns(timeframe)
+    values = df[features].to_numpy(dtype=np.float64)
+    prices = df[['open', 'high', 'low', 'close']].to_numpy(dtype=np.float64)
+    return [Candle(int(ts), int(ts) + duration, float(o), float(h), float(l), float(c), row)
+            for ts, (o, h, l, c), row in zip(timestamps, prices, values)]
+
+def record_candles(df, path, timeframe='1d', features=FEATURES):
+    """Grava candles com features em disco para replay (float64 exato, sem perda)"""
+    np.savez(path,
+             timestamps=df['timestamp'].values.astype('datetime64[ns]').astype(np.int64),
+             prices=df[['open', 'high', 'low', 'close']].to_numpy(dtype=np.float64),
+             features=df[features].to_numpy(dtype=np.float64),
+             columns=np.array(features),
+             timeframe=np.array(timeframe))
+
+def append_candles(df, path, timeframe='1d', features=FEATURES):
+    """Acrescenta à gravação só os candles posteriores ao último gravado (o histórico anterior é mantido)"""
+    if not os.path.exists(path):
+        record_candles(df, path, timeframe, features)
+        return len(df)
+
+    with np.load(path) as data:
+        if str(data['timeframe']) != timeframe or list(data['columns']) != list(features):
+            raise ValueError(f"Gravação '{path}' usa outro timeframe ou outras features")
+        recorded = {name: data[name] for name in ('timestamps', 'prices', 'features')}
+
+    timestamps = df['timestamp'].values.astype('datetime64[ns]').astype(np.int64)
+    new = timestamps > recorded['timestamps'][-1] if len(recorded['timestamps']) else np.ones(len(df), bool)
+    if not new.any():
+        return 0
+
+    # Escrita atômica: uma falha no meio não perde as decisões já gravadas
+    tmp_path = path + '.tmp.npz'
+    np.savez(tmp_path,
+             timestamps=np.concatenate([recorded['timestamps'], timestamps[new]]),
+             prices=np.concatenate([recorded['prices'],
+                                    df[['open', 'high', 'low', 'close']].to_numpy(dtype=np.float64)[new]]),
+             features=np.concatenate([recorded['features'], df[features].to_numpy(dtype=np.float64)[new]]),
+             columns=np.array(features),
+             timeframe=np.array(timeframe))
+    os.replace(tmp_path, path)
+    return int(new.sum())
+
+def record_ticks(timestamps, prices, path):
+    """Grava um fluxo de ticks (timestamp em ns, preço) para replay"""
+    np.savez(path, timestamps=np.asarray(timestamps, dtype=np.int64),
+             prices=np.asarray(prices, dtype=np.float64))
+
+class ReplayFeed:
+    def __init__(self, candles, ticks=()):
+        self.candles = candles
+        self.ticks = ticks
+
+    @classmethod
+    def from_dataframe(cls, df, timeframe='1d'):
+        return cls(candles_from_dataframe(df, timeframe))
+
+    @classmethod
+    def from_files(cls, candles_path, ticks_path=None):
+        """Carrega candles e ticks gravados por record_candles/record_ticks"""
+        with np.load(candles_path) as data:
+            duration = timeframe_to_ns(str(data['timeframe']))
+            candles = [Candle(int(ts), int(ts) + duration, float(o), float(h), float(l), float(c), row)
+                       for ts, (o, h, l, c), row in zip(data['timestamps'], data['prices'], data['features'])]
+        ticks = []
+        if ticks_path is not None:
+            with np.load(ticks_path) as data:
+                ticks = [Tick(int(ts), float(p)) for ts, p in zip(data['timestamps'], data['prices'])]
+        return cls(candles, ticks)
+
+    def __iter__(self):
+        """Intercala candles (no fechamento) e ticks em ordem temporal"""
+        # Em empate, o tick vem antes do fechamento do candle que o contém
+        candle_events = ((c.close_time, 1, c) for c in self.candles)
+        tick_events = ((t.timestamp, 0, t) for t in self.ticks)
+        for _, _, event in heapq.merge(tick_events, candle_events, key=lambda e: (e[0], e[1])):
+            yield event
+
+class SimulatedClock:
+    def __init__(self, start=0):
+        self.current = start
+
+    def now(self):
+        return self.current
+
+    def advance_to(self, timestamp):
+        self.current = max(self.current, timestamp)
+
+class LiveClock:
+    def now(self):
+        return time.time_ns()
+
+    def advance_to(self, timestamp):
+        pass
+
+class ModelStrategy:
+    def __init__(self, model, lookback=None, buy_threshold=BUY_PROBABILITY_THRESHOLD,
+                 sell_threshold=SELL_PROBABILITY_THRESHOLD, quantized=QUANTIZATION_ENABLED,
+                 quantized_path=QUANTIZED_MODEL_PATH, quantized_model=None):
+        self.model = model
+        # Com a quantização ativa, as previsões vêm do artefato TFLite (com o scaler exportado junto)
+        self.quantized = quantized or quantized_model is not None
+        self.quantized_path = quantized_path
+        self.quantized_model = quantized_model
+        self.lookback = lookback or getattr(model, 'lookback', LOOKBACK_PERIOD)
+        # Modelos treinados com um subconjunto de FEATURES recebem só as suas colunas
+        model_features = getattr(model, 'features', FEATURES)
+        self.columns = None if model_features == FEATURES else [FEATURES.index(f) for f in model_features]
+        self.buy_threshold = buy_threshold
+        self.sell_threshold = sell_threshold
+        self.window = deque(maxlen=self.lookback)
+
+    @property
+    def predictor(self):
+        """Modelo que faz as previsões; o artefato quantizado é (re)carregado quando os pesos mudam
+
+        O modelo pode ser carregado ou retreinado depois da criação da estratégia; um artefato de
+        outros pesos é recusado (ValueError) em vez de servir previsões de outro modelo.
+        """
+        if not self.quantized:
+            return self.model
+        if self.quantized_model is None or not self.quantized_model.matches(self.model):
+            from quantization import QuantizedModel  # Import tardio: o TFLite só é carregado se usado
+            self.quantized_model = QuantizedModel.load_for_model(self.model, self.quantized_path)
+        return self.quantized_model
+
+    def _features(self, candle):
+        return candle.features if self.columns is None else candle.features[self.columns]
+
+    def warmup(self, candle):
+        self.window.append(self._features(candle))
+
+    def on_candle(self, candle, position):
+        """Retorna (ação, probabilidade) para o candle fechado"""
+        self.window.append(self._features(candle))
+        if len(self.window) < self.lookback:
+            return 'HOLD', None
+
+        probability = float(self.predictor.predict(np.array(self.window)))
+        if probability > self.buy_threshold and position is None:
+            return 'BUY', probability
+        if probability < self.sell_threshold and position == 'LONG':
+            return 'SELL', probability
+        return 'HOLD', probability
+
+class SimulatedBroker:
+    def __init__(self, initial_balance=10000, fee_rate=SIMULATED_FEE_RATE,
+                 latency_seconds=SIMULATED_LATENCY_SECONDS, allocation=SIMULATED_ALLOCATION):
+        self.balance = initial_balance
+        self.btc_balance = 0
+        self.fee_rate = fee_rate
+        self.latency = int(latency_seconds * 1e9)
+        self.allocation = allocation
+        self.pending = []
+        self.trades = []
+        self.positions = 0  # Id da posição atual; compra e venda da mesma posição compartilham o id
+        self.bar = -1
+        self.equity_curve = []
+        self.exposure = []
+        self.highs = []
+        self.lows = []
+
+    @property
+    def position(self):
+        if self.pending:
+            return 'LONG' if self.pending[-1][0] == 'BUY' else None
+        return 'LONG' if self.btc_balance > 0 else None
+
+    def submit(self, action, timestamp):
+        """Registra a ordem; ela só é executada após a latência simulada"""
+        self.pending.append((action, timestamp + self.latency))
+
+    def on_candle(self, candle):
+        self.bar += 1
+        # Sem ticks, a ordem que vence dentro do candle executa na abertura: uma latência menor que o
+        # candle não custa um candle inteiro, e a ordem a mercado ao vivo sai perto dessa abertura
+        while self.pending and self.pending[0][1] <= candle.close_time:
+            action, _ = self.pending.pop(0)
+            self._fill(action, candle.open, candle.timestamp, self.bar, 'open')
+
+        # Marca a mercado no fechamento para as métricas da curva de patrimônio
+        self.equity_curve.append(self.balance + self.btc_balance * candle.close)
+        self.exposure.append(self.btc_balance > 0)
+        self.highs.append(candle.high)
+        self.lows.append(candle.low)
+
+    def on_tick(self, tick):
+        while self.pending and self.pending[0][1] <= tick.timestamp:
+            # O tick pertence ao candle ainda não fechado
+            action, _ = self.pending.pop(0)
+            self._fill(action, tick.price, tick.timestamp, self.bar + 1, 'tick')
+
+    def _fill(self, action, price, timestamp, bar, fill):
+        """Executa a ordem; fill diz onde no candle bar ela saiu ('open', 'close' ou 'tick', no meio)"""
+        if action == 'BUY' and self.btc_balance == 0:
+            self.positions += 1
+            amount = (self.balance * self.allocation) / price
+            fee = amount * price * self.fee_rate
+            self.btc_balance = amount
+            self.balance -= amount * price + fee
+            balance = self.balance + (self.btc_balance * price)
+        elif action == 'SELL' and self.btc_balance > 0:
+            amount = self.btc_balance
+            fee = amount * price * self.fee_rate
+            self.balance += amount * price - fee
+            self.btc_balance = 0
+            balance = self.balance
+        else:
+            return
+
+        self.trades.append({
+            'timestamp': pd.Timestamp(timestamp),
+            'type': action,
+            'price': price,
+            'amount': amount,
+            'fee': fee,
+            'balance': balance,
+            'bar': bar,
+            'fill': fill,
+            'position': self.positions
+        })
+
+class LiveBroker:
+    def __init__(self, trader):
+        self.trader = trader
+
+    @property
+    def position(self):
+        return self.trader.check_position()
+
+    def submit(self, action, timestamp):
+        if action == 'BUY':
+            self.trader.place_buy_order(self.trader.get_current_price())
+        elif action == 'SELL':
+            self.trader.place_sell_order()
+
+    def on_candle(self, candle):
+        pass
+
+    def on_tick(self, tick):
+        pass
+
+class TradingEngine:
+    def __init__(self, strategy, broker, clock=None, max_decisions=None):
+        self.strategy = strategy
+        self.broker = broker
+        self.clock = clock or SimulatedClock()
+        # No processo ao vivo o histórico de decisões é limitado (max_decisions)
+        self.decisions = deque(maxlen=max_decisions)
+
+    def warmup(self, candles):
+        """Alimenta o histórico da estratégia sem gerar decisões"""
+        for candle in candles:
+            self.strategy.warmup(candle)
+
+    def on_candle(self, candle):
+        self.clock.advance_to(candle.close_time)
+        self.broker.on_candle(candle)
+        action, probability = self.strategy.on_candle(candle, self.broker.position)
+        if action != 'HOLD':
+            self.broker.submit(action, self.clock.now())
+
+        decision = {'timestamp': candle.timestamp, 'action': action, 'probability': probability}
+        self.decisions.append(decision)
+        return decision
+
+    def on_tick(self, tick):
+        self.clock.advance_to(tick.timestamp)
+        self.broker.on_tick(tick)
+
+    def run(self, feed, speed=None):
+        """Processa os eventos do feed; speed=None roda na velocidade máxima"""
+        events = candles = 0
+        first_time = last_time = None
+        start = time.perf_counter()
+
+        for event in feed:
+            event_time = event.close_time if isinstance(event, Candle) else event.timestamp
+            if first_time is None:
+                first_time = event_time
+            last_time = event_time
+
+            # Em modo acelerado, respeita o tempo simulado dividido por speed
+            if speed:
+                delay = (event_time - first_time) / 1e9 / speed - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+
+            if isinstance(event, Candle):
+                self.on_candle(event)
+                candles += 1
+            else:
+                self.on_tick(event)
+            events += 1
+
+        elapsed = time.perf_counter() - start
+        simulated = (last_time - first_time) / 1e9 if events else 0
+        return {
+            'events': events,
+            'candles': candles,
+            'ticks': events - candles,
+            'elapsed_seconds': elapsed,
+            'events_per_second': events / elapsed if elapsed > 0 else float('inf'),
+            'speedup': simulated / elapsed if elapsed > 0 else float('inf'),
+        }
+
+    def decision_digest(self):
+        """Hash das decisões; replays determinísticos produzem o mesmo valor"""
+        digest = hashlib.sha256()
+        for decision in self.decisions:
+            digest.update(f"{decision['timestamp']}|{decision['action']}|{decision['probability']!r}\n".encode())
+        return digest.hexdigest()
@@ -0,0 +1,272 @@
+import math
+import time
+import heapq
+import itertools
+from collections import deque, namedtuple
+import numpy as np
+from config import (SYMBOL, INDICATOR_PARAMS, TRAILING_STOP_PERCENTAGE, ATR_STOP_MULTIPLIER, EXIT_COMPACT_FRACTION,
+                    EXIT_LATENCY_HISTORY)
+
+Exit = namedtuple('Exit', ['position_id', 'symbol', 'reason', 'price', 'level', 'timestamp'])
+
+class _TrailingBook:
+    """Stops móveis: stop = máxima desde a entrada - distância, com a distância fixa por posição
+
+    Posições cuja máxima ficou abaixo do preço atual passam a compartilhar a mesma máxima, então
+    são fundidas em um grupo (a menor fila entra na maior). Cada grupo guarda as distâncias em um
+    heap; dois heaps de grupos dão o grupo de menor máxima (fusões) e o de maior stop (disparos).
+    Em percentual, o stop é aditivo no log do preço; com ATR, no próprio preço.
+    """
+    def __init__(self, log_space=False):
+        self.transform = math.log if log_space else float
+        self.inverse = math.exp if log_space else float
+        self.groups = {}  # id -> [máxima, heap de (distância, seq, position_id), versão]
+        self.by_high = []  # (máxima, id, versão)
+        self.by_stop = []  # (-stop, id, versão)
+        self.ids = itertools.count()
+
+    def __len__(self):
+        return sum(len(group[1]) for group in self.groups.values())
+
+    def _push(self, group_id):
+        group = self.groups[group_id]
+        group[2] += 1
+        heapq.heappush(self.by_high, (group[0], group_id, group[2]))
+        heapq.heappush(self.by_stop, (-(group[0] - group[1][0][0]), group_id, group[2]))
+
+    def _valid(self, group_id, version):
+        group = self.groups.get(group_id)
+        return group is not None and group[2] == version
+
+    def add(self, position_id, price, distance, seq):
+        group_id = next(self.ids)
+        self.groups[group_id] = [self.transform(price), [(distance, seq, position_id)], 0]
+        self._push(group_id)
+
+    def on_price(self, price, is_open):
+        """Atualiza as máximas e retorna [(position_id, nível do stop)] disparados"""
+        x = self.transform(price)
+
+        # Grupos com máxima abaixo do preço passam a ter máxima = preço e viram um só
+        merged = []
+        while self.by_high and self.by_high[0][0] < x:
+            _, group_id, version = heapq.heappop(self.by_high)
+            if self._valid(group_id, version):
+                merged.append(self.groups.pop(group_id))
+        if merged:
+            merged.sort(key=lambda group: len(group[1]), reverse=True)
+            members = merged[0][1]
+            for group in merged[1:]:
+                for member in group[1]:
+                    heapq.heappush(members, member)
+            group_id = next(self.ids)
+            self.groups[group_id] = [x, members, 0]
+            self._push(group_id)
+
+        # Disparo: grupos cujo stop mais alto (máxima - menor distância) alcança o preço
+        triggered = []
+        while self.by_stop and -self.by_stop[0][0] >= x:
+            _, group_id, version = heapq.heappop(self.by_stop)
+            if not self._valid(group_id, version):
+                continue
+            high, members, _ = self.groups[group_id]
+            while members and (high - members[0][0] >= x or not is_open(members[0][2])):
+                distance, _, position_id = heapq.heappop(members)
+                if is_open(position_id):
+                    triggered.append((position_id, self.inverse(high - distance)))
+            if members:
+                self._push(group_id)
+            else:
+                del self.groups[group_id]
+        return triggered
+
+    def compact(self, is_open):
+        """Remove membros de posições encerradas e reconstrói os heaps de grupos"""
+        for group_id, group in list(self.groups.items()):
+            group[1] = [member for member in group[1] if is_open(member[2])]
+            if group[1]:
+                heapq.heapify(group[1])
+            else:
+                del self.groups[group_id]
+        self.by_high = [(group[0], group_id, group[2]) for group_id, group in self.groups.items()]
+        self.by_stop = [(-(group[0] - group[1][0][0]), group_id, group[2]) for group_id, group in self.groups.items()]
+        heapq.heapify(self.by_high)
+        heapq.heapify(self.by_stop)
+
+class _SymbolBook:
+    def __init__(self):
+        self.stops = []  # (-nível, seq, position_id, motivo): dispara com preço <= nível
+        self.targets = []  # (nível, seq, position_id, motivo): dispara com preço >= nível
+        self.deadlines = []  # (timestamp, seq, position_id)
+        self.trailing_pct = _TrailingBook(log_space=True)
+        self.trailing_atr = _TrailingBook()
+        self.live = 0  # Entradas de posições abertas
+        self.dead = 0  # Entradas de posições encerradas desde a última compactação
+
+    def compact(self, is_open):
+        """Reconstrói os heaps só com as entradas de posições abertas"""
+        for name in ('stops', 'targets', 'deadlines'):
+            heap = [entry for entry in getattr(self, name) if is_open(entry[2])]
+            heapq.heapify(heap)
+            setattr(self, name, heap)
+        self.trailing_pct.compact(is_open)
+        self.trailing_atr.compact(is_open)
+        self.dead = 0
+
+class ExitEngine:
+    """Saídas no cliente avaliadas a cada tick: stop/alvo fixos, stops móveis (percentual ou ATR) e tempo
+
+    Os níveis ficam em heaps por símbolo, então um tick custa O(log n) mais as saídas disparadas,
+    sem percorrer todas as posições abertas. Posições encerradas são descartadas de forma preguiçosa;
+    quando suas entradas passam de compact_fraction do heap, os heaps do símbolo são reconstruídos.
+    """
+    def __init__(self, on_exit=None, compact_fraction=EXIT_COMPACT_FRACTION, latency_history=EXIT_LATENCY_HISTORY):
+        self.on_exit = on_exit
+        self.compact_fraction = compact_fraction
+        self.books = {}
+        self.positions = {}  # position_id -> símbolo
+        self.entries = {}  # position_id -> entradas nos heaps do símbolo
+        self.seq = itertools.count()
+        # Segundos entre a chegada do tick e o despacho das saídas mais recentes (limitado no processo ao vivo)
+        self.latencies = deque(maxlen=latency_history)
+
+    def open_position(self, position_id, entry_price, symbol=SYMBOL, timestamp=None, stop_loss=None,
+                      take_profit=None, trailing_pct=None, atr=None, atr_multiplier=ATR_STOP_MULTIPLIER,
+                      atr_trailing=True, max_holding=None, high=None):
+        """Registra uma posição; níveis são preços absolutos, max_holding na unidade dos timestamps
+
+        high é a máxima já vista desde a entrada, para posições registradas depois dela (ex.: após
+        reiniciar o processo); os stops móveis partem dela em vez do preço de entrada.
+        """
+        start = entry_price if high is None else max(entry_price, high)
+        book = self.books.setdefault(symbol, _SymbolBook())
+        self.positions[position_id] = symbol
+        seq = next(self.seq)
+        if stop_loss is not None:
+            heapq.heappush(book.stops, (-stop_loss, seq, position_id, 'stop_loss'))
+        if take_profit is not None:
+            heapq.heappush(book.targets, (take_profit, seq, position_id, 'take_profit'))
+        if trailing_pct is not None:
+            book.trailing_pct.add(position_id, start, -math.log(1 - trailing_pct), seq)
+        if atr is not None:
+            if atr_trailing:
+                book.trailing_atr.add(position_id, start, atr * atr_multiplier, seq)
+            else:
+                heapq.heappush(book.stops, (-(entry_price - atr * atr_multiplier), seq, position_id, 'atr_stop'))
+        if max_holding is not None:
+            heapq.heappush(book.deadlines, (timestamp + max_holding, seq, position_id))
+        entries = sum(level is not None for level in (stop_loss, take_profit, trailing_pct, atr, max_holding))
+        self.entries[position_id] = entries
+        book.live += entries
+
+    def close_position(self, position_id):
+        """Encerra a posição por fora (ex.: venda pelo modelo); os níveis somem de forma preguiçosa"""
+        self._retire(position_id)
+
+    def _retire(self, position_id):
+        """Tira a posição das abertas; retorna False se ela já estava encerrada"""
+        symbol = self.positions.pop(position_id, None)
+        if symbol is None:
+            return False
+        book = self.books[symbol]
+        entries = self.entries.pop(position_id)
+        book.live -= entries
+        book.dead += entries
+        if book.dead > self.compact_fraction * (book.live + book.dead):
+            book.compact(self._is_open)
+        return True
+
+    def _is_open(self, position_id):
+        return position_id in self.positions
+
+    def on_tick(self, price, symbol=SYMBOL, timestamp=None):
+        """Avalia um tick e despacha as saídas disparadas; retorna a lista de Exit"""
+        received = time.perf_counter()
+        book = self.books.get(symbol)
+        if book is None:
+            return []
+
+        triggered = []
+        while book.stops and -book.stops[0][0] >= price:
+            level, _, position_id, reason = heapq.heappop(book.stops)
+            triggered.append((position_id, reason, -level))
+        for position_id, level in book.trailing_pct.on_price(price, self._is_open):
+            triggered.append((position_id, 'trailing_stop', level))
+        for position_id, level in book.trailing_atr.on_price(price, self._is_open):
+            triggered.append((position_id, 'atr_stop', level))
+        while book.targets and book.targets[0][0] <= price:
+            level, _, position_id, reason = heapq.heappop(book.targets)
+            triggered.append((position_id, reason, level))
+        while timestamp is not None and book.deadlines and book.deadlines[0][0] <= timestamp:
+            deadline, _, position_id = heapq.heappop(book.deadlines)
+            triggered.append((position_id, 'time', deadline))
+
+        exits = []
+        for position_id, reason, level in triggered:
+            # A primeira saída de cada posição vale; as demais entradas dela são descartadas
+            if not self._retire(position_id):
+                continue
+            exit = Exit(position_id, symbol, reason, price, level, timestamp)
+            if self.on_exit is not None:
+                self.on_exit(exit)
+            self.latencies.append(time.perf_counter() - received)
+            exits.append(exit)
+        return exits
+
+    def run(self, ticks, symbol=SYMBOL):
+        """Processa um fluxo de engine.Tick (ex.: ReplayFeed de ticks gravados)"""
+        exits = []
+        for tick in ticks:
+            exits.extend(self.on_tick(tick.price, symbol, tick.timestamp))
+        return exits
+
+def atr_from_candles(collector, df, period=INDICATOR_PARAMS['atr_period']):
+    """ATR mais recente, calculado com o mesmo calculate_atr dos indicadores"""
+    return float(collector.calculate_atr(df, period=period).iloc[-1])
+
+def trader_exit_handler(trader):
+    """Callback que encerra a posição do Trader (cancelando as ordens de proteção) ao disparar uma saída"""
+    def on_exit(exit):
+        print(f"Saída {exit.reason} disparada a {exit.price:.2f} (nível {exit.level:.2f})")
+        trader.place_sell_order()
+    return on_exit
+
+def benchmark(n_positions=10000, n_ticks=100000, seed=0, trailing_pct=TRAILING_STOP_PERCENTAGE):
+    """Mede a vazão e a latência de despacho sobre um passeio aleatório de ticks"""
+    rng = np.random.default_rng(seed)
+    prices = 30000 * np.exp(np.cumsum(rng.normal(0, 2e-4, n_ticks)))
+    entry_ticks = np.sort(rng.integers(0, n_ticks // 2, n_positions))
+    engine = ExitEngine(latency_history=n_positions)  # Todas as saídas entram nos percentis
+
+    start = time.perf_counter()
+    entry = 0
+    exits = 0
+    for i in range(n_ticks):
+        price = float(prices[i])
+        while entry < n_positions and entry_ticks[entry] == i:
+            kind = entry % 3
+            engine.open_position(entry, price, timestamp=i,
+                                 stop_loss=price * 0.98 if kind == 0 else None,
+                                 take_profit=price * 1.03 if kind == 0 else None,
+                                 trailing_pct=trailing_pct if kind == 1 else None,
+                                 atr=price * 0.005 if kind == 2 else None, max_holding=n_ticks // 4)
+            entry += 1
+        exits += len(engine.on_tick(price, timestamp=i))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(engine.latencies) * 1000
+    return {
+        'positions': n_positions,
+        'ticks': n_ticks,
+        'exits': exits,
+        'ticks_per_second': n_ticks / elapsed,
+        'dispatch_p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+        'dispatch_p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+    }
+
+if __name__ == "__main__":
+    result = benchmark()
+    print("\n=== Benchmark do motor de saídas ===")
+    print(f"{result['positions']} posições, {result['ticks']} ticks, {result['exits']} saídas")
+    print(f"Vazão: {result['ticks_per_second']:,.0f} ticks/s")
+    print(f"Despacho: p50 {result['dispatch_p50_ms']:.3f} ms | p99 {result['dispatch_p99_ms']:.3f} ms")
@@ -0,0 +1,183 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+from data_collector import DataCollector
+from config import (SYMBOL, INDICATOR_PARAMS, FEATURE_STORE_DIR, FEATURE_STORE_VERSION,
+                    FEATURE_STORE_EMA_TOLERANCE)
+
+OHLCV_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+EMA_PARAMS = ('macd_fast', 'macd_slow', 'macd_signal')
+NON_WINDOW_PARAMS = ('bollinger_std',)
+
+def warmup_bars(params=INDICATOR_PARAMS, tolerance=FEATURE_STORE_EMA_TOLERANCE):
+    """Histórico que precisa ser recalculado antes das linhas novas para reproduzir o cálculo completo"""
+    # Janelas móveis: a maior delas, mais um candle de diff/shift/pct_change
+    windows = max(value for key, value in params.items() if key not in EMA_PARAMS + NON_WINDOW_PARAMS) + 1
+
+    # EMAs não têm janela finita: candles até o peso do histórico ignorado ficar abaixo da tolerância
+    def ema_bars(span):
+        return int(np.ceil(np.log(tolerance) / np.log(1 - 2 / (span + 1))))
+
+    # A linha de sinal é uma EMA do MACD, então as duas convergências se somam
+    macd = ema_bars(max(params['macd_fast'], params['macd_slow'])) + ema_bars(params['macd_signal'])
+    return max(windows, macd)
+
+class FeatureStore:
+    def __init__(self, root=FEATURE_STORE_DIR, indicator_params=INDICATOR_PARAMS, collector=None,
+                 warmup=None):
+        self.root = root
+        self.indicator_params = dict(indicator_params)
+        self.collector = collector or DataCollector()
+        self.warmup_bars = warmup or warmup_bars(self.indicator_params)
+        self.config_hash = self._config_hash()
+
+    def _config_hash(self):
+        """Gera o hash da configuração dos indicadores (muda quando os parâmetros mudam)"""
+        payload = json.dumps({'version': FEATURE_STORE_VERSION, 'params': self.indicator_params},
+                             sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+    def _series_dir(self, symbol, timeframe):
+        return os.path.join(self.root, f"{symbol.replace('/', '')}_{timeframe}")
+
+    def _path(self, symbol, timeframe):
+        return os.path.join(self._series_dir(symbol, timeframe), self.config_hash)
+
+    def _read_meta(self, path):
+        meta_path = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            return json.load(f)
+
+    def _write_meta(self, path, meta):
+        # Escrita atômica: o número de linhas em meta.json é a fonte da verdade
+        tmp_path = os.path.join(path, 'meta.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(path, 'meta.json'))
+
+    def _invalidate_stale(self, symbol, timeframe):
+        """Remove matrizes calculadas com outra configuração de indicadores"""
+        series_dir = self._series_dir(symbol, timeframe)
+        if not os.path.isdir(series_dir):
+            return
+        for entry in os.listdir(series_dir):
+            if entry != self.config_hash:
+                shutil.rmtree(os.path.join(series_dir, entry), ignore_errors=True)
+
+    def load(self, symbol=SYMBOL, timeframe='1d'):
+        """Retorna (timestamps, features, colunas) como arrays mapeados em memória"""
+        path = self._path(symbol, timeframe)
+        meta = self._read_meta(path)
+        if meta is None or meta['rows'] == 0:
+            return None
+
+        rows, columns = meta['rows'], meta['columns']
+        timestamps = np.memmap(os.path.join(path, 'timestamps.bin'), dtype=np.int64, mode='r',
+                               shape=(rows,))
+        features = np.memmap(os.path.join(path, 'features.bin'), dtype=np.float64, mode='r',
+                             shape=(rows, len(columns)))
+        return timestamps, features, columns
+
+    def get_dataframe(self, symbol=SYMBOL, timeframe='1d', start=None, end=None):
+        """Retorna as features armazenadas no mesmo formato de calculate_indicators"""
+        loaded = self.load(symbol, timeframe)
+        if loaded is None:
+            return None
+        timestamps, features, columns = loaded
+
+        # Timestamps são crescentes: o recorte por período é uma busca binária
+        first = 0 if start is None else np.searchsorted(timestamps, start, side='left')
+        last = len(timestamps) if end is None else np.searchsorted(timestamps, end, side='right')
+
+        df = pd.DataFrame(np.asarray(features[first:last]), columns=columns)
+        df.insert(0, 'timestamp', pd.to_datetime(np.asarray(timestamps[first:last]), unit='ns'))
+        return df
+
+    def update(self, df, symbol=SYMBOL, timeframe='1d'):
+        """Acrescenta ao cache apenas os candles novos e retorna as features do período de df"""
+        self._invalidate_stale(symbol, timeframe)
+        path = self._path(symbol, timeframe)
+        os.makedirs(path, exist_ok=True)
+
+        meta = self._read_meta(path)
+        raw = df[['timestamp'] + OHLCV_COLUMNS].sort_values('timestamp').reset_index(drop=True)
+        new_timestamps = raw['timestamp'].values.astype('datetime64[ns]').astype(np.int64)
+
+        stored_rows = meta['rows'] if meta is not None else 0
+        if stored_rows > 0:
+            timestamps, features, columns = self.load(symbol, timeframe)
+            # O último candle armazenado pode estar incompleto: se ele veio de novo, é recalculado
+            if timestamps[stored_rows - 1] in new_timestamps:
+                stored_rows -= 1
+
+        if stored_rows > 0 and new_timestamps[0] < timestamps[0]:
+            # Histórico anterior ao cache: recalcula tudo a partir de df, mantendo os candles
+            # armazenados depois do fim de df quando eles continuam a série sem lacuna
+            later = np.flatnonzero(np.asarray(timestamps[:stored_rows]) > new_timestamps[-1])
+            if len(later) and timestamps[later[0]] - new_timestamps[-1] <= pd.Timedelta(timeframe).value:
+                kept = slice(later[0], stored_rows)
+                ohlcv_idx = [columns.index(c) for c in OHLCV_COLUMNS]
+                cached = pd.DataFrame(np.asarray(features[kept][:, ohlcv_idx]), columns=OHLCV_COLUMNS)
+                cached.insert(0, 'timestamp', pd.to_datetime(np.asarray(timestamps[kept]), unit='ns'))
+                raw = pd.concat([raw, cached], ignore_index=True)
+            print(f"Candles anteriores ao início do feature store ({pd.Timestamp(int(timestamps[0]))}); "
+                  f"recalculando a partir dos dados recebidos")
+            stored_rows = 0
+
+        if stored_rows > 0:
+            new_mask = new_timestamps > timestamps[stored_rows - 1]
+            if not new_mask.any():
+                return self.get_dataframe(symbol, timeframe, new_timestamps[0], new_timestamps[-1])
+
+            # Candles faltando entre o cache e os dados novos: as janelas cruzariam o buraco
+            steps = np.diff(np.concatenate([[timestamps[stored_rows - 1]], new_timestamps[new_mask]]))
+            if (steps > pd.Timedelta(timeframe).value).any():
+                print(f"Lacuna nos candles após {pd.Timestamp(int(timestamps[stored_rows - 1]))}; "
+                      f"recalculando o feature store a partir dos dados recebidos")
+                stored_rows = 0
+
+        if stored_rows > 0:
+
+            warmup_start = max(0, stored_rows - self.warmup_bars)
+            ohlcv_idx = [columns.index(c) for c in OHLCV_COLUMNS]
+            history = pd.DataFrame(np.asarray(features[warmup_start:stored_rows][:, ohlcv_idx]),
+                                   columns=OHLCV_COLUMNS)
+            history.insert(0, 'timestamp', pd.to_datetime(np.asarray(timestamps[warmup_start:stored_rows]),
+                                                          unit='ns'))
+            frame = pd.concat([history, raw[new_mask]], ignore_index=True)
+            skip = stored_rows - warmup_start
+        else:
+            frame = raw
+            skip = 0
+
+        frame = self.collector.calculate_indicators(frame.copy(), self.indicator_params)
+        columns = [c for c in frame.columns if c != 'timestamp']
+        appended = frame.iloc[skip:]
+        values = appended[columns].to_numpy(dtype=np.float64)
+        appended_timestamps = appended['timestamp'].values.astype('datetime64[ns]').astype(np.int64)
+
+        # Descarta bytes além do que meta.json confirma (escrita interrompida ou candle provisório)
+        for name, row_bytes in (('timestamps.bin', 8), ('features.bin', 8 * len(columns))):
+            file_path = os.path.join(path, name)
+            with open(file_path, 'ab') as f:
+                f.truncate(stored_rows * row_bytes)
+                f.write((appended_timestamps if name == 'timestamps.bin' else values).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+        self._write_meta(path, {
+            'symbol': symbol,
+            'timeframe': timeframe,
+            'config_hash': self.config_hash,
+            'indicator_params': self.indicator_params,
+            'columns': columns,
+            'rows': stored_rows + len(values),
+        })
+        return self.get_dataframe(symbol, timeframe, new_timestamps[0], new_timestamps[-1])
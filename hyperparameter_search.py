@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import sqlite3
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from config import HPO_DB_PATH, HPO_TRIALS, HPO_RUNGS, HPO_MIN_TRIALS_FOR_PRUNING, HPO_SEARCH_SPACE
+
+class SearchStore:
+    """Persistência dos trials em SQLite, compartilhada entre os processos da busca"""
+    def __init__(self, path=HPO_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS trials (
+                trial_id INTEGER PRIMARY KEY, params TEXT NOT NULL, status TEXT NOT NULL,
+                value REAL, accuracy REAL, rung INTEGER, updated_at REAL)""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS reports (
+                trial_id INTEGER, rung INTEGER, value REAL, PRIMARY KEY (trial_id, rung))""")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def add_trial(self, trial_id, params):
+        with self._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO trials (trial_id, params, status, updated_at) "
+                         "VALUES (?, ?, 'pending', ?)", (trial_id, json.dumps(params), time.time()))
+
+    def unfinished(self):
+        """Trials pendentes ou interrompidos no meio (status 'running' de uma execução anterior)"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT trial_id, params FROM trials "
+                                "WHERE status IN ('pending', 'running') ORDER BY trial_id").fetchall()
+        return [(trial_id, json.loads(params)) for trial_id, params in rows]
+
+    def set_status(self, trial_id, status, value=None, accuracy=None, rung=None):
+        with self._connect() as conn:
+            conn.execute("UPDATE trials SET status = ?, value = ?, accuracy = ?, rung = ?, updated_at = ? "
+                         "WHERE trial_id = ?", (status, value, accuracy, rung, time.time(), trial_id))
+
+    def report(self, trial_id, rung, value):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO reports VALUES (?, ?, ?)", (trial_id, rung, value))
+
+    def should_prune(self, trial_id, rung, value, min_trials=HPO_MIN_TRIALS_FOR_PRUNING):
+        """Poda pela mediana: interrompe se a perda ficou acima da mediana dos outros trials no mesmo ponto"""
+        with self._connect() as conn:
+            values = [v for (v,) in conn.execute("SELECT value FROM reports WHERE rung = ? AND trial_id != ?",
+                                                 (rung, trial_id))]
+        return len(values) >= min_trials and value > float(np.median(values))
+
+    def best(self, n=5):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT trial_id, params, value, accuracy FROM trials "
+                                "WHERE status = 'complete' ORDER BY value ASC LIMIT ?", (n,)).fetchall()
+        return [{'trial_id': t, 'params': json.loads(p), 'val_loss': v, 'val_accuracy': a}
+                for t, p, v, a in rows]
+
+def sample_params(rng, space=HPO_SEARCH_SPACE):
+    """Sorteia uma configuração do espaço de busca"""
+    feature_set = str(rng.choice(sorted(space['features'])))
+    return {
+        'units': int(rng.choice(space['units'])),
+        'depth': int(rng.choice(space['depth'])),
+        'dropout': float(rng.choice(space['dropout'])),
+        'dense_units': int(rng.choice(space['dense_units'])),
+        'lookback': int(rng.choice(space['lookback'])),
+        'batch_size': int(rng.choice(space['batch_size'])),
+        'feature_set': feature_set,
+        'features': list(space['features'][feature_set]),
+    }
+
+def _init_worker(threads):
+    """Limita as threads do TensorFlow em cada processo para não disputar os núcleos"""
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+def run_trial(db_path, trial_id, params, df, rungs, min_trials, validation_fraction=0.2):
+    """Treina um trial em etapas, registrando a perda de validação e podando cedo"""
+    from model import TradingModel
+
+    store = SearchStore(db_path)
+    store.set_status(trial_id, 'running')
+    model = TradingModel(units=[params['units']] * params['depth'], dropout=params['dropout'],
+                         dense_units=params['dense_units'], lookback=params['lookback'],
+                         features=params['features'])
+
+    X, y = model.prepare_data(df)
+    valid = ~np.isnan(X).any(axis=(1, 2)) if len(X) else np.array([], dtype=bool)
+    X, y = X[valid], y[valid]
+    n_validation = int(len(X) * validation_fraction)
+    if n_validation == 0 or len(X) - n_validation == 0:
+        store.set_status(trial_id, 'failed')
+        return trial_id, 'failed', None
+
+    # Divisão temporal: as janelas mais recentes validam
+    X_train, y_train = X[:-n_validation], y[:-n_validation]
+    X_val, y_val = X[-n_validation:], y[-n_validation:]
+
+    trained_epochs = 0
+    for rung, epochs in enumerate(rungs):
+        model.model.fit(X_train, y_train, epochs=epochs, initial_epoch=trained_epochs,
+                        batch_size=params['batch_size'], verbose=0)
+        trained_epochs = epochs
+        val_loss, val_accuracy = model.model.evaluate(X_val, y_val, verbose=0)
+        store.report(trial_id, rung, val_loss)
+
+        if rung < len(rungs) - 1 and store.should_prune(trial_id, rung, val_loss, min_trials):
+            store.set_status(trial_id, 'pruned', val_loss, val_accuracy, rung)
+            return trial_id, 'pruned', val_loss
+
+    store.set_status(trial_id, 'complete', val_loss, val_accuracy, len(rungs) - 1)
+    return trial_id, 'complete', val_loss
+
+class HyperparameterSearch:
+    def __init__(self, df, n_trials=HPO_TRIALS, workers=None, threads_per_worker=None, db_path=HPO_DB_PATH,
+                 seed=42, rungs=HPO_RUNGS, min_trials=HPO_MIN_TRIALS_FOR_PRUNING, space=HPO_SEARCH_SPACE):
+        self.df = df
+        self.n_trials = n_trials
+        self.workers = workers or os.cpu_count() or 1
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // self.workers)
+        self.db_path = db_path
+        self.seed = seed
+        self.rungs = rungs
+        self.min_trials = min_trials
+        self.space = space
+        self.store = SearchStore(db_path)
+
+    def enqueue(self):
+        """Registra os trials e retorna os que ainda precisam rodar"""
+        # Os parâmetros de cada trial derivam da semente, então a retomada gera os mesmos trials
+        rng = np.random.default_rng(self.seed)
+        for trial_id in range(self.n_trials):
+            self.store.add_trial(trial_id, sample_params(rng, self.space))
+        return self.store.unfinished()
+
+    def run(self):
+        """Executa (ou retoma) a busca; trials concluídos ou podados não são refeitos"""
+        pending = self.enqueue()
+        print(f"Busca de hiperparâmetros: {len(pending)} trials pendentes de {self.n_trials}")
+
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(self.threads_per_worker,)) as executor:
+            futures = [executor.submit(run_trial, self.db_path, trial_id, params, self.df, self.rungs,
+                                       self.min_trials)
+                       for trial_id, params in pending]
+            for (trial_id, _), future in zip(pending, futures):
+                try:
+                    _, status, value = future.result()
+                except Exception as e:
+                    print(f"Erro no trial {trial_id}: {e}")
+                    self.store.set_status(trial_id, 'failed')
+                    continue
+                value_text = f"{value:.4f}" if value is not None else '-'
+                print(f"Trial {trial_id}: {status} (val_loss {value_text})")
+
+        return self.store.best()
+
+if __name__ == "__main__":
+    from data_collector import DataCollector
+    from feature_store import FeatureStore
+
+    collector = DataCollector()
+    df = FeatureStore(collector=collector).update(collector.fetch_ohlcv_data())
+    best = HyperparameterSearch(df).run()
+
+    print("\n=== Melhores configurações ===")
+    for trial in best:
+        print(f"Trial {trial['trial_id']}: val_loss {trial['val_loss']:.4f} | "
+              f"val_accuracy {trial['val_accuracy']:.4f} | {trial['params']}")
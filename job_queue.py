@@ -0,0 +1,321 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import hashlib
+import argparse
+import itertools
+import threading
+import multiprocessing
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from config import (JOBS_DB_PATH, JOB_LEASE_SECONDS, JOB_HEARTBEAT_SECONDS, JOB_MAX_ATTEMPTS, JOB_POLL_SECONDS,
+                    FEATURE_STORE_DIR, SYMBOL)
+
+Job = namedtuple('Job', ['job_id', 'kind', 'payload', 'attempt'])
+
+def job_key(kind, payload):
+    """Identificador determinístico: reenviar o mesmo job não cria uma duplicata"""
+    return hashlib.sha256(f"{kind}|{json.dumps(payload, sort_keys=True)}".encode()).hexdigest()[:16]
+
+class JobQueue:
+    """Fila de jobs em SQLite, compartilhada por workers em qualquer número de processos ou máquinas
+
+    Cada job é reservado com um lease renovado por heartbeat; se o worker morrer, o lease expira e
+    o job volta para a fila. Em várias máquinas, o arquivo deve ficar em um armazenamento
+    compartilhado com lock de arquivos confiável.
+    """
+    def __init__(self, path=JOBS_DB_PATH, lease_seconds=JOB_LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0, max_attempts INTEGER NOT NULL, worker TEXT,
+                lease_until REAL, created_at REAL, started_at REAL, finished_at REAL, result TEXT, error TEXT)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, lease_until)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=60)
+
+    def submit(self, kind, payloads, max_attempts=JOB_MAX_ATTEMPTS):
+        """Enfileira payloads (um dict ou uma lista) numa única transação; retorna os job_ids"""
+        payloads = [payloads] if isinstance(payloads, dict) else list(payloads)
+        now = time.time()
+        rows = [(job_key(kind, p), kind, json.dumps(p, sort_keys=True), 'pending', max_attempts, now)
+                for p in payloads]
+        with self._connect() as conn:
+            conn.executemany("INSERT OR IGNORE INTO jobs (job_id, kind, payload, status, max_attempts, created_at) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", rows)
+        return [row[0] for row in rows]
+
+    def claim(self, worker_id):
+        """Reserva o próximo job pendente (ou com lease expirado); None se não houver"""
+        now = time.time()
+        conn = self._connect()
+        conn.isolation_level = None
+        try:
+            # BEGIN IMMEDIATE: só um worker por vez escolhe e marca o job
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("UPDATE jobs SET status = 'failed', error = 'lease expirado após a última tentativa' "
+                         "WHERE status = 'running' AND lease_until < ? AND attempts >= max_attempts", (now,))
+            row = conn.execute("SELECT job_id, kind, payload, attempts FROM jobs "
+                               "WHERE status = 'pending' OR (status = 'running' AND lease_until < ?) "
+                               "ORDER BY created_at, job_id LIMIT 1", (now,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, "
+                             "lease_until = ?, started_at = ? WHERE job_id = ?",
+                             (worker_id, now + self.lease_seconds, now, row[0]))
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        if row is None:
+            return None
+        job_id, kind, payload, attempts = row
+        return Job(job_id, kind, json.loads(payload), attempts + 1)
+
+    def heartbeat(self, job_id, worker_id):
+        """Renova o lease; False se o job já não pertence a este worker"""
+        with self._connect() as conn:
+            cursor = conn.execute("UPDATE jobs SET lease_until = ? WHERE job_id = ? AND worker = ? "
+                                  "AND status = 'running'", (time.time() + self.lease_seconds, job_id, worker_id))
+        return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id, result):
+        """Grava o resultado; só a primeira conclusão vale (reexecuções não duplicam resultados)"""
+        with self._connect() as conn:
+            cursor = conn.execute("UPDATE jobs SET status = 'done', worker = ?, result = ?, finished_at = ?, "
+                                  "error = NULL WHERE job_id = ? AND status != 'done'",
+                                  (worker_id, json.dumps(result), time.time(), job_id))
+        return cursor.rowcount == 1
+
+    def fail(self, job_id, worker_id, error):
+        """Devolve o job à fila, ou o marca como falho se as tentativas acabaram"""
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN 'failed' "
+                         "ELSE 'pending' END, error = ?, lease_until = NULL "
+                         "WHERE job_id = ? AND worker = ? AND status = 'running'", (error, job_id, worker_id))
+
+    def counts(self):
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def has_unfinished(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM jobs WHERE status IN ('pending', 'running') LIMIT 1").fetchone() is not None
+
+    def results(self, kind=None):
+        """DataFrame com os parâmetros e o resultado de cada job concluído"""
+        sql = "SELECT job_id, kind, payload, result, worker, started_at, finished_at FROM jobs WHERE status = 'done'"
+        values = ()
+        if kind is not None:
+            sql += " AND kind = ?"
+            values = (kind,)
+        with self._connect() as conn:
+            rows = conn.execute(sql, values).fetchall()
+        return pd.DataFrame([{'job_id': job_id, 'kind': k, **json.loads(payload), **json.loads(result),
+                              'worker': worker, 'started_at': started, 'finished_at': finished}
+                             for job_id, k, payload, result, worker, started, finished in rows])
+
+# Tarefas executáveis pelos workers: nome -> função(payload, data_root) que retorna um dict serializável
+TASKS = {}
+
+def task(name):
+    def register(function):
+        TASKS[name] = function
+        return function
+    return register
+
+_features = {}
+
+def load_features(data_root, symbol=SYMBOL, timeframe='1d'):
+    """Features do feature store compartilhado, lidas uma vez por processo worker"""
+    key = (data_root, symbol, timeframe)
+    if key not in _features:
+        from feature_store import FeatureStore
+        df = FeatureStore(root=data_root).get_dataframe(symbol, timeframe)
+        if df is None:
+            raise ValueError(f"Feature store sem dados para {symbol} {timeframe} em {data_root}")
+        _features[key] = df
+    return _features[key]
+
+def _period(df, payload):
+    mask = np.ones(len(df), dtype=bool)
+    if payload.get('start'):
+        mask &= (df['timestamp'] >= pd.Timestamp(payload['start'])).values
+    if payload.get('end'):
+        mask &= (df['timestamp'] < pd.Timestamp(payload['end'])).values
+    return df[mask].reset_index(drop=True)
+
+@task('sleep')
+def sleep_task(payload, data_root):
+    """Tarefa de espera, usada para medir a vazão da fila"""
+    time.sleep(payload['seconds'])
+    return {'slept': payload['seconds']}
+
+@task('signal_sweep')
+def signal_sweep_task(payload, data_root):
+    """Avalia uma combinação de parâmetros de analyze_signals sobre as features compartilhadas"""
+    from test_strategy import StrategyTester
+    df = _period(load_features(data_root, payload.get('symbol', SYMBOL), payload.get('timeframe', '1d')), payload)
+    params = {k: payload[k] for k in ('rsi_oversold', 'rsi_overbought', 'volume_increase',
+                                      'min_buy_conditions', 'min_sell_conditions') if k in payload}
+    signal = StrategyTester.generate_signals(df.copy(), **params)['signal'].values
+
+    # Sinais alternam a partir da compra: entradas e saídas formam pares em ordem
+    close = df['close'].values
+    exits = np.flatnonzero(signal == -1)
+    entries = np.flatnonzero(signal == 1)[:len(exits)]
+    returns = close[exits] / close[entries] - 1
+    return {
+        'trades': int(len(returns)),
+        'total_return': float(np.prod(1 + returns) - 1),
+        'win_rate': float((returns > 0).mean()) if len(returns) else 0.0,
+        'average_return': float(returns.mean()) if len(returns) else 0.0,
+    }
+
+@task('walk_forward_fold')
+def walk_forward_task(payload, data_root):
+    """Treina o modelo em [train_start, train_end) e avalia em [train_end, test_end)"""
+    import tensorflow as tf
+    from model import TradingModel
+    from labeling import make_labels
+    tf.keras.utils.set_random_seed(payload.get('seed', 42))
+
+    df = load_features(data_root, payload.get('symbol', SYMBOL), payload.get('timeframe', '1d'))
+    model = TradingModel(**{k: payload[k] for k in ('units', 'dropout', 'dense_units', 'lookback', 'features',
+                                                     'target') if k in payload})
+    train = _period(df, {'start': payload.get('train_start'), 'end': payload['train_end']})
+    X_train, y_train = model.prepare_data(train)
+    model.model.fit(X_train, y_train, epochs=payload.get('epochs', 20), batch_size=payload.get('batch_size', 32),
+                    verbose=0)
+
+    # Janelas de teste com o scaler do treino; o histórico anterior completa a primeira janela
+    test = _period(df, {'start': payload['train_end'], 'end': payload['test_end']})
+    history = train.tail(model.lookback)
+    frame = pd.concat([history, test], ignore_index=True)
+    data = model.scaler.transform(frame[model.features].values)
+    labels = make_labels(frame, model.target)
+    targets = [t for t in range(len(history), len(frame))
+               if not np.isnan(labels[t - 1]) and not np.isnan(data[t - model.lookback:t]).any()]
+    if not targets:
+        return {'train_windows': int(len(X_train)), 'test_windows': 0, 'loss': None, 'accuracy': None}
+    X_test = np.stack([data[t - model.lookback:t] for t in targets])
+    y_test = labels[np.array(targets) - 1].astype(int)
+    loss, accuracy = model.model.evaluate(X_test, y_test, verbose=0)
+    return {'train_windows': int(len(X_train)), 'test_windows': len(targets), 'loss': float(loss),
+            'accuracy': float(accuracy)}
+
+class Worker:
+    def __init__(self, queue, data_root=FEATURE_STORE_DIR, worker_id=None, heartbeat_seconds=JOB_HEARTBEAT_SECONDS,
+                 poll_seconds=JOB_POLL_SECONDS):
+        self.queue = queue
+        self.data_root = data_root
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.heartbeat_seconds = heartbeat_seconds
+        self.poll_seconds = poll_seconds
+
+    def run(self, max_jobs=None, exit_when_idle=True):
+        """Processa jobs até a fila esvaziar (ou max_jobs); retorna quantos executou"""
+        executed = 0
+        while max_jobs is None or executed < max_jobs:
+            job = self.queue.claim(self.worker_id)
+            if job is None:
+                # Jobs 'running' de outros workers ainda podem voltar à fila se o lease expirar
+                if exit_when_idle and not self.queue.has_unfinished():
+                    break
+                time.sleep(self.poll_seconds)
+                continue
+            self.execute(job)
+            executed += 1
+        return executed
+
+    def execute(self, job):
+        stop = threading.Event()
+        beat = threading.Thread(target=self._heartbeat, args=(job.job_id, stop), daemon=True)
+        beat.start()
+        try:
+            result = TASKS[job.kind](job.payload, self.data_root)
+        except Exception as e:
+            print(f"Erro no job {job.job_id} ({job.kind}, tentativa {job.attempt}): {e}")
+            self.queue.fail(job.job_id, self.worker_id, f"{type(e).__name__}: {e}")
+        else:
+            self.queue.complete(job.job_id, self.worker_id, result)
+        finally:
+            stop.set()
+            beat.join()
+
+    def _heartbeat(self, job_id, stop):
+        while not stop.wait(self.heartbeat_seconds):
+            if not self.queue.heartbeat(job_id, self.worker_id):
+                break  # Lease perdido: outro worker pode ter assumido o job
+
+def _worker_main(db_path, data_root, lease_seconds, heartbeat_seconds, poll_seconds):
+    Worker(JobQueue(db_path, lease_seconds), data_root, heartbeat_seconds=heartbeat_seconds,
+           poll_seconds=poll_seconds).run()
+
+def run_local(db_path=JOBS_DB_PATH, workers=None, data_root=FEATURE_STORE_DIR, lease_seconds=JOB_LEASE_SECONDS,
+              heartbeat_seconds=JOB_HEARTBEAT_SECONDS, poll_seconds=JOB_POLL_SECONDS):
+    """Roda workers em processos locais, no lugar de máquinas, até a fila esvaziar"""
+    workers = workers or os.cpu_count() or 1
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=_worker_main,
+                                 args=(db_path, data_root, lease_seconds, heartbeat_seconds, poll_seconds))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return JobQueue(db_path, lease_seconds).counts()
+
+def expand_grid(grid):
+    """Produto cartesiano de {parâmetro: [valores]} em uma lista de payloads"""
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+def walk_forward_payloads(timestamps, n_folds=5, train_bars=365, test_bars=30, **params):
+    """Folds consecutivos: cada um treina em train_bars candles e testa nos test_bars seguintes"""
+    timestamps = pd.to_datetime(pd.Series(timestamps)).reset_index(drop=True)
+    payloads = []
+    for fold in range(n_folds):
+        end = len(timestamps) - (n_folds - 1 - fold) * test_bars
+        train_end, start = end - test_bars, end - test_bars - train_bars
+        if start < 0:
+            continue
+        payloads.append({'fold': fold, 'train_start': str(timestamps[start]), 'train_end': str(timestamps[train_end]),
+                         'test_end': str(timestamps[end - 1] + pd.Timedelta(1, 'ns')), **params})
+    return payloads
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fila de jobs para varreduras e walk-forward")
+    parser.add_argument('command', choices=['worker', 'local', 'sweep', 'walk-forward', 'status'])
+    parser.add_argument('--db', default=JOBS_DB_PATH)
+    parser.add_argument('--data', default=FEATURE_STORE_DIR)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    queue = JobQueue(args.db)
+    if args.command == 'worker':
+        print(f"Jobs executados: {Worker(queue, args.data).run(exit_when_idle=False)}")
+    elif args.command == 'local':
+        print(run_local(args.db, args.workers, args.data))
+    elif args.command == 'sweep':
+        grid = {'rsi_oversold': [20, 25, 30, 35], 'rsi_overbought': [65, 70, 75, 80],
+                'volume_increase': [1.2, 1.5, 2.0], 'min_buy_conditions': [3, 4, 5], 'min_sell_conditions': [2, 3, 4]}
+        print(f"{len(queue.submit('signal_sweep', expand_grid(grid)))} jobs de varredura enfileirados")
+    elif args.command == 'walk-forward':
+        df = load_features(args.data)
+        print(f"{len(queue.submit('walk_forward_fold', walk_forward_payloads(df['timestamp'])))} folds enfileirados")
+    else:
+        print(queue.counts())
@@ -0,0 +1,135 @@
+import os
+import json
+import time
+from config import (JOURNAL_DIR, JOURNAL_SYNC_EVERY, JOURNAL_SYNC_INTERVAL, JOURNAL_SNAPSHOT_EVERY,
+                    JOURNAL_ORDER_PREFIX)
+
+def empty_state():
+    return {'seq': 0, 'position': None, 'orders': {}, 'pending_intent': None}
+
+def apply_record(state, record):
+    """Aplica um registro do journal ao estado (usado na escrita e na recuperação)"""
+    kind = record['kind']
+    if kind == 'intent':
+        state['pending_intent'] = {'side': record['side'], 'client_id': record['client_id']}
+    elif kind == 'order':
+        state['orders'][record['client_id']] = {
+            'role': record['role'],
+            'order_id': record.get('order_id'),
+            'status': record.get('status', 'NEW'),
+            'price': record.get('price'),
+            'ts': record.get('ts'),
+        }
+        intent = state['pending_intent']
+        if intent is not None and intent['client_id'] == record['client_id']:
+            state['pending_intent'] = None
+    elif kind == 'fill':
+        if record['client_id'] in state['orders']:
+            state['orders'][record['client_id']]['status'] = 'FILLED'
+    elif kind == 'cancel':
+        state['orders'].pop(record['client_id'], None)
+    elif kind == 'intent_failed':
+        state['pending_intent'] = None
+    elif kind == 'position':
+        state['position'] = record['position']
+    elif kind == 'reconcile':
+        state['position'] = record['position']
+        state['orders'] = record['orders']
+        state['pending_intent'] = None
+    state['seq'] = record['seq']
+    return state
+
+class PositionJournal:
+    def __init__(self, directory=JOURNAL_DIR, sync_every=JOURNAL_SYNC_EVERY,
+                 sync_interval=JOURNAL_SYNC_INTERVAL, snapshot_every=JOURNAL_SNAPSHOT_EVERY):
+        self.directory = directory
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.snapshot_every = snapshot_every
+        self.journal_path = os.path.join(directory, 'journal.log')
+        self.snapshot_path = os.path.join(directory, 'snapshot.json')
+        os.makedirs(directory, exist_ok=True)
+
+        self.state = self.recover()
+        self.file = open(self.journal_path, 'ab')
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        self.records_since_snapshot = 0
+
+    def recover(self):
+        """Reconstrói o estado a partir do snapshot mais o final do journal"""
+        state = empty_state()
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path) as f:
+                state = json.load(f)
+
+        if not os.path.exists(self.journal_path):
+            return state
+
+        valid_bytes = 0
+        with open(self.journal_path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # Linha incompleta de uma escrita interrompida
+                if not line.endswith(b'\n'):
+                    break
+                valid_bytes += len(line)
+                # Registros já incorporados ao snapshot são ignorados
+                if record['seq'] > state['seq']:
+                    apply_record(state, record)
+
+        # Descarta a cauda corrompida para que novos registros não fiquem após lixo
+        if valid_bytes < os.path.getsize(self.journal_path):
+            with open(self.journal_path, 'ab') as f:
+                f.truncate(valid_bytes)
+        return state
+
+    def record(self, kind, durable=False, **data):
+        """Acrescenta um registro; fsync em lote, ou imediato quando durable=True"""
+        record = {'seq': self.state['seq'] + 1, 'ts': time.time(), 'kind': kind, **data}
+        self.file.write(json.dumps(record, separators=(',', ':')).encode() + b'\n')
+        apply_record(self.state, record)
+        self.unsynced += 1
+        self.records_since_snapshot += 1
+
+        if (durable or self.unsynced >= self.sync_every
+                or time.monotonic() - self.last_sync >= self.sync_interval):
+            self.sync()
+        if self.records_since_snapshot >= self.snapshot_every:
+            self.snapshot()
+        return record
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def snapshot(self):
+        """Grava o estado completo de forma atômica e reinicia o journal"""
+        self.sync()
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+        # Se cair aqui, os registros antigos são ignorados pelo seq do snapshot
+        self.file.truncate(0)
+        self.sync()
+        self.records_since_snapshot = 0
+
+    def next_client_id(self, role):
+        """Gera um clientOrderId único e rastreável para a ordem"""
+        return f"{JOURNAL_ORDER_PREFIX}{self.state['seq'] + 1}-{role}"
+
+    def open_orders(self):
+        return {cid: order for cid, order in self.state['orders'].items() if order['status'] == 'NEW'}
+
+    def close(self):
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
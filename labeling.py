@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+from config import (STOP_LOSS_PERCENTAGE, TAKE_PROFIT_PERCENTAGE, TRAINING_TARGET, LABEL_MAX_HOLDING,
+                    LABEL_HORIZONS, LABEL_TARGET_HORIZON)
+
+TRAINING_TARGETS = ('direction', 'triple_barrier', 'forward_return')
+
+def _sparse_table(values, max_span, reduce):
+    """tables[k][x] = extremo de values[x:x + 2**k] (truncado no fim da série)"""
+    tables = [values]
+    n = len(values)
+    # Blocos maiores que a série nunca cabem na janela de busca
+    while (1 << len(tables)) <= min(max_span, n):
+        prev, half = tables[-1], 1 << (len(tables) - 1)
+        table = prev.copy()
+        table[:n - half] = reduce(prev[:n - half], prev[half:])
+        tables.append(table)
+    return tables
+
+def first_passage(values, levels, max_holding, side='up'):
+    """Primeiro candle j em (i, i + max_holding] em que values[j] atinge levels[i]; -1 se não houver
+
+    Busca por saltos binários sobre uma tabela esparsa de máximos/mínimos, vetorizada para todos
+    os candles: O(n log max_holding) no lugar de O(n * max_holding).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    levels = np.asarray(levels, dtype=np.float64)
+    n = len(values)
+    if n == 0:
+        return np.array([], dtype=np.int64)
+    if side == 'up':
+        tables = _sparse_table(values, max_holding, np.maximum)
+        reached = np.greater_equal
+    else:
+        tables = _sparse_table(values, max_holding, np.minimum)
+        reached = np.less_equal
+
+    # Invariante: nenhum candle em (i, pos) atinge o nível; cada salto cobre um bloco inteiro sem toque
+    pos = np.arange(1, n + 1)
+    limit = np.minimum(np.arange(n) + max_holding, n - 1)
+    for k in reversed(range(len(tables))):
+        step = 1 << k
+        block = tables[k][np.minimum(pos, n - 1)]
+        jump = (pos + step - 1 <= limit) & ~reached(block, levels)
+        pos = np.where(jump, pos + step, pos)
+
+    hit = (pos <= limit) & reached(values[np.minimum(pos, n - 1)], levels)
+    return np.where(hit, pos, -1)
+
+def triple_barrier_labels(high, low, close, take_profit=TAKE_PROFIT_PERCENTAGE, stop_loss=STOP_LOSS_PERCENTAGE,
+                          max_holding=LABEL_MAX_HOLDING):
+    """Qual barreira é tocada primeiro a partir do fechamento de cada candle
+
+    barrier: 1 take-profit, -1 stop-loss, 0 tempo esgotado, NaN se o resultado ainda não é conhecido.
+    Quando as duas barreiras caem no mesmo candle, vale o stop (a ordem intracandle é desconhecida).
+    """
+    close = np.asarray(close, dtype=np.float64)
+    n = len(close)
+    tp_index = first_passage(high, close * (1 + take_profit), max_holding, 'up')
+    sl_index = first_passage(low, close * (1 - stop_loss), max_holding, 'down')
+
+    tp_first = (tp_index >= 0) & ((sl_index < 0) | (tp_index < sl_index))
+    sl_first = (sl_index >= 0) & ~tp_first
+    timeout_index = np.arange(n) + max_holding
+    timed_out = ~tp_first & ~sl_first & (timeout_index < n)
+
+    barrier = np.full(n, np.nan)
+    barrier[tp_first], barrier[sl_first], barrier[timed_out] = 1, -1, 0
+    exit_index = np.where(tp_first, tp_index, np.where(sl_first, sl_index, np.where(timed_out, timeout_index, -1)))
+
+    realized = np.full(n, np.nan)
+    realized[tp_first], realized[sl_first] = take_profit, -stop_loss
+    realized[timed_out] = close[timeout_index[timed_out]] / close[timed_out] - 1
+    return pd.DataFrame({'barrier': barrier, 'exit_index': exit_index, 'return': realized})
+
+def forward_returns(close, horizons=LABEL_HORIZONS):
+    """Retorno de close[i] até close[i + h] para cada horizonte (NaN no fim da série)"""
+    close = np.asarray(close, dtype=np.float64)
+    result = {}
+    for h in horizons:
+        returns = np.full(len(close), np.nan)
+        if h < len(close):
+            returns[:len(close) - h] = close[h:] / close[:len(close) - h] - 1
+        result[f'forward_return_{h}'] = returns
+    return pd.DataFrame(result)
+
+def make_labels(df, target=TRAINING_TARGET, horizon=LABEL_TARGET_HORIZON, max_holding=LABEL_MAX_HOLDING):
+    """Alvo binário por candle de entrada (1 = operação favorável); NaN quando ainda não é conhecido"""
+    if target == 'direction':
+        # Alvo original: o próximo fechamento é maior que o atual
+        returns = forward_returns(df['close'].values, [1])['forward_return_1'].values
+    elif target == 'forward_return':
+        returns = forward_returns(df['close'].values, [horizon])[f'forward_return_{horizon}'].values
+    elif target == 'triple_barrier':
+        returns = triple_barrier_labels(df['high'].values, df['low'].values, df['close'].values,
+                                        max_holding=max_holding)['barrier'].values
+    else:
+        raise ValueError(f"Alvo de treino desconhecido: {target} (opções: {', '.join(TRAINING_TARGETS)})")
+    return np.where(np.isnan(returns), np.nan, (returns > 0).astype(np.float64))
@@ -0,0 +1,91 @@
+import os
+import numpy as np
+import pandas as pd
+from binance.exceptions import BinanceAPIException
+from config import SYMBOL, TEST_FIXTURE_PATH, RECORDED_FIXTURE_PATH
+
+def synthetic_ohlcv(n=1000, seed=0, start='2020-01-01', freq='D', price=30000.0):
+    """Candles sintéticos (passeio aleatório) para rodar o bot sem a Binance"""
+    rng = np.random.default_rng(seed)
+    close = price * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.01, n))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.01, n))
+    return pd.DataFrame({
+        'timestamp': pd.date_range(start, periods=n, freq=freq),
+        'open': open_, 'high': high, 'low': low, 'close': close,
+        'volume': rng.uniform(100, 1000, n),
+    })
+
+def record_fixture(path=RECORDED_FIXTURE_PATH, exchange=None, symbol=SYMBOL, timeframe='1d', limit=1000):
+    """Grava candles de uma exchange ccxt (Binance por padrão) como fixture CSV para os testes offline"""
+    if exchange is None:
+        import ccxt
+        exchange = ccxt.binance({'enableRateLimit': True})
+    df = pd.DataFrame(exchange.fetch_ohlcv(symbol, timeframe, limit=limit),
+                      columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    df.to_csv(path, index=False)
+    return df
+
+def load_fixture(path=TEST_FIXTURE_PATH):
+    """Lê uma fixture gravada por record_fixture"""
+    return pd.read_csv(path, parse_dates=['timestamp'])
+
+class LocalExchange:
+    """Exchange local que serve candles gravados ou sintéticos
+
+    Implementa o fetch_ohlcv do ccxt (usado pelo DataCollector) e as chamadas da python-binance
+    usadas pelo Trader. advance() libera o próximo candle, acelerando o tempo.
+    """
+    def __init__(self, df, start=None):
+        self.timestamps = (df['timestamp'].values.astype('datetime64[ms]').astype(np.int64))
+        self.ohlcv = df[['open', 'high', 'low', 'close', 'volume']].to_numpy(dtype=np.float64)
+        self.cursor = len(df) - 1 if start is None else start  # Último candle visível
+        self.open_orders = {}
+        self.by_client_id = {}
+        self.orders = 0
+        self.next_id = 1
+
+    def advance(self, n=1):
+        """Avança n candles; retorna False quando os dados acabam"""
+        if self.cursor + n >= len(self.timestamps):
+            return False
+        self.cursor += n
+        return True
+
+    # Interface do ccxt
+    def fetch_ohlcv(self, symbol, timeframe='1d', limit=500):
+        start = max(0, self.cursor + 1 - limit)
+        end = self.cursor + 1
+        return [[timestamp] + row for timestamp, row in zip(self.timestamps[start:end].tolist(),
+                                                             self.ohlcv[start:end].tolist())]
+
+    # Interface da python-binance
+    def get_symbol_ticker(self, symbol):
+        return {'symbol': symbol, 'price': str(self.ohlcv[self.cursor, 3])}
+
+    def create_order(self, **params):
+        order = {'orderId': self.next_id, 'clientOrderId': params.get('newClientOrderId', ''),
+                 'price': params.get('price', '0'), 'type': params['type'], 'side': params['side']}
+        order['status'] = 'FILLED' if params['type'] == 'MARKET' else 'NEW'
+        self.next_id += 1
+        self.orders += 1
+        if params['type'] != 'MARKET':
+            self.open_orders[order['orderId']] = order
+        self.by_client_id[order['clientOrderId']] = order
+        return order
+
+    def get_order(self, symbol, origClientOrderId):
+        if origClientOrderId not in self.by_client_id:
+            raise BinanceAPIException(None, 400, '{"code": -2013, "msg": "Order does not exist."}')
+        return self.by_client_id[origClientOrderId]
+
+    def get_open_orders(self, symbol):
+        return list(self.open_orders.values())
+
+    def cancel_order(self, symbol, orderId):
+        order = self.open_orders.pop(orderId)
+        order['status'] = 'CANCELED'
+        return order
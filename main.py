@@ -1,61 +1,187 @@
 from data_collector import DataCollector
+from feature_store import FeatureStore
 from model import TradingModel
 from trader import Trader
+from engine import (TradingEngine, ModelStrategy, LiveBroker, LiveClock, candles_from_dataframe, append_candles,
+                    timeframe_to_ns)
+from memory_monitor import MemoryMonitor
+from exits import ExitEngine, atr_from_candles, trader_exit_handler
+from config import (SYMBOL, REPLAY_DATA_DIR, MODEL_DIR, LIVE_HISTORY_BARS, LIVE_DECISION_HISTORY,
+                    TRAILING_STOP_PERCENTAGE, MAX_HOLDING_SECONDS)
+import gc
+import itertools
+import numpy as np
+import os
 import time
 import schedule
+import tensorflow as tf
 
-def trading_job():
-    """Função principal de trading"""
-    try:
-        # Inicializa as classes
-        collector = DataCollector()
-        model = TradingModel()
-        trader = Trader()
+class LiveSession:
+    """Objetos do bot criados uma vez e reutilizados em todos os ciclos"""
+    def __init__(self, collector=None, trader=None, model=None, feature_store=None, monitor=None,
+                 model_dir=MODEL_DIR, replay_dir=REPLAY_DATA_DIR, history_bars=LIVE_HISTORY_BARS, clock=None,
+                 timeframe='1d', exit_engine=None):
+        self.collector = collector or DataCollector()
+        self.trader = trader or Trader()
+        self.model = model or TradingModel()
+        self.feature_store = feature_store or FeatureStore(collector=self.collector)
+        self.monitor = monitor or MemoryMonitor()
+        self.model_dir = model_dir
+        self.replay_dir = replay_dir
+        self.history_bars = history_bars
+        self.clock = clock or LiveClock()
+        self.timeframe = timeframe
+        # Stop móvel, stop por ATR e saída por tempo avaliados no cliente a cada ciclo
+        self.exit_engine = exit_engine or ExitEngine(on_exit=trader_exit_handler(self.trader))
+        self.position_ids = itertools.count()
+        self.position_id = None  # Posição do Trader registrada no exit_engine
+        self.last_decided = None  # Timestamp do último candle decidido (uma decisão por candle)
+        self.engine = self._build_engine()
+        self.cycles = 0
+        self.heap_frozen = False
 
-        # Coleta dados históricos
-        df = collector.fetch_ohlcv_data()
+    def _build_engine(self):
+        return TradingEngine(ModelStrategy(self.model), LiveBroker(self.trader), self.clock,
+                             max_decisions=LIVE_DECISION_HISTORY)
+
+    def swap_model(self, model_factory=TradingModel):
+        """Troca o modelo liberando o grafo e o estado do Keras do anterior
+
+        O novo modelo é carregado de model_dir; sem pesos salvos a troca falha, em vez de seguir
+        operando com um modelo não treinado.
+        """
+        self.model = self.engine = None
+        gc.unfreeze()  # O modelo antigo estava entre os objetos congelados
+        self.heap_frozen = False
+        tf.keras.backend.clear_session()
+        gc.collect()
+        model = model_factory()
+        if not model.load(self.model_dir):
+            raise RuntimeError(f"Troca de modelo sem modelo salvo em '{self.model_dir}'")
+        self.model = model
+        self.engine = self._build_engine()
+
+    def run_cycle(self):
+        """Um ciclo de trading; retorna a decisão (ou None em caso de erro, candle já decidido ou saída disparada)"""
+        start = time.perf_counter()
+        decision = None
+        try:
+            decision = self._trade()
+        except Exception as e:
+            print(f"Erro no ciclo de trading: {e}")
+        finally:
+            self.cycles += 1
+            self.monitor.sample(self.cycles, cycle_seconds=time.perf_counter() - start)
+            if not self.heap_frozen:
+                # Objetos de longa duração (TensorFlow, modelo) saem das coletas do GC dos próximos ciclos;
+                # coleta antes, para o lixo cíclico do primeiro ciclo (fit do Keras) não ficar congelado
+                gc.collect()
+                gc.freeze()
+                self.heap_frozen = True
+        return decision
+
+    def _trade(self):
+        # Coleta apenas a janela de histórico usada (memória limitada a history_bars candles)
+        df = self.collector.fetch_ohlcv_data(timeframe=self.timeframe, limit=self.history_bars)
         if df is None:
             print("Erro ao coletar dados. Tentando novamente no próximo ciclo.")
-            return
-
-        # Calcula indicadores
-        df = collector.calculate_indicators(df)
-        
-        # Prepara dados para o modelo
-        X, y = model.prepare_data(df)
-        
-        # Treina o modelo (em produção, você pode querer fazer isso separadamente)
-        model.train(X, y)
-        
-        # Obtém previsão para o próximo movimento
-        current_data = df.iloc[-1][['close', 'volume', 'rsi', 'macd', 'bollinger_upper', 'bollinger_lower']].values.reshape(1, -1)
-        prediction = model.predict(current_data)
-        
-        current_position = trader.check_position()
-        current_price = trader.get_current_price()
-
-        # Lógica de trading
-        if prediction > 0.7 and current_position is None:  # Sinal de compra forte
-            print(f"Sinal de compra detectado. Probabilidade: {prediction:.2f}")
-            trader.place_buy_order(current_price)
-        elif prediction < 0.3 and current_position == 'LONG':  # Sinal de venda forte
-            print(f"Sinal de venda detectado. Probabilidade: {prediction:.2f}")
-            trader.place_sell_order()
+            return None
+
+        # Só candles fechados, como no replay: o último da exchange ainda está se formando
+        close_times = df['timestamp'].values.astype('datetime64[ns]').astype(np.int64) + timeframe_to_ns(self.timeframe)
+        df = df[close_times <= self.clock.now()].reset_index(drop=True)
+        if df.empty:
+            print("Nenhum candle fechado. Tentando novamente no próximo ciclo.")
+            return None
+
+        # Calcula indicadores (apenas os candles novos; o restante vem do feature store)
+        df = self.feature_store.update(df, timeframe=self.timeframe)
+
+        # Retoma do último modelo salvo e ajusta apenas nos candles novos
+        if self.model.train_incremental(df, directory=self.model_dir) is not None and self.engine.strategy.quantized:
+            self._export_quantized(df)
+
+        # Acrescenta os candles fechados à gravação, para que todas as decisões ao vivo possam ser reproduzidas
+        os.makedirs(self.replay_dir, exist_ok=True)
+        append_candles(df, os.path.join(self.replay_dir, f"{SYMBOL.replace('/', '')}_{self.timeframe}.npz"),
+                       self.timeframe)
+
+        # Saídas no cliente com o preço atual, antes da decisão do modelo. O exit_engine só recebe
+        # um preço por ciclo: stops atravessados e revertidos entre dois ciclos não disparam
+        price = self.trader.get_current_price()
+        now = self.clock.now()
+        exited = self.position_id is not None and bool(self.exit_engine.on_tick(price, SYMBOL, now))
+        if exited:
+            self.position_id = None
+
+        # Uma decisão por candle fechado, como no backtest; o candle em que uma saída disparou não
+        # gera nova compra (recompraria no mesmo preço, pagando as taxas duas vezes)
+        candles = candles_from_dataframe(df, self.timeframe)
+        if exited or candles[-1].timestamp == self.last_decided:
+            self.last_decided = candles[-1].timestamp
+            self._sync_exits(df, price, now)
+            print("Candle já decidido ou saída disparada; aguardando o próximo candle.")
+            return None
+
+        # Decide com o mesmo motor de eventos usado no backtest
+        self.engine.warmup(candles[-self.model.lookback:-1])
+        decision = self.engine.on_candle(candles[-1])
+        self.last_decided = candles[-1].timestamp
+        self._sync_exits(df, price, now)
+
+        if decision['probability'] is None:
+            print("Histórico insuficiente para previsão.")
+        elif decision['action'] == 'BUY':
+            print(f"Sinal de compra detectado. Probabilidade: {decision['probability']:.2f}")
+        elif decision['action'] == 'SELL':
+            print(f"Sinal de venda detectado. Probabilidade: {decision['probability']:.2f}")
         else:
-            print(f"Nenhuma ação necessária. Probabilidade: {prediction:.2f}")
+            print(f"Nenhuma ação necessária. Probabilidade: {decision['probability']:.2f}")
+        return decision
+
+    def _export_quantized(self, df):
+        """Reexporta o artefato quantizado com os pesos do retreino; o desvio é medido nas janelas recentes"""
+        from quantization import deploy_quantized_model  # Import tardio: o TFLite só é carregado se usado
+        X, y = self.model.transform_data(df)
+        holdout = len(X) * 4 // 5  # Últimos 20% das janelas
+        strategy = self.engine.strategy
+        strategy.quantized_model, _ = deploy_quantized_model(self.model, X[:holdout], X[holdout:], y[holdout:],
+                                                             strategy.quantized_path)
 
-    except Exception as e:
-        print(f"Erro no ciclo de trading: {e}")
+    def _sync_exits(self, df, price, now):
+        """Mantém o exit_engine com a posição do Trader
+
+        Uma posição nova (ou herdada do journal após reiniciar, ou cuja saída falhou) é registrada com
+        o preço e o horário da ordem de entrada do journal, e com a máxima dos candles desde então;
+        uma posição encerrada por fora (venda do modelo) sai do exit_engine.
+        """
+        position = self.trader.check_position()
+        if position is None and self.position_id is not None:
+            self.exit_engine.close_position(self.position_id)
+            self.position_id = None
+        elif position == 'LONG' and self.position_id is None:
+            entry = self.trader.entry_order() or {}
+            entry_price = entry.get('price') or price
+            entry_time = int(entry['ts'] * 1e9) if entry.get('ts') else now
+            after_entry = df['timestamp'].values.astype('datetime64[ns]').astype(np.int64) >= entry_time
+            high = max([price] + df['high'].values[after_entry].tolist())
+            atr = atr_from_candles(self.collector, df)
+            self.position_id = next(self.position_ids)
+            self.exit_engine.open_position(self.position_id, entry_price, SYMBOL, timestamp=entry_time,
+                                           trailing_pct=TRAILING_STOP_PERCENTAGE,
+                                           atr=atr if np.isfinite(atr) else None,
+                                           max_holding=MAX_HOLDING_SECONDS * 10 ** 9, high=high)
 
 def main():
     print("Iniciando bot de trading...")
-    
-    # Agenda a execução do job a cada 1 hora
-    schedule.every(1).hours.do(trading_job)
-    
-    # Executa o primeiro job imediatamente
-    trading_job()
-    
+    session = LiveSession()
+
+    # Agenda a execução do ciclo a cada 1 hora
+    schedule.every(1).hours.do(session.run_cycle)
+
+    # Executa o primeiro ciclo imediatamente
+    session.run_cycle()
+
     # Loop principal
     while True:
         schedule.run_pending()
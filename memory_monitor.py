@@ -0,0 +1,104 @@
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from collections import deque
+from config import MEMORY_ALERT_CYCLES, MEMORY_ALERT_GROWTH_MB, MEMORY_TRACEMALLOC, MEMORY_OBJECT_COUNT_EVERY
+
+def current_rss_mb():
+    """Memória residente do processo em MB"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        # Sem /proc: usa o pico (ru_maxrss), em KB no Linux e em bytes no macOS
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+
+class MemoryMonitor:
+    """Telemetria de memória por ciclo (RSS, tracemalloc, objetos do GC) com alerta de crescimento"""
+    def __init__(self, alert_cycles=MEMORY_ALERT_CYCLES, alert_growth_mb=MEMORY_ALERT_GROWTH_MB,
+                 trace=MEMORY_TRACEMALLOC, object_count_every=MEMORY_OBJECT_COUNT_EVERY):
+        self.alert_cycles = alert_cycles
+        self.alert_growth_mb = alert_growth_mb
+        self.trace = trace
+        # gc.collect() + gc.get_objects() percorrem o heap inteiro: só a cada object_count_every amostras
+        self.object_count_every = object_count_every
+        self.objects_start = None
+        self.objects = None  # Última contagem de objetos
+        # Só as últimas amostras ficam guardadas, para o próprio monitor não crescer
+        self.history = deque(maxlen=alert_cycles)
+        self.first = None
+        self.samples = 0
+        self.alerts = 0
+        self.baseline = None
+        if trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def sample(self, cycle=None, **extra):
+        """Mede a memória ao fim de um ciclo e avisa se ela só cresceu nos últimos alert_cycles ciclos"""
+        objects = None
+        if self.object_count_every and self.samples % self.object_count_every == 0:
+            gc.collect()  # Conta o que continua vivo, não o lixo ainda não coletado
+            objects = self.objects = len(gc.get_objects()) + gc.get_freeze_count()
+            if self.objects_start is None:
+                self.objects_start = objects
+        sample = {
+            'cycle': self.samples if cycle is None else cycle,
+            'time': time.time(),
+            'rss_mb': current_rss_mb(),
+            'objects': objects,  # None nas amostras sem contagem
+            'gc_counts': gc.get_count(),
+            **extra,
+        }
+        if self.trace and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            sample['traced_mb'] = current / 2 ** 20
+            sample['traced_peak_mb'] = peak / 2 ** 20
+            if self.baseline is None:
+                self.baseline = tracemalloc.take_snapshot()
+
+        self.history.append(sample)
+        self.first = self.first or sample
+        self.samples += 1
+        sample['alert'] = self._growing()
+        if sample['alert']:
+            self.alerts += 1
+            self._report_growth()
+            self.history.clear()  # Um alerta por janela de ciclos
+        return sample
+
+    def _growing(self):
+        if len(self.history) < self.alert_cycles:
+            return False
+        rss = [s['rss_mb'] for s in self.history]
+        monotonic = all(b >= a for a, b in zip(rss, rss[1:]))
+        return monotonic and rss[-1] - rss[0] > self.alert_growth_mb
+
+    def _report_growth(self):
+        growth = self.history[-1]['rss_mb'] - self.history[0]['rss_mb']
+        print(f"ALERTA: memória cresceu {growth:.1f} MB em {len(self.history)} ciclos seguidos "
+              f"(RSS {self.history[-1]['rss_mb']:.1f} MB, {self.objects} objetos na última contagem)")
+        if self.baseline is not None:
+            for stat in tracemalloc.take_snapshot().compare_to(self.baseline, 'lineno')[:5]:
+                print(f"  {stat}")
+
+    def summary(self):
+        """Resumo desde a primeira amostra"""
+        if self.first is None:
+            return None
+        last = self.history[-1] if self.history else self.first
+        return {
+            'samples': self.samples,
+            'alerts': self.alerts,
+            'rss_start_mb': self.first['rss_mb'],
+            'rss_end_mb': last['rss_mb'],
+            'objects_start': self.objects_start,
+            'objects_end': self.objects,
+        }
+
+    def stop(self):
+        if self.trace and tracemalloc.is_tracing():
+            tracemalloc.stop()
@@ -0,0 +1,133 @@
+import numpy as np
+
+def _as_2d(values):
+    """Garante formato (curvas, períodos); curvas únicas viram uma linha"""
+    values = np.asarray(values, dtype=np.float64)
+    return values[None, :] if values.ndim == 1 else values
+
+def _unwrap(result, single):
+    return {key: value[0] for key, value in result.items()} if single else result
+
+def returns_from_equity(equity):
+    """Retornos simples por período de cada curva de patrimônio"""
+    equity = _as_2d(equity)
+    return equity[:, 1:] / equity[:, :-1] - 1
+
+def drawdown(equity):
+    """Retorna (drawdown máximo, duração máxima em períodos) de cada curva"""
+    equity = _as_2d(equity)
+    peaks = np.maximum.accumulate(equity, axis=1)
+    max_drawdown = (1 - equity / peaks).max(axis=1)
+
+    # Duração: períodos desde o último topo, calculado sem laço com o índice do último topo
+    index = np.arange(equity.shape[1])
+    last_peak = np.maximum.accumulate(np.where(equity >= peaks, index, 0), axis=1)
+    duration = (index - last_peak).max(axis=1)
+    return max_drawdown, duration
+
+def sharpe_ratio(returns, periods_per_year=365):
+    returns = _as_2d(returns)
+    std = returns.std(axis=1, ddof=1) if returns.shape[1] > 1 else np.zeros(len(returns))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(std > 0, returns.mean(axis=1) / std * np.sqrt(periods_per_year), 0.0)
+
+def sortino_ratio(returns, periods_per_year=365):
+    returns = _as_2d(returns)
+    downside = np.sqrt(np.mean(np.minimum(returns, 0) ** 2, axis=1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(downside > 0, returns.mean(axis=1) / downside * np.sqrt(periods_per_year), 0.0)
+
+def compute_metrics(equity, exposure=None, periods_per_year=365):
+    """Métricas de risco de uma ou várias curvas de patrimônio (2-D: uma curva por linha)"""
+    single = np.asarray(equity).ndim == 1
+    equity = _as_2d(equity)
+    returns = returns_from_equity(equity)
+    max_drawdown, drawdown_duration = drawdown(equity)
+
+    total_return = equity[:, -1] / equity[:, 0] - 1
+    years = max(equity.shape[1] - 1, 1) / periods_per_year
+    annual_return = (1 + total_return) ** (1 / years) - 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        calmar = np.where(max_drawdown > 0, annual_return / max_drawdown, 0.0)
+
+    result = {
+        'total_return': total_return,
+        'annual_return': annual_return,
+        'max_drawdown': max_drawdown,
+        'max_drawdown_duration': drawdown_duration,
+        'sharpe': sharpe_ratio(returns, periods_per_year),
+        'sortino': sortino_ratio(returns, periods_per_year),
+        'calmar': calmar,
+    }
+    if exposure is not None:
+        result['exposure_time'] = _as_2d(exposure).mean(axis=1)
+    return _unwrap(result, single)
+
+def closed_trades(trades):
+    """Pares (compra, venda) das posições encerradas, casados pelo id da posição
+
+    Operações sem 'position' são casadas em sequência; uma compra ainda aberta ou uma venda
+    sem compra correspondente ficam de fora, sem desalinhar as demais.
+    """
+    entries = {}
+    closed = []
+    for trade in trades:
+        key = trade.get('position')
+        if trade['type'] == 'BUY':
+            entries[key] = trade
+        elif trade['type'] == 'SELL' and key in entries:
+            closed.append((entries.pop(key), trade))
+    return closed
+
+def trade_metrics(entry_index, exit_index, entry_price, exit_price, high, low, fees=None,
+                  entry_fill=None, exit_fill=None):
+    """Métricas por operação: profit factor, MAE/MFE e períodos de permanência
+
+    MAE/MFE são as maiores excursões adversa/favorável entre entrada e saída, obtidas com
+    reduceat sobre as máximas/mínimas em O(n). Máxima e mínima de um candle só contam se a
+    posição esteve aberta nele inteiro: o candle de entrada só com execução na abertura
+    ('open') e o de saída só com execução no fechamento ('close'); nos demais casos ('tick'
+    ou a outra ponta do candle) entra apenas o preço de execução. Sem fill, vale 'open'.
+    """
+    entry_index = np.asarray(entry_index, dtype=np.int64)
+    exit_index = np.asarray(exit_index, dtype=np.int64)
+    entry_price = np.asarray(entry_price, dtype=np.float64)
+    exit_price = np.asarray(exit_price, dtype=np.float64)
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+
+    pnl = exit_price / entry_price - 1
+    if fees is not None:
+        pnl = pnl - np.asarray(fees, dtype=np.float64)
+    gains = pnl[pnl > 0].sum()
+    losses = -pnl[pnl < 0].sum()
+
+    if len(entry_index):
+        # Candles mantidos inteiros: [início, fim), conforme onde as ordens executaram
+        start = entry_index + (_fills(entry_fill, len(entry_index)) != 'open')
+        end = exit_index + (_fills(exit_fill, len(exit_index)) == 'close')
+        # Fronteiras intercaladas [início, fim); os segmentos pares são os candles da operação
+        bounds = np.column_stack([start, end]).ravel()
+        padded_high = np.append(high, -np.inf)
+        padded_low = np.append(low, np.inf)
+        # Nenhum candle inteiro: segmento vazio (reduceat devolveria o próprio candle)
+        held = end > start
+        segment_high = np.where(held, np.maximum.reduceat(padded_high, bounds)[::2], -np.inf)
+        segment_low = np.where(held, np.minimum.reduceat(padded_low, bounds)[::2], np.inf)
+        mfe = np.maximum(segment_high, exit_price) / entry_price - 1
+        mae = np.minimum(segment_low, exit_price) / entry_price - 1
+    else:
+        mfe = mae = np.array([], dtype=np.float64)
+
+    return {
+        'returns': pnl,
+        'winning_trades': int((pnl > 0).sum()),
+        'losing_trades': int((pnl <= 0).sum()),
+        'profit_factor': float(gains / losses) if losses > 0 else float('inf') if gains > 0 else 0.0,
+        'mae': mae,
+        'mfe': mfe,
+        'holding_periods': exit_index - entry_index,
+    }
+
+def _fills(fills, n):
+    return np.full(n, 'open') if fills is None else np.asarray(fills)
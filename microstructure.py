@@ -0,0 +1,195 @@
+import time
+import numpy as np
+import pandas as pd
+from config import (MICROSTRUCTURE_DEPTH_LEVELS, MICROSTRUCTURE_DEPTH_CAPACITY, MICROSTRUCTURE_TRADE_CAPACITY,
+                    MICROSTRUCTURE_FEATURES)
+
+TRADE_DTYPE = np.dtype([('timestamp', np.int64), ('price', np.float64), ('amount', np.float64),
+                        ('side', np.int8)])
+
+def depth_dtype(levels=MICROSTRUCTURE_DEPTH_LEVELS):
+    return np.dtype([('timestamp', np.int64),
+                     ('bid_price', np.float64, (levels,)), ('bid_size', np.float64, (levels,)),
+                     ('ask_price', np.float64, (levels,)), ('ask_size', np.float64, (levels,)),
+                     ('imbalance', np.float64), ('spread', np.float64), ('mid', np.float64)])
+
+class RingBuffer:
+    """Buffer circular pré-alocado sobre um array estruturado do NumPy (memória limitada)"""
+    def __init__(self, dtype, capacity):
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.capacity = capacity
+        self.head = 0  # Próxima posição de escrita
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def is_full(self):
+        return self.size == self.capacity
+
+    def push(self):
+        """Reserva a próxima posição (sobrescrevendo a mais antiga se cheio) e retorna o índice"""
+        index = self.head
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return index
+
+    def ordered(self):
+        """Cópia dos registros em ordem cronológica"""
+        if self.size < self.capacity:
+            return self.data[:self.size].copy()
+        return np.concatenate([self.data[self.head:], self.data[:self.head]])
+
+    def last(self):
+        return self.data[(self.head - 1) % self.capacity] if self.size else None
+
+class SymbolMicrostructure:
+    def __init__(self, levels=MICROSTRUCTURE_DEPTH_LEVELS, depth_capacity=MICROSTRUCTURE_DEPTH_CAPACITY,
+                 trade_capacity=MICROSTRUCTURE_TRADE_CAPACITY):
+        self.levels = levels
+        self.depth = RingBuffer(depth_dtype(levels), depth_capacity)
+        self.trades = RingBuffer(TRADE_DTYPE, trade_capacity)
+        # Somas móveis sobre a janela de trades do buffer, atualizadas a cada entrada/saída
+        self.signed_volume = 0.0
+        self.total_volume = 0.0
+        self.notional = 0.0
+        self.updates_since_resync = 0
+
+    def on_depth(self, timestamp, bids, asks):
+        """Registra um snapshot do livro; bids/asks são sequências de (preço, quantidade), melhor primeiro"""
+        # reshape: um lado vazio (livro de um lado só) vira uma matriz 0 x 2
+        bids = np.asarray(bids, dtype=np.float64).reshape(-1, 2)[:self.levels]
+        asks = np.asarray(asks, dtype=np.float64).reshape(-1, 2)[:self.levels]
+        index = self.depth.push()
+        record = self.depth.data[index]
+        record['timestamp'] = timestamp
+        record['bid_price'][:] = 0
+        record['bid_size'][:] = 0
+        record['ask_price'][:] = 0
+        record['ask_size'][:] = 0
+        record['bid_price'][:len(bids)] = bids[:, 0]
+        record['bid_size'][:len(bids)] = bids[:, 1]
+        record['ask_price'][:len(asks)] = asks[:, 0]
+        record['ask_size'][:len(asks)] = asks[:, 1]
+
+        bid_volume, ask_volume = bids[:, 1].sum(), asks[:, 1].sum()
+        total = bid_volume + ask_volume
+        record['imbalance'] = (bid_volume - ask_volume) / total if total > 0 else 0.0
+        # Sem um dos lados não há spread nem preço médio
+        two_sided = len(bids) > 0 and len(asks) > 0
+        record['spread'] = asks[0, 0] - bids[0, 0] if two_sided else np.nan
+        record['mid'] = (asks[0, 0] + bids[0, 0]) / 2 if two_sided else np.nan
+
+    def on_trade(self, timestamp, price, amount, side):
+        """Registra um trade; side = 1 para agressor comprador, -1 para vendedor"""
+        if self.trades.is_full():
+            # O trade mais antigo sai da janela antes de ser sobrescrito
+            _, old_price, old_amount, old_side = self.trades.data[self.trades.head].item()
+            self.signed_volume -= old_side * old_amount
+            self.total_volume -= old_amount
+            self.notional -= old_price * old_amount
+
+        index = self.trades.push()
+        self.trades.data[index] = (timestamp, price, amount, side)
+        self.signed_volume += side * amount
+        self.total_volume += amount
+        self.notional += price * amount
+
+        # Recalcula as somas periodicamente para não acumular erro de ponto flutuante
+        self.updates_since_resync += 1
+        if self.updates_since_resync >= self.trades.capacity:
+            self._resync()
+
+    def _resync(self):
+        trades = self.trades.data[:self.trades.size]
+        self.signed_volume = float((trades['side'] * trades['amount']).sum())
+        self.total_volume = float(trades['amount'].sum())
+        self.notional = float((trades['price'] * trades['amount']).sum())
+        self.updates_since_resync = 0
+
+    def features(self):
+        """Features atuais: desequilíbrio do livro, spread, fluxo de trades e VWAP"""
+        depth = self.depth.last()
+        vwap = self.notional / self.total_volume if self.total_volume > 0 else np.nan
+        mid = depth['mid'] if depth is not None else np.nan
+        return {
+            'ob_imbalance': float(depth['imbalance']) if depth is not None else np.nan,
+            'spread': float(depth['spread']) if depth is not None else np.nan,
+            'spread_bps': float(depth['spread'] / mid * 1e4) if depth is not None and mid > 0 else np.nan,
+            'trade_flow_imbalance': self.signed_volume / self.total_volume if self.total_volume > 0 else np.nan,
+            'vwap': vwap,
+            'vwap_deviation': (mid / vwap - 1) if depth is not None and vwap > 0 else np.nan,
+        }
+
+    def candle_features(self, timestamps, timeframe_ns):
+        """Agrega as features por candle (NaN para candles fora da cobertura dos buffers)"""
+        starts = np.asarray(timestamps, dtype=np.int64)
+        result = pd.DataFrame(np.nan, index=range(len(starts)), columns=MICROSTRUCTURE_FEATURES)
+
+        trades = self.trades.ordered()
+        if len(trades):
+            # Limites de cada candle nos trades ordenados por busca binária
+            lo = np.searchsorted(trades['timestamp'], starts, side='left')
+            hi = np.searchsorted(trades['timestamp'], starts + timeframe_ns, side='left')
+            cum_signed = np.concatenate([[0], np.cumsum(trades['side'] * trades['amount'])])
+            cum_volume = np.concatenate([[0], np.cumsum(trades['amount'])])
+            cum_notional = np.concatenate([[0], np.cumsum(trades['price'] * trades['amount'])])
+            volume = cum_volume[hi] - cum_volume[lo]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                result['trade_flow_imbalance'] = np.where(volume > 0, (cum_signed[hi] - cum_signed[lo]) / volume,
+                                                          np.nan)
+                vwap = np.where(volume > 0, (cum_notional[hi] - cum_notional[lo]) / volume, np.nan)
+        else:
+            vwap = np.full(len(starts), np.nan)
+
+        depth = self.depth.ordered()
+        if len(depth):
+            lo = np.searchsorted(depth['timestamp'], starts, side='left')
+            hi = np.searchsorted(depth['timestamp'], starts + timeframe_ns, side='left')
+            count = hi - lo
+            cum_imbalance = np.concatenate([[0], np.cumsum(depth['imbalance'])])
+            # Spread e mid só existem nos snapshots com os dois lados do livro
+            two_sided = ~np.isnan(depth['mid'])
+            cum_two_sided = np.concatenate([[0], np.cumsum(two_sided)])
+            cum_spread_bps = np.concatenate([[0], np.cumsum(np.where(two_sided, depth['spread'] / depth['mid'] * 1e4,
+                                                                     0))])
+            quoted = cum_two_sided[hi] - cum_two_sided[lo]
+            # Último mid válido de cada candle, para comparar com o VWAP
+            last_quoted = np.maximum.accumulate(np.where(two_sided, np.arange(len(depth)), -1))[np.maximum(hi - 1, 0)]
+            last_mid = depth['mid'][np.maximum(last_quoted, 0)]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                result['ob_imbalance'] = np.where(count > 0, (cum_imbalance[hi] - cum_imbalance[lo]) / count, np.nan)
+                result['spread_bps'] = np.where(quoted > 0, (cum_spread_bps[hi] - cum_spread_bps[lo]) / quoted,
+                                                np.nan)
+                result['vwap_deviation'] = np.where((count > 0) & (last_quoted >= lo), last_mid / vwap - 1, np.nan)
+
+        return result
+
+class MicrostructureStore:
+    """Mantém um SymbolMicrostructure por símbolo"""
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.symbols = {}
+
+    def get(self, symbol):
+        if symbol not in self.symbols:
+            self.symbols[symbol] = SymbolMicrostructure(**self.kwargs)
+        return self.symbols[symbol]
+
+    def on_message(self, message):
+        """Despacha mensagens no formato {'type': 'depth'|'trade', 'symbol': ..., ...}"""
+        book = self.get(message['symbol'])
+        if message['type'] == 'depth':
+            book.on_depth(message['timestamp'], message['bids'], message['asks'])
+        else:
+            book.on_trade(message['timestamp'], message['price'], message['amount'], message['side'])
+
+def replay(store, messages):
+    """Reproduz um feed local de mensagens e retorna a vazão em atualizações por segundo"""
+    start = time.perf_counter()
+    count = 0
+    for message in messages:
+        store.on_message(message)
+        count += 1
+    elapsed = time.perf_counter() - start
+    return count / elapsed if elapsed > 0 else float('inf')
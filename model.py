@@ -1,23 +1,43 @@
+import os
+import json
+import hashlib
+import pickle
 import numpy as np
+import pandas as pd
 import tensorflow as tf
 from sklearn.preprocessing import MinMaxScaler
-from config import FEATURES, LOOKBACK_PERIOD
+from labeling import make_labels
+from config import (FEATURES, LOOKBACK_PERIOD, MODEL_UNITS, MODEL_DROPOUT, MODEL_DENSE_UNITS, MODEL_DIR,
+                    TRAINING_TARGET,
+                    INCREMENTAL_EPOCHS, INCREMENTAL_REPLAY_RATIO,
+                    INCREMENTAL_VALIDATION_FRACTION, INCREMENTAL_PATIENCE, SCALER_UPDATE_POLICY,
+                    SCALER_DRIFT_TOLERANCE)
 
 class TradingModel:
-    def __init__(self):
+    def __init__(self, units=MODEL_UNITS, dropout=MODEL_DROPOUT, dense_units=MODEL_DENSE_UNITS,
+                 lookback=LOOKBACK_PERIOD, features=FEATURES, target=TRAINING_TARGET):
+        self.units = list(units)
+        self.dropout = dropout
+        self.dense_units = dense_units
+        self.lookback = lookback
+        self.features = list(features)
+        self.target = target
         self.model = self._build_model()
         self.scaler = MinMaxScaler()
+        self.last_trained_timestamp = None
 
     def _build_model(self):
         """Constrói o modelo de rede neural LSTM"""
-        model = tf.keras.Sequential([
-            tf.keras.layers.LSTM(50, return_sequences=True, input_shape=(LOOKBACK_PERIOD, len(FEATURES))),
-            tf.keras.layers.Dropout(0.2),
-            tf.keras.layers.LSTM(50, return_sequences=False),
-            tf.keras.layers.Dropout(0.2),
-            tf.keras.layers.Dense(25),
+        # Uma camada LSTM (seguida de Dropout) por elemento de units
+        layers = [tf.keras.Input(shape=(self.lookback, len(self.features)))]
+        for i, units in enumerate(self.units):
+            layers.append(tf.keras.layers.LSTM(units, return_sequences=i < len(self.units) - 1))
+            layers.append(tf.keras.layers.Dropout(self.dropout))
+        layers += [
+            tf.keras.layers.Dense(self.dense_units),
             tf.keras.layers.Dense(1, activation='sigmoid')
-        ])
+        ]
+        model = tf.keras.Sequential(layers)
         
         model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
         return model
@@ -25,18 +45,31 @@ class TradingModel:
     def prepare_data(self, df):
         """Prepara os dados para treinamento"""
         # Seleciona apenas as features relevantes
-        data = df[FEATURES].values
+        data = df[self.features].values
         
         # Normaliza os dados
         data_normalized = self.scaler.fit_transform(data)
-        
-        # Prepara as sequências para o LSTM
+        return self._windows(data_normalized, df)
+
+    def transform_data(self, df):
+        """Como prepare_data, mas com o scaler já ajustado (sem reajustá-lo)"""
+        return self._windows(self.scaler.transform(df[self.features].values), df)
+
+    def _windows(self, data_normalized, df):
+        # Rótulo de cada janela vem do seu último candle (a entrada), conforme o alvo configurado
+        labels = make_labels(df, self.target)
+
+        # Prepara as sequências para o LSTM (janelas com rótulo desconhecido ou indicadores em
+        # aquecimento ficam de fora, para não propagar NaN aos pesos)
+        missing = np.isnan(data_normalized).any(axis=1).astype(np.int64)
+        missing_before = np.concatenate([[0], np.cumsum(missing)])
         X, y = [], []
-        for i in range(len(data_normalized) - LOOKBACK_PERIOD):
-            X.append(data_normalized[i:(i + LOOKBACK_PERIOD)])
-            # Define o target como 1 se o preço subiu, 0 se caiu
-            price_direction = 1 if data[i + LOOKBACK_PERIOD][0] > data[i + LOOKBACK_PERIOD - 1][0] else 0
-            y.append(price_direction)
+        for i in range(len(data_normalized) - self.lookback):
+            label = labels[i + self.lookback - 1]
+            if np.isnan(label) or missing_before[i + self.lookback] > missing_before[i]:
+                continue
+            X.append(data_normalized[i:(i + self.lookback)])
+            y.append(int(label))
             
         return np.array(X), np.array(y)
 
@@ -44,12 +77,131 @@ class TradingModel:
         """Treina o modelo"""
         return self.model.fit(X, y, epochs=epochs, batch_size=batch_size, validation_split=0.2)
 
+    def config(self):
+        """Arquitetura e entrada do modelo; pesos salvos só valem para a mesma configuração"""
+        return {'units': self.units, 'dropout': self.dropout, 'dense_units': self.dense_units,
+                'lookback': self.lookback, 'features': self.features, 'target': self.target}
+
+    def fingerprint(self):
+        """Impressão digital dos pesos atuais; muda a cada treino ou carga de outros pesos"""
+        digest = hashlib.sha256()
+        for weights in self.model.get_weights():
+            digest.update(np.ascontiguousarray(weights).tobytes())
+        return digest.hexdigest()[:16]
+
+    def save(self, directory=MODEL_DIR):
+        """Salva pesos, scaler, configuração e o último candle usado no treino"""
+        os.makedirs(directory, exist_ok=True)
+        self.model.save_weights(os.path.join(directory, 'weights.h5'))
+        with open(os.path.join(directory, 'scaler.pkl'), 'wb') as f:
+            pickle.dump(self.scaler, f)
+        with open(os.path.join(directory, 'state.json'), 'w') as f:
+            json.dump({'last_trained_timestamp': str(self.last_trained_timestamp), 'config': self.config()}, f)
+
+    def load(self, directory=MODEL_DIR):
+        """Carrega um modelo salvo; retorna False se não houver treino anterior"""
+        state_path = os.path.join(directory, 'state.json')
+        if not os.path.exists(state_path):
+            return False
+        with open(state_path) as f:
+            state = json.load(f)
+        saved = state.get('config')
+        if saved is not None and saved != self.config():
+            changed = sorted(key for key in saved if saved[key] != self.config().get(key))
+            raise ValueError(f"Modelo salvo em '{directory}' tem outra configuração ({', '.join(changed)})")
+        self.model.load_weights(os.path.join(directory, 'weights.h5'))
+        with open(os.path.join(directory, 'scaler.pkl'), 'rb') as f:
+            self.scaler = pickle.load(f)
+        self.last_trained_timestamp = pd.Timestamp(state['last_trained_timestamp'])
+        return True
+
+    def _update_scaler(self, data, policy=SCALER_UPDATE_POLICY, tolerance=SCALER_DRIFT_TOLERANCE):
+        """Mantém a faixa do scaler estável; só expande se os dados novos saírem além da tolerância"""
+        if policy == 'freeze':
+            return False
+        span = self.scaler.data_range_
+        overshoot = np.maximum(np.nanmax(data, axis=0) - self.scaler.data_max_,
+                               self.scaler.data_min_ - np.nanmin(data, axis=0)) / np.where(span > 0, span, 1)
+        if np.nanmax(overshoot) <= tolerance:
+            return False
+        self.scaler.partial_fit(data)
+        return True
+
+    def _last_labeled_bar(self, labels):
+        """Último candle-alvo cujo rótulo (e o de todos os anteriores) já é conhecido"""
+        # O alvo t usa o rótulo do candle t - 1; rótulos pendentes só existem no fim da série
+        pending = np.flatnonzero(np.isnan(labels[:-1]))
+        return int(pending[0]) if len(pending) else len(labels) - 1
+
+    def train_incremental(self, df, epochs=INCREMENTAL_EPOCHS, batch_size=32,
+                          replay_ratio=INCREMENTAL_REPLAY_RATIO, patience=INCREMENTAL_PATIENCE,
+                          validation_fraction=INCREMENTAL_VALIDATION_FRACTION, directory=MODEL_DIR, seed=None):
+        """Retoma dos últimos pesos salvos e ajusta apenas nos candles novos (mais uma amostra antiga)"""
+        if self.last_trained_timestamp is None and not self.load(directory):
+            # Sem treino anterior: ajuste completo que serve de ponto de partida
+            X, y = self.prepare_data(df)
+            history = self.train(X, y)
+            self.last_trained_timestamp = df['timestamp'].iloc[self._last_labeled_bar(make_labels(df, self.target))]
+            self.save(directory)
+            return history
+
+        data = df[self.features].values
+        labels = make_labels(df, self.target)
+        timestamps = df['timestamp'].values
+        first_new = int(np.searchsorted(timestamps, np.datetime64(self.last_trained_timestamp), side='right'))
+        first_new = max(first_new, self.lookback)
+        last_target = self._last_labeled_bar(labels)
+        if first_new > last_target:
+            return None  # Nenhum candle novo com rótulo conhecido desde o último ajuste
+
+        self._update_scaler(data[first_new:])
+        data_normalized = self.scaler.transform(data)
+
+        # Janelas cujo alvo é um candle novo, mais uma amostra de janelas antigas (replay)
+        new_targets = np.arange(first_new, last_target + 1)
+        rng = np.random.default_rng(seed)
+        old_targets = np.arange(self.lookback, first_new)
+        replay_size = min(len(old_targets), int(np.ceil(len(new_targets) * replay_ratio)))
+        replay_targets = rng.choice(old_targets, replay_size, replace=False) if replay_size else old_targets[:0]
+        targets = np.sort(np.concatenate([replay_targets, new_targets]))
+
+        X = np.stack([data_normalized[t - self.lookback:t] for t in targets])
+        y = labels[targets - 1].astype(int)
+        valid = ~np.isnan(X).any(axis=(1, 2))
+        X, y = X[valid], y[valid]
+        if len(X) == 0:
+            return None
+
+        # Validação nas janelas mais recentes, para a parada antecipada
+        n_validation = max(1, int(len(X) * validation_fraction)) if len(X) > 1 else 0
+        callbacks = [tf.keras.callbacks.EarlyStopping(monitor='val_loss' if n_validation else 'loss',
+                                                      patience=patience, restore_best_weights=True)]
+        fit_kwargs = {}
+        if n_validation:
+            X_validation, y_validation = X[-n_validation:], y[-n_validation:]
+            fit_kwargs['validation_data'] = (X_validation, y_validation)
+            X, y = X[:-n_validation], y[:-n_validation]
+
+        history = self.model.fit(X, y, epochs=epochs, batch_size=batch_size, callbacks=callbacks,
+                                 verbose=0, **fit_kwargs)
+        if n_validation:
+            # Os candles mais novos só serviram à parada antecipada; uma passada final os incorpora
+            # antes de last_trained_timestamp avançar sobre eles
+            self.model.fit(X_validation, y_validation, epochs=1, batch_size=batch_size, verbose=0)
+        self.last_trained_timestamp = df['timestamp'].iloc[last_target]
+        self.save(directory)
+        return history
+
     def predict(self, data):
         """Faz previsões com o modelo treinado"""
         # Prepara os dados para previsão
         data_normalized = self.scaler.transform(data)
-        data_sequence = np.array([data_normalized[-LOOKBACK_PERIOD:]])
+        data_sequence = np.array([data_normalized[-self.lookback:]])
         
-        # Faz a previsão
-        prediction = self.model.predict(data_sequence)
+        # Faz a previsão (chamada direta: predict() cria um pipeline de dados a cada uso)
+        prediction = self.model(data_sequence, training=False).numpy()
         return prediction[0][0]  # Retorna a probabilidade de subida do preço
+
+    def predict_batch(self, X):
+        """Faz previsões para várias janelas já normalizadas"""
+        return self.model.predict(X, verbose=0)[:, 0]
@@ -0,0 +1,189 @@
+import os
+import copy
+import json
+import time
+import pickle
+import numpy as np
+import tensorflow as tf
+from config import (QUANTIZATION_MODE, QUANTIZATION_BATCH_SIZE, QUANTIZATION_MAX_ACCURACY_DRIFT,
+                    QUANTIZED_MODEL_PATH)
+
+# Modos suportados: 'int8' usa calibração com dados reais, 'float32' serve de referência em TFLite
+QUANTIZATION_MODES = ('int8', 'float32')
+
+class QuantizedModel:
+    """Modelo TFLite com o scaler, a configuração e a impressão digital dos pesos de origem
+
+    O artefato só vale para os pesos de que foi convertido: load_for_model recusa um TradingModel
+    com outra configuração ou outros pesos (ex.: retreinado depois da exportação).
+    """
+    def __init__(self, model_content, scaler, mode=QUANTIZATION_MODE, config=None, fingerprint=None):
+        self.model_content = model_content
+        self.scaler = scaler
+        self.mode = mode
+        self.config = config
+        self.fingerprint = fingerprint
+        self.interpreter = tf.lite.Interpreter(model_content=model_content)
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()[0]
+        self.batch_size, self.lookback, self.n_features = self.input_details['shape']
+
+    @classmethod
+    def from_trading_model(cls, trading_model, calibration_data, mode=QUANTIZATION_MODE,
+                           batch_size=QUANTIZATION_BATCH_SIZE):
+        """Converte um TradingModel treinado para TFLite com precisão reduzida"""
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"Modo de quantização inválido: {mode}. Use um de {QUANTIZATION_MODES}")
+
+        keras_model = trading_model.model
+        _, lookback, n_features = keras_model.input_shape
+
+        # O LSTM fundido do TFLite exige formato de entrada estático
+        @tf.function
+        def serve(x):
+            return keras_model(x, training=False)
+
+        concrete_function = serve.get_concrete_function(
+            tf.TensorSpec([batch_size, lookback, n_features], tf.float32))
+        converter = tf.lite.TFLiteConverter.from_concrete_functions([concrete_function], keras_model)
+
+        if mode == 'int8':
+            # Calibra as faixas de ativação com janelas reais de treino
+            calibration_data = np.asarray(calibration_data, dtype=np.float32)
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.representative_dataset = lambda: (
+                [_pad_batch(calibration_data[i:i + batch_size], batch_size)]
+                for i in range(0, min(len(calibration_data), 100 * batch_size), batch_size)
+            )
+
+        # Cópia do scaler: o retreino incremental altera o do modelo no próprio objeto
+        return cls(converter.convert(), copy.deepcopy(trading_model.scaler), mode,
+                   trading_model.config(), trading_model.fingerprint())
+
+    @classmethod
+    def load(cls, path):
+        """Carrega um modelo quantizado exportado por save"""
+        with open(path, 'rb') as f:
+            model_content = f.read()
+        with open(path + '.scaler.pkl', 'rb') as f:
+            scaler = pickle.load(f)
+        with open(path + '.json') as f:
+            state = json.load(f)
+        return cls(model_content, scaler, state['mode'], state['config'], state['fingerprint'])
+
+    @classmethod
+    def load_for_model(cls, trading_model, path=QUANTIZED_MODEL_PATH):
+        """Carrega o artefato exportado de um TradingModel para servir no lugar do modelo float"""
+        quantized_model = cls.load(path)
+        if quantized_model.config != trading_model.config():
+            changed = sorted(key for key in quantized_model.config
+                             if quantized_model.config[key] != trading_model.config().get(key))
+            raise ValueError(f"Modelo quantizado em '{path}' tem outra configuração ({', '.join(changed)})")
+        if quantized_model.fingerprint != trading_model.fingerprint():
+            raise ValueError(f"Modelo quantizado em '{path}' foi exportado de outros pesos; "
+                             f"reexporte-o com deploy_quantized_model")
+        return quantized_model
+
+    def matches(self, trading_model):
+        """Indica se o artefato foi convertido dos pesos atuais do modelo"""
+        return self.fingerprint == trading_model.fingerprint()
+
+    def save(self, path):
+        """Exporta o modelo quantizado, com scaler, configuração e impressão digital dos pesos"""
+        with open(path, 'wb') as f:
+            f.write(self.model_content)
+        with open(path + '.scaler.pkl', 'wb') as f:
+            pickle.dump(self.scaler, f)
+        with open(path + '.json', 'w') as f:
+            json.dump({'mode': self.mode, 'config': self.config, 'fingerprint': self.fingerprint}, f)
+
+    def predict_batch(self, X):
+        """Faz previsões para várias janelas de uma vez"""
+        X = np.asarray(X, dtype=np.float32)
+        predictions = np.empty(len(X), dtype=np.float32)
+
+        for start in range(0, len(X), self.batch_size):
+            chunk = X[start:start + self.batch_size]
+            # O LSTM do TFLite guarda o estado em tensores variáveis: zera antes de cada lote
+            self.interpreter.reset_all_variables()
+            self.interpreter.set_tensor(self.input_details['index'], _pad_batch(chunk, self.batch_size))
+            self.interpreter.invoke()
+            predictions[start:start + len(chunk)] = \
+                self.interpreter.get_tensor(self.output_details['index'])[:len(chunk), 0]
+
+        return predictions
+
+    def predict(self, data):
+        """Faz previsões com o modelo quantizado"""
+        data_normalized = self.scaler.transform(data)
+        data_sequence = np.array([data_normalized[-self.lookback:]])
+        return self.predict_batch(data_sequence)[0]
+
+def _pad_batch(chunk, batch_size):
+    """Completa o último lote com zeros para respeitar a entrada estática do TFLite"""
+    chunk = np.asarray(chunk, dtype=np.float32)
+    if len(chunk) == batch_size:
+        return chunk
+    padding = np.zeros((batch_size - len(chunk),) + chunk.shape[1:], dtype=np.float32)
+    return np.concatenate([chunk, padding])
+
+def direction_accuracy(probabilities, y):
+    """Calcula a acurácia direcional (probabilidade > 0.5 = alta)"""
+    return float(np.mean((np.asarray(probabilities) > 0.5).astype(int) == np.asarray(y)))
+
+def benchmark_throughput(predict_batch, X, repeats=3):
+    """Mede a vazão de inferência em janelas por segundo"""
+    predict_batch(X[:1])  # Aquecimento
+    start = time.perf_counter()
+    for _ in range(repeats):
+        predict_batch(X)
+    elapsed = time.perf_counter() - start
+    return (len(X) * repeats) / elapsed if elapsed > 0 else float('inf')
+
+def evaluate_drift(trading_model, quantized_model, X, y, repeats=3):
+    """Compara o modelo quantizado com o modelo float em dados separados"""
+    float_predictions = trading_model.predict_batch(X)
+    quantized_predictions = quantized_model.predict_batch(X)
+
+    float_accuracy = direction_accuracy(float_predictions, y)
+    quantized_accuracy = direction_accuracy(quantized_predictions, y)
+
+    return {
+        'mode': quantized_model.mode,
+        'samples': len(X),
+        'float_accuracy': float_accuracy,
+        'quantized_accuracy': quantized_accuracy,
+        'accuracy_drift': abs(float_accuracy - quantized_accuracy),
+        'decision_agreement': float(np.mean((float_predictions > 0.5) == (quantized_predictions > 0.5))),
+        'max_probability_diff': float(np.max(np.abs(float_predictions - quantized_predictions))),
+        'float_windows_per_second': benchmark_throughput(trading_model.predict_batch, X, repeats),
+        'quantized_windows_per_second': benchmark_throughput(quantized_model.predict_batch, X, repeats),
+    }
+
+def deploy_quantized_model(trading_model, X_calibration, X_holdout, y_holdout, path,
+                           mode=QUANTIZATION_MODE, max_drift=QUANTIZATION_MAX_ACCURACY_DRIFT):
+    """Quantiza, valida e exporta o modelo; recusa o artefato se o desvio de acurácia for alto"""
+    quantized_model = QuantizedModel.from_trading_model(trading_model, X_calibration, mode)
+    report = evaluate_drift(trading_model, quantized_model, X_holdout, y_holdout)
+
+    print("\n=== Relatório de Quantização ===")
+    print(f"Modo: {report['mode']} | Amostras: {report['samples']}")
+    print(f"Acurácia float: {report['float_accuracy']:.4f}")
+    print(f"Acurácia quantizada: {report['quantized_accuracy']:.4f}")
+    print(f"Desvio de acurácia: {report['accuracy_drift']:.4f} (máximo {max_drift:.4f})")
+    print(f"Concordância de decisões: {report['decision_agreement']:.2%}")
+    print(f"Vazão float: {report['float_windows_per_second']:.1f} janelas/s")
+    print(f"Vazão quantizada: {report['quantized_windows_per_second']:.1f} janelas/s")
+
+    if report['accuracy_drift'] > max_drift:
+        raise ValueError(
+            f"Modelo quantizado recusado: desvio de acurácia {report['accuracy_drift']:.4f} "
+            f"acima do limite {max_drift:.4f}")
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    quantized_model.save(path)
+    print(f"Modelo quantizado salvo em '{path}'")
+    return quantized_model, report
@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import numpy as np
+import pandas as pd
+from config import RESULTS_DB_PATH
+
+# Métricas guardadas como colunas tipadas (filtráveis e ordenáveis direto no SQL)
+METRIC_COLUMNS = {
+    'total_trades': 'INTEGER', 'winning_trades': 'INTEGER', 'losing_trades': 'INTEGER',
+    'profit_loss': 'REAL', 'return_percentage': 'REAL', 'win_rate': 'REAL',
+    'total_return': 'REAL', 'annual_return': 'REAL', 'max_drawdown': 'REAL',
+    'max_drawdown_duration': 'INTEGER', 'sharpe': 'REAL', 'sortino': 'REAL', 'calmar': 'REAL',
+    'exposure_time': 'REAL', 'profit_factor': 'REAL', 'average_holding_bars': 'REAL',
+    'average_mae': 'REAL', 'average_mfe': 'REAL',
+}
+RUN_COLUMNS = ['run_id', 'created_at', 'source', 'config_hash', 'symbol', 'timeframe'] + list(METRIC_COLUMNS)
+INDEXED_COLUMNS = ['config_hash', 'created_at', 'return_percentage', 'sharpe', 'max_drawdown']
+OPERATORS = ('=', '!=', '<', '<=', '>', '>=')
+
+def config_hash(params):
+    """Hash estável da configuração de uma execução"""
+    payload = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+def _to_ns(timestamp):
+    return None if timestamp is None else int(pd.Timestamp(timestamp).value)
+
+def _scalar(value):
+    """Converte valores NumPy/pandas em tipos aceitos pelo SQLite (inf/NaN viram NULL)"""
+    if value is None:
+        return None
+    if isinstance(value, pd.Timedelta):
+        return value.total_seconds()
+    value = value.item() if hasattr(value, 'item') else value
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+class ResultsStore:
+    """Banco local de resultados de backtests e varreduras (SQLite com índices)"""
+    def __init__(self, path=RESULTS_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            metric_columns = ', '.join(f"{name} {kind}" for name, kind in METRIC_COLUMNS.items())
+            conn.execute(f"""CREATE TABLE IF NOT EXISTS runs (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL NOT NULL, source TEXT NOT NULL,
+                config_hash TEXT NOT NULL, symbol TEXT, timeframe TEXT, {metric_columns},
+                params TEXT, extra TEXT)""")
+            # Operações e curvas ficam em tabelas separadas: consultas sobre runs não as leem
+            conn.execute("""CREATE TABLE IF NOT EXISTS trades (
+                run_id INTEGER NOT NULL, seq INTEGER NOT NULL, timestamp INTEGER, type TEXT, price REAL,
+                amount REAL, fee REAL, balance REAL, bar INTEGER,
+                PRIMARY KEY (run_id, seq)) WITHOUT ROWID""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS equity (
+                run_id INTEGER PRIMARY KEY, equity BLOB NOT NULL, exposure BLOB)""")
+            for column in INDEXED_COLUMNS:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_runs_{column} ON runs ({column})")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_trades_type ON trades (type, run_id)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def record_run(self, source, params, stats, trades=(), equity=None, exposure=None, symbol=None,
+                   timeframe=None):
+        """Grava uma execução (métricas, operações e curva de patrimônio) e retorna o run_id"""
+        metrics = {name: _scalar(stats.get(name)) for name in METRIC_COLUMNS}
+        extra = {key: _scalar(value) for key, value in stats.items()
+                 if key not in METRIC_COLUMNS and np.isscalar(_scalar(value))}
+        columns = ['created_at', 'source', 'config_hash', 'symbol', 'timeframe', *metrics, 'params', 'extra']
+        values = [time.time(), source, config_hash(params), symbol, timeframe, *metrics.values(),
+                  json.dumps(params, sort_keys=True, default=str), json.dumps(extra, default=str)]
+
+        with self._connect() as conn:
+            cursor = conn.execute(f"INSERT INTO runs ({', '.join(columns)}) "
+                                  f"VALUES ({', '.join('?' * len(columns))})", values)
+            run_id = cursor.lastrowid
+            conn.executemany("INSERT INTO trades VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+                (run_id, seq, _to_ns(t.get('timestamp')), t.get('type'), _scalar(t.get('price')),
+                 _scalar(t.get('amount')), _scalar(t.get('fee')), _scalar(t.get('balance')), _scalar(t.get('bar')))
+                for seq, t in enumerate(trades)))
+            if equity is not None:
+                exposure_blob = None if exposure is None else np.asarray(exposure, dtype=np.float64).tobytes()
+                conn.execute("INSERT INTO equity VALUES (?, ?, ?)",
+                             (run_id, np.asarray(equity, dtype=np.float64).tobytes(), exposure_blob))
+        return run_id
+
+    def _where(self, filters):
+        """Monta a cláusula WHERE a partir de {coluna: valor} ou {coluna: (operador, valor)}"""
+        clauses, values = [], []
+        for column, condition in (filters or {}).items():
+            if column not in RUN_COLUMNS:
+                raise ValueError(f"Coluna desconhecida: {column}")
+            operator, value = condition if isinstance(condition, tuple) else ('=', condition)
+            if operator not in OPERATORS:
+                raise ValueError(f"Operador inválido: {operator}")
+            clauses.append(f"{column} {operator} ?")
+            values.append(value)
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), values
+
+    def query(self, filters=None, order_by='return_percentage', descending=True, limit=100,
+              columns=RUN_COLUMNS):
+        """Filtra e ranqueia execuções no SQL; só as linhas do resultado são carregadas"""
+        for column in [*columns, order_by]:
+            if column not in RUN_COLUMNS:
+                raise ValueError(f"Coluna desconhecida: {column}")
+        where, values = self._where(filters)
+        sql = (f"SELECT {', '.join(columns)} FROM runs{where} "
+               f"ORDER BY {order_by} IS NULL, {order_by} {'DESC' if descending else 'ASC'}")
+        if limit is not None:
+            sql += " LIMIT ?"
+            values.append(limit)
+        with self._connect() as conn:
+            return pd.read_sql_query(sql, conn, params=values)
+
+    def iter_runs(self, filters=None, chunksize=10000, columns=RUN_COLUMNS):
+        """Percorre as execuções em blocos, sem carregar todas na memória"""
+        where, values = self._where(filters)
+        with self._connect() as conn:
+            yield from pd.read_sql_query(f"SELECT {', '.join(columns)} FROM runs{where} ORDER BY run_id",
+                                         conn, params=values, chunksize=chunksize)
+
+    def count(self, filters=None):
+        where, values = self._where(filters)
+        with self._connect() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM runs{where}", values).fetchone()[0]
+
+    def get_params(self, run_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT params FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_trades(self, run_id):
+        with self._connect() as conn:
+            df = pd.read_sql_query("SELECT timestamp, type, price, amount, fee, balance, bar FROM trades "
+                                   "WHERE run_id = ? ORDER BY seq", conn, params=(run_id,))
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        return df
+
+    def get_equity(self, run_id):
+        """Retorna (patrimônio, exposição) da execução como arrays NumPy"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT equity, exposure FROM equity WHERE run_id = ?", (run_id,)).fetchone()
+        if row is None:
+            return None, None
+        exposure = np.frombuffer(row[1], dtype=np.float64) if row[1] is not None else None
+        return np.frombuffer(row[0], dtype=np.float64), exposure
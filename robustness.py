@@ -0,0 +1,148 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from metrics import drawdown, sharpe_ratio, closed_trades
+from config import (ROBUSTNESS_PATHS, ROBUSTNESS_BLOCK_SIZE, ROBUSTNESS_CONFIDENCE, ROBUSTNESS_SLIPPAGE,
+                    ROBUSTNESS_FEE_JITTER, ROBUSTNESS_CHUNK_SIZE, SIMULATED_FEE_RATE, SIMULATED_ALLOCATION)
+
+def trade_prices(trades):
+    """Extrai preços de entrada e saída das operações fechadas, casadas como em metrics.closed_trades"""
+    pairs = closed_trades(trades)
+    return (np.array([entry['price'] for entry, _ in pairs], dtype=np.float64),
+            np.array([exit['price'] for _, exit in pairs], dtype=np.float64))
+
+def path_metrics(path_returns, periods_per_year=1):
+    """Calcula retorno total, drawdown máximo e Sharpe de cada caminho (uma linha por caminho)"""
+    # Patrimônio parte de 1.0 para que o drawdown considere o capital inicial
+    equity = np.cumprod(np.hstack([np.ones((len(path_returns), 1)), 1 + path_returns]), axis=1)
+    max_drawdown, _ = drawdown(equity)
+    return {
+        'total_return': equity[:, -1] - 1,
+        'max_drawdown': max_drawdown,
+        'sharpe': sharpe_ratio(path_returns, periods_per_year),
+    }
+
+def _block_indices(rng, n_paths, n_returns, block_size):
+    """Gera índices do bootstrap em blocos circulares (preserva autocorrelação curta)"""
+    n_blocks = -(-n_returns // block_size)
+    starts = rng.integers(0, n_returns, (n_paths, n_blocks))
+    offsets = np.arange(block_size)
+    indices = (starts[:, :, None] + offsets) % n_returns
+    return indices.reshape(n_paths, -1)[:, :n_returns]
+
+def _simulate_chunk(task):
+    """Simula um lote de caminhos; executado nos processos do pool"""
+    method, data, n_paths, seed, params = task
+    rng = np.random.default_rng(seed)
+
+    if method == 'trades':
+        entries, exits = data
+        indices = rng.integers(0, len(entries), (n_paths, len(entries)))
+        # Perturba o preço de entrada (slippage) e a taxa cobrada em cada operação
+        slippage = 1 + rng.normal(0, params['slippage'], indices.shape)
+        fees = params['fee_rate'] * rng.uniform(1 - params['fee_jitter'], 1 + params['fee_jitter'],
+                                                indices.shape)
+        # Retorno sobre o patrimônio como no SimulatedBroker: só a fração alocada entra na operação e
+        # a taxa de compra é cobrada à parte
+        path_returns = params['allocation'] * (
+            exits[indices] * (1 - fees) / (entries[indices] * slippage) - 1 - fees)
+    else:
+        returns = data
+        path_returns = returns[_block_indices(rng, n_paths, len(returns), params['block_size'])]
+
+    return path_metrics(path_returns, params['periods_per_year'])
+
+class RobustnessAnalyzer:
+    def __init__(self, n_paths=ROBUSTNESS_PATHS, workers=None, seed=42, confidence=ROBUSTNESS_CONFIDENCE,
+                 chunk_size=ROBUSTNESS_CHUNK_SIZE, executor=None):
+        self.n_paths = n_paths
+        self.workers = workers or os.cpu_count() or 1
+        self.seed = seed
+        self.confidence = confidence
+        self.chunk_size = chunk_size
+        # Pool reaproveitado entre chamadas (ex.: a cada candidato de uma varredura); um executor
+        # injetado pertence a quem o criou e não é encerrado aqui
+        self.executor = executor
+        self.owns_executor = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Encerra o pool criado pelo próprio analisador"""
+        if self.owns_executor and self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+            self.owns_executor = False
+
+    def _pool(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            self.owns_executor = True
+        return self.executor
+
+    def _run(self, method, data, params):
+        """Distribui os caminhos em lotes com sementes independentes e reproduzíveis"""
+        n_chunks = -(-self.n_paths // self.chunk_size)
+        seeds = np.random.SeedSequence(self.seed).spawn(n_chunks)
+        sizes = [min(self.chunk_size, self.n_paths - i * self.chunk_size) for i in range(n_chunks)]
+        tasks = [(method, data, size, seed, params) for size, seed in zip(sizes, seeds)]
+
+        if self.workers == 1 or n_chunks == 1:
+            results = [_simulate_chunk(task) for task in tasks]
+        else:
+            results = list(self._pool().map(_simulate_chunk, tasks))
+
+        return {key: np.concatenate([r[key] for r in results]) for key in results[0]}
+
+    def _summarize(self, metrics, method):
+        """Resume as distribuições com média, percentis e intervalo de confiança"""
+        alpha = (1 - self.confidence) / 2
+        report = {'method': method, 'paths': self.n_paths, 'confidence': self.confidence}
+        for name, values in metrics.items():
+            low, median, high = np.quantile(values, [alpha, 0.5, 1 - alpha])
+            report[name] = {
+                'mean': float(values.mean()),
+                'std': float(values.std()),
+                'median': float(median),
+                'ci_low': float(low),
+                'ci_high': float(high),
+            }
+        report['probability_of_loss'] = float(np.mean(metrics['total_return'] < 0))
+        return report
+
+    def bootstrap_trades(self, trades, slippage=ROBUSTNESS_SLIPPAGE, fee_rate=SIMULATED_FEE_RATE,
+                         fee_jitter=ROBUSTNESS_FEE_JITTER, allocation=SIMULATED_ALLOCATION):
+        """Reamostra a sequência de operações perturbando preços de entrada e taxas"""
+        entries, exits = trade_prices(trades)
+        if len(entries) == 0:
+            return None
+        params = {'slippage': slippage, 'fee_rate': fee_rate, 'fee_jitter': fee_jitter,
+                  'allocation': allocation, 'periods_per_year': 1}
+        return self._summarize(self._run('trades', (entries, exits), params), 'trades')
+
+    def bootstrap_returns(self, returns, block_size=ROBUSTNESS_BLOCK_SIZE, periods_per_year=365):
+        """Reamostra os retornos por período em blocos (block bootstrap)"""
+        returns = np.asarray(returns, dtype=np.float64)
+        returns = returns[~np.isnan(returns)]
+        if len(returns) < 2:
+            return None
+        params = {'block_size': min(block_size, len(returns)), 'periods_per_year': periods_per_year}
+        return self._summarize(self._run('blocks', returns, params), 'blocks')
+
+def print_report(report):
+    """Exibe o relatório de robustez"""
+    if report is None:
+        print("\nDados insuficientes para a análise de robustez")
+        return
+
+    print(f"\n=== Análise de Robustez ({report['method']}, {report['paths']} caminhos) ===")
+    labels = {'total_return': 'Retorno total', 'max_drawdown': 'Drawdown máximo', 'sharpe': 'Sharpe'}
+    for key, label in labels.items():
+        stats = report[key]
+        print(f"{label}: média {stats['mean']:.4f} | mediana {stats['median']:.4f} | "
+              f"IC {report['confidence']:.0%} [{stats['ci_low']:.4f}, {stats['ci_high']:.4f}]")
+    print(f"Probabilidade de prejuízo: {report['probability_of_loss']:.2%}")
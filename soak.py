@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import tempfile
+import contextlib
+from data_collector import DataCollector
+from feature_store import FeatureStore
+from journal import PositionJournal
+from local_exchange import LocalExchange, synthetic_ohlcv
+from main import LiveSession
+from memory_monitor import MemoryMonitor
+from model import TradingModel
+from trader import Trader
+
+def small_model():
+    """Modelo reduzido: o teste de longa duração mede memória, não qualidade das previsões"""
+    return TradingModel(units=[8], dense_units=8, lookback=30)
+
+def run_soak(cycles=2000, history_bars=400, model_factory=small_model, swap_every=250, alert_cycles=50,
+             alert_growth_mb=50, trace=False, directory=None, quiet=True, seed=0):
+    """Roda muitos ciclos acelerados do processo ao vivo contra a exchange local e resume a memória"""
+    exchange = LocalExchange(synthetic_ohlcv(history_bars + cycles, seed=seed), start=history_bars - 1)
+    with contextlib.ExitStack() as stack:
+        root = directory or stack.enter_context(tempfile.TemporaryDirectory())
+        if quiet:
+            # Descarta as mensagens de cada ciclo sem acumulá-las em memória
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+
+        collector = DataCollector(exchange=exchange)
+        journal = PositionJournal(os.path.join(root, 'journal'))
+        stack.callback(journal.close)
+        monitor = MemoryMonitor(alert_cycles=alert_cycles, alert_growth_mb=alert_growth_mb, trace=trace)
+        stack.callback(monitor.stop)
+        session = LiveSession(collector=collector, trader=Trader(client=exchange, journal=journal),
+                              model=model_factory(), monitor=monitor,
+                              feature_store=FeatureStore(root=os.path.join(root, 'feature_store'),
+                                                         collector=collector),
+                              model_dir=os.path.join(root, 'models'),
+                              replay_dir=os.path.join(root, 'replay_data'), history_bars=history_bars)
+
+        start = time.perf_counter()
+        for cycle in range(cycles):
+            session.run_cycle()
+            if swap_every and (cycle + 1) % swap_every == 0:
+                session.swap_model(model_factory)
+            if not exchange.advance():
+                break
+
+        summary = monitor.summary()
+        summary['elapsed_seconds'] = time.perf_counter() - start
+        summary['orders'] = exchange.orders
+        return summary
+
+if __name__ == "__main__":
+    # Uso: python soak.py [ciclos] [--trace]  (--trace ativa o tracemalloc, bem mais lento)
+    args = [a for a in sys.argv[1:] if a != '--trace']
+    summary = run_soak(int(args[0]) if args else 2000, trace='--trace' in sys.argv)
+    print("\n=== Teste de longa duração ===")
+    print(f"Ciclos: {summary['samples']} em {summary['elapsed_seconds']:.1f}s | Ordens: {summary['orders']}")
+    print(f"RSS: {summary['rss_start_mb']:.1f} MB -> {summary['rss_end_mb']:.1f} MB")
+    print(f"Objetos: {summary['objects_start']} -> {summary['objects_end']}")
+    print(f"Alertas de crescimento: {summary['alerts']}")
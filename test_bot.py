@@ -1,17 +1,57 @@
+import os
+# Perfil de testes (modelo reduzido); precisa vir antes dos imports que leem o config
+os.environ.setdefault('TRADING_BOT_PROFILE', 'test')
 import unittest
+import pytest
 from data_collector import DataCollector
 from model import TradingModel
 from trader import Trader
+from quantization import QuantizedModel, evaluate_drift, deploy_quantized_model
+from feature_store import FeatureStore
+from hyperparameter_search import HyperparameterSearch
+from journal import PositionJournal
+from robustness import RobustnessAnalyzer, path_metrics, trade_prices
+from metrics import compute_metrics, trade_metrics, closed_trades
+from results_store import ResultsStore
+from memory_monitor import MemoryMonitor
+from soak import run_soak
+from main import LiveSession
+from local_exchange import LocalExchange, load_fixture, synthetic_ohlcv
+from exits import ExitEngine, atr_from_candles, trader_exit_handler
+from job_queue import JobQueue, Worker, run_local, expand_grid, walk_forward_payloads
+from labeling import first_passage, triple_barrier_labels, forward_returns, make_labels
+from test_strategy import StrategyTester, BUY_CONDITIONS, SELL_CONDITIONS, decode_conditions, signal_reasons
+from microstructure import MicrostructureStore, SymbolMicrostructure, replay
+from engine import (TradingEngine, ModelStrategy, SimulatedBroker, SimulatedClock, ReplayFeed, Tick,
+                    candles_from_dataframe, record_candles, append_candles, periods_per_year)
+from config import FEATURES, LOOKBACK_PERIOD, INDICATOR_PARAMS, SYMBOL, HPO_SEARCH_SPACE, SIMULATED_LATENCY_SECONDS
+import time
+import tempfile
+from unittest import mock
+from binance.exceptions import BinanceAPIException
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 
 class TestBitcoinBot(unittest.TestCase):
-    def setUp(self):
-        """Configuração inicial para cada teste"""
-        self.collector = DataCollector()
-        self.model = TradingModel()
-        self.trader = Trader()
+    @classmethod
+    def setUpClass(cls):
+        """Objetos caros criados uma vez: exchange local com candles gravados, modelo reduzido e trader"""
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.exchange = LocalExchange(load_fixture())
+        cls.collector = DataCollector(exchange=cls.exchange)
+        cls.model = TradingModel()
+        cls.journal = PositionJournal(os.path.join(cls.tmp.name, 'journal'))
+        cls.trader = Trader(client=cls.exchange, journal=cls.journal)
+        # Indicadores sobre toda a fixture, sem os candles de aquecimento (médias de 200 dias)
+        df = cls.collector.fetch_ohlcv_data(limit=len(cls.exchange.timestamps))
+        cls.df = cls.collector.calculate_indicators(df).dropna().reset_index(drop=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.journal.close()
+        cls.tmp.cleanup()
 
     def test_data_collection(self):
         """Testa a coleta de dados"""
@@ -28,8 +68,7 @@ class TestBitcoinBot(unittest.TestCase):
 
     def test_indicators(self):
         """Testa o cálculo dos indicadores técnicos"""
-        df = self.collector.fetch_ohlcv_data(limit=100)
-        df = self.collector.calculate_indicators(df)
+        df = self.df
         
         # Verifica se os indicadores foram calculados
         indicators = ['rsi', 'macd', 'signal', 'bollinger_upper', 'bollinger_lower']
@@ -43,10 +82,7 @@ class TestBitcoinBot(unittest.TestCase):
     def test_model_training(self):
         """Testa o treinamento do modelo"""
         # Prepara dados de teste
-        df = self.collector.fetch_ohlcv_data(limit=100)
-        df = self.collector.calculate_indicators(df)
-        
-        X, y = self.model.prepare_data(df)
+        X, y = self.model.prepare_data(self.df)
         
         # Verifica se os dados foram preparados corretamente
         self.assertIsNotNone(X)
@@ -62,13 +98,11 @@ class TestBitcoinBot(unittest.TestCase):
     def test_model_prediction(self):
         """Testa as previsões do modelo"""
         # Prepara e treina o modelo
-        df = self.collector.fetch_ohlcv_data(limit=100)
-        df = self.collector.calculate_indicators(df)
-        X, y = self.model.prepare_data(df)
+        X, y = self.model.prepare_data(self.df)
         self.model.train(X, y, epochs=5)
         
-        # Testa previsão
-        current_data = df.iloc[-1][['close', 'volume', 'rsi', 'macd', 'bollinger_upper', 'bollinger_lower']].values.reshape(1, -1)
+        # Testa previsão (última janela com as features do modelo)
+        current_data = self.df[self.model.features].values[-self.model.lookback:]
         prediction = self.model.predict(current_data)
         
         # Verifica se a previsão está no formato esperado
@@ -85,6 +119,1017 @@ class TestBitcoinBot(unittest.TestCase):
         position = self.trader.check_position()
         self.assertIn(position, [None, 'LONG'])
 
+class TestFeatureStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.collector = DataCollector()
+        self.df = synthetic_ohlcv(800, seed=7)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_incremental_update_matches_full_recompute(self):
+        """Testa se acrescentar candles gera as mesmas features do cálculo completo"""
+        store = FeatureStore(root=self.tmp.name, collector=self.collector)
+        partial = self.df.iloc[:700].copy()
+        partial.loc[699, 'close'] *= 1.05  # Candle provisório, corrigido na próxima coleta
+        store.update(partial)
+        result = store.update(self.df.iloc[650:].copy())
+
+        expected = self.collector.calculate_indicators(self.df.copy()).iloc[650:].reset_index(drop=True)
+        self.assertEqual(len(result), len(expected))
+        for column in FEATURES:
+            np.testing.assert_allclose(result[column], expected[column], rtol=1e-9)
+        self.assertEqual(len(store.get_dataframe()), len(self.df))
+
+    def test_indicator_change_invalidates_cache(self):
+        """Testa se mudar parâmetros dos indicadores descarta a matriz anterior"""
+        FeatureStore(root=self.tmp.name, collector=self.collector).update(self.df.copy())
+        params = dict(INDICATOR_PARAMS, rsi_period=7)
+        store = FeatureStore(root=self.tmp.name, collector=self.collector, indicator_params=params)
+        self.assertIsNone(store.load())
+
+        result = store.update(self.df.copy())
+        expected = self.collector.calculate_indicators(self.df.copy(), params)
+        np.testing.assert_allclose(result['rsi'], expected['rsi'])
+        self.assertEqual(len(os.listdir(os.path.dirname(store._path(SYMBOL, '1d')))), 1)
+
+    def test_warmup_follows_indicator_params(self):
+        """Testa se o aquecimento cresce com as janelas e mantém o incremental igual ao cálculo completo"""
+        params = dict(INDICATOR_PARAMS, sma_long=700)
+        store = FeatureStore(root=self.tmp.name, collector=self.collector, indicator_params=params)
+        self.assertGreater(store.warmup_bars, 700)
+
+        df = synthetic_ohlcv(1600, seed=7)
+        store.update(df.iloc[:1200].copy())
+        result = store.update(df.iloc[1100:].copy())
+        expected = self.collector.calculate_indicators(df.copy(), params).iloc[1100:].reset_index(drop=True)
+        for column in FEATURES:
+            np.testing.assert_allclose(result[column], expected[column], rtol=1e-9)
+
+    def test_gap_rebuilds_from_received_candles(self):
+        """Testa se candles faltando entre o cache e os dados novos forçam o recálculo"""
+        store = FeatureStore(root=self.tmp.name, collector=self.collector)
+        store.update(self.df.iloc[:400].copy())
+        result = store.update(self.df.iloc[450:].copy())
+
+        expected = self.collector.calculate_indicators(self.df.iloc[450:].copy()).reset_index(drop=True)
+        for column in FEATURES:
+            np.testing.assert_allclose(result[column], expected[column], rtol=1e-9)
+        self.assertEqual(len(store.get_dataframe()), len(self.df) - 450)
+
+    def test_earlier_history_backfills(self):
+        """Testa se candles anteriores ao cache recalculam o feature store sem perder os posteriores"""
+        store = FeatureStore(root=self.tmp.name, collector=self.collector)
+        store.update(self.df.iloc[600:700].copy())
+        result = store.update(self.df.iloc[:650].copy())
+        self.assertEqual(len(result), 650)
+
+        expected = self.collector.calculate_indicators(self.df.iloc[:700].copy()).reset_index(drop=True)
+        for column in FEATURES:
+            np.testing.assert_allclose(store.get_dataframe()[column], expected[column], rtol=1e-9)
+        result = store.update(self.df.iloc[:800].copy())
+        self.assertEqual(len(result), 800)
+        self.assertFalse(result['sma_200'].iloc[199:].isna().any())
+
+class MomentumModel:
+    """Modelo determinístico leve com a mesma interface de TradingModel.predict"""
+    def predict(self, data):
+        return 1 / (1 + np.exp(-50 * (data[-1][0] / data[-10][0] - 1)))
+
+class TestReplayEngine(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.df = DataCollector().calculate_indicators(synthetic_ohlcv(300, seed=7)).dropna().reset_index(drop=True)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_engine(self, feed):
+        broker = SimulatedBroker(10000)
+        engine = TradingEngine(ModelStrategy(MomentumModel(), lookback=20), broker, SimulatedClock())
+        stats = engine.run(feed)
+        return engine, broker, stats
+
+    def test_replay_from_disk_is_deterministic(self):
+        """Testa se o replay gravado gera decisões idênticas às do DataFrame"""
+        candles_path = os.path.join(self.tmp.name, 'candles.npz')
+        record_candles(self.df, candles_path)
+
+        reference, _, _ = self.run_engine(ReplayFeed.from_dataframe(self.df))
+        first, _, stats = self.run_engine(ReplayFeed.from_files(candles_path))
+        second, _, _ = self.run_engine(ReplayFeed.from_files(candles_path))
+
+        self.assertEqual(first.decision_digest(), reference.decision_digest())
+        self.assertEqual(first.decision_digest(), second.decision_digest())
+        self.assertEqual(stats['candles'], len(self.df))
+        self.assertGreater(stats['speedup'], 1000)
+
+    def test_orders_fill_after_latency(self):
+        """Testa se as ordens executam no primeiro preço após a latência simulada"""
+        # Sem ticks, a ordem que vence dentro do candle seguinte executa na sua abertura, com ou sem latência
+        opens = dict(zip(self.df['timestamp'], self.df['open']))
+        for latency in (0, SIMULATED_LATENCY_SECONDS, 3600):
+            broker = SimulatedBroker(10000, latency_seconds=latency)
+            engine = TradingEngine(ModelStrategy(MomentumModel(), lookback=20), broker, SimulatedClock())
+            engine.run(ReplayFeed.from_dataframe(self.df))
+            self.assertGreater(len(broker.trades), 0)
+            for trade in broker.trades:
+                self.assertEqual(trade['price'], opens[trade['timestamp']])
+                self.assertEqual(trade['fill'], 'open')
+
+        # Com ticks, a execução usa o primeiro tick após a latência
+        decision = next(d for d in engine.decisions if d['action'] != 'HOLD')
+        tick_time = decision['timestamp'] + 86400 * 10 ** 9 + int(SIMULATED_LATENCY_SECONDS * 1e9) + 1
+        feed = ReplayFeed(candles_from_dataframe(self.df), [Tick(tick_time, 12345.0)])
+        _, broker, _ = self.run_engine(feed)
+        self.assertEqual(broker.trades[0]['price'], 12345.0)
+        self.assertEqual(broker.trades[0]['fill'], 'tick')
+
+    def test_append_candles_keeps_history(self):
+        """Testa se a gravação acumula candles entre ciclos em vez de sobrescrevê-los"""
+        path = os.path.join(self.tmp.name, 'live.npz')
+        self.assertEqual(append_candles(self.df.iloc[:50], path), 50)
+        self.assertEqual(append_candles(self.df.iloc[30:80], path), 30)
+        self.assertEqual(append_candles(self.df.iloc[60:80], path), 0)
+        reference, _, _ = self.run_engine(ReplayFeed.from_dataframe(self.df.iloc[:80]))
+        replayed, _, _ = self.run_engine(ReplayFeed.from_files(path))
+        self.assertEqual(replayed.decision_digest(), reference.decision_digest())
+
+class TestRobustness(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.trades = []
+        for price in rng.uniform(20000, 40000, 30):
+            self.trades.append({'type': 'BUY', 'price': price})
+            self.trades.append({'type': 'SELL', 'price': price * rng.uniform(0.95, 1.08)})
+
+    def test_trade_bootstrap_is_reproducible_across_workers(self):
+        """Testa se o resultado independe do número de processos"""
+        inline = RobustnessAnalyzer(n_paths=3000, workers=1, chunk_size=1000).bootstrap_trades(self.trades)
+        pooled = RobustnessAnalyzer(n_paths=3000, workers=2, chunk_size=1000).bootstrap_trades(self.trades)
+        self.assertEqual(inline, pooled)
+        self.assertLessEqual(inline['total_return']['ci_low'], inline['total_return']['median'])
+        self.assertLessEqual(inline['total_return']['median'], inline['total_return']['ci_high'])
+        self.assertTrue(0 <= inline['max_drawdown']['mean'] <= 1)
+
+    def test_trades_paired_by_position(self):
+        """Testa se o bootstrap casa compras e vendas pelo id da posição, como as métricas"""
+        trades = [{'type': 'BUY', 'price': 100.0, 'position': 1}, {'type': 'BUY', 'price': 110.0, 'position': 2},
+                  {'type': 'SELL', 'price': 120.0, 'position': 1}, {'type': 'SELL', 'price': 130.0, 'position': 2}]
+        entries, exits = trade_prices(trades)
+        np.testing.assert_array_equal(entries, [100.0, 110.0])
+        np.testing.assert_array_equal(exits, [120.0, 130.0])
+
+    def test_reused_executor_and_broker_allocation(self):
+        """Testa o pool reaproveitado entre chamadas e o retorno com a mesma alocação do broker"""
+        inline = RobustnessAnalyzer(n_paths=3000, workers=1, chunk_size=1000).bootstrap_trades(self.trades)
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            analyzer = RobustnessAnalyzer(n_paths=3000, chunk_size=1000, executor=executor)
+            self.assertEqual(analyzer.bootstrap_trades(self.trades), inline)
+            self.assertEqual(analyzer.bootstrap_trades(self.trades), inline)
+            analyzer.close()
+            self.assertIs(analyzer.executor, executor)  # Executor injetado continua aberto
+
+        broker = SimulatedBroker(10000)
+        broker._fill('BUY', 30000.0, 0, 0, 'open')
+        broker._fill('SELL', 33000.0, 1, 1, 'open')
+        trades = [{'type': 'BUY', 'price': 30000.0}, {'type': 'SELL', 'price': 33000.0}]
+        report = RobustnessAnalyzer(n_paths=10, workers=1).bootstrap_trades(trades, slippage=0, fee_jitter=0)
+        self.assertAlmostEqual(report['total_return']['median'], broker.balance / 10000 - 1, places=12)
+
+    def test_path_metrics_match_known_values(self):
+        """Testa retorno e drawdown num caminho conhecido"""
+        metrics = path_metrics(np.array([[0.1, -0.5, 0.2]]))
+        self.assertAlmostEqual(metrics['total_return'][0], 1.1 * 0.5 * 1.2 - 1)
+        self.assertAlmostEqual(metrics['max_drawdown'][0], 0.5)
+
+    def test_block_bootstrap(self):
+        """Testa o block bootstrap sobre retornos diários"""
+        returns = np.random.default_rng(5).normal(0.001, 0.02, 500)
+        report = RobustnessAnalyzer(n_paths=500, workers=1).bootstrap_returns(returns)
+        self.assertEqual(report['method'], 'blocks')
+        self.assertGreater(report['sharpe']['std'], 0)
+
+class TestMetrics(unittest.TestCase):
+    def test_drawdown_and_duration(self):
+        """Testa drawdown e duração em curvas conhecidas, processadas em lote"""
+        equity = np.array([[100, 120, 90, 60, 130, 110],
+                           [100, 100, 100, 100, 100, 100]], dtype=float)
+        metrics = compute_metrics(equity, exposure=np.array([[0, 1, 1, 1, 0, 0]] * 2))
+        np.testing.assert_allclose(metrics['max_drawdown'], [0.5, 0.0])
+        np.testing.assert_array_equal(metrics['max_drawdown_duration'], [2, 0])
+        np.testing.assert_allclose(metrics['total_return'], [0.1, 0.0])
+        np.testing.assert_allclose(metrics['exposure_time'], [0.5, 0.5])
+        self.assertEqual(metrics['sharpe'][1], 0)
+
+        single = compute_metrics(equity[0])
+        self.assertAlmostEqual(single['max_drawdown'], 0.5)
+
+    def test_annualization_follows_timeframe(self):
+        """Testa se a anualização usa o número de candles por ano do timeframe"""
+        self.assertEqual(periods_per_year('1d'), 365)
+        self.assertEqual(periods_per_year('1h'), 365 * 24)
+        # 365 candles de 1h com 1% de retorno total: anualizado bem acima de 1%
+        equity = np.linspace(1, 1.01, 366)
+        hourly = compute_metrics(equity, periods_per_year=periods_per_year('1h'))
+        self.assertAlmostEqual(hourly['annual_return'], 1.01 ** 24 - 1, places=9)
+
+    def test_trade_metrics(self):
+        """Testa profit factor, MAE/MFE e permanência das operações"""
+        high = np.array([10, 12, 11, 13, 9, 8, 15])
+        low = np.array([9, 8, 10, 11, 7, 6, 14])
+        # O candle de saída só contribui com o preço de execução (a abertura)
+        result = trade_metrics(entry_index=[1, 4, 6], exit_index=[3, 6, 6], entry_price=[10, 8, 14.5],
+                               exit_price=[12, 7, 14.5], high=high, low=low)
+        np.testing.assert_allclose(result['mfe'], [0.2, 9 / 8 - 1, 0])
+        np.testing.assert_allclose(result['mae'], [-0.2, 6 / 8 - 1, 0])
+        np.testing.assert_array_equal(result['holding_periods'], [2, 2, 0])
+        self.assertAlmostEqual(result['profit_factor'], 0.2 / 0.125)
+        self.assertEqual(result['winning_trades'], 1)
+
+        # Compra no fechamento de um candle de 50 a 200: a faixa dele aconteceu antes da entrada.
+        # Venda no fechamento: o candle de saída foi mantido inteiro; com tick, só o preço conta
+        high = np.array([200, 110, 130])
+        low = np.array([50, 95, 90])
+        result = trade_metrics(entry_index=[0, 0], exit_index=[2, 2], entry_price=[100, 100], exit_price=[105, 105],
+                               high=high, low=low, entry_fill=['close', 'close'], exit_fill=['close', 'tick'])
+        np.testing.assert_allclose(result['mfe'], [0.3, 0.1])
+        np.testing.assert_allclose(result['mae'], [-0.1, -0.05])
+
+        # Posição aberta no fim e venda sem compra não desalinham os pares
+        trades = [{'type': 'SELL', 'position': 0, 'price': 1}, {'type': 'BUY', 'position': 1, 'price': 10},
+                  {'type': 'SELL', 'position': 1, 'price': 11}, {'type': 'BUY', 'position': 2, 'price': 12}]
+        self.assertEqual([(b['price'], s['price']) for b, s in closed_trades(trades)], [(10, 11)])
+
+class Crash(BaseException):
+    """Queda do processo simulada (não é capturada pelos except Exception do Trader)"""
+
+class FakeBinanceClient:
+    """Cliente local que imita as chamadas da python-binance usadas pelo Trader"""
+    def __init__(self, price=30000.0):
+        self.price = price
+        self.open_orders = {}
+        self.by_client_id = {}
+        self.failures = {}  # (lado, tipo) -> (exceção, levantada depois de a ordem chegar à exchange)
+        self.calls = []
+        self.next_id = 1
+
+    def get_symbol_ticker(self, symbol):
+        return {'symbol': symbol, 'price': str(self.price)}
+
+    def create_order(self, **params):
+        self.calls.append(('create_order', params))
+        failure = self.failures.pop((params['side'], params['type']), None)
+        if failure is not None and not failure[1]:
+            raise failure[0]
+        order = {'orderId': self.next_id, 'clientOrderId': params.get('newClientOrderId', ''),
+                 'price': params.get('price', '0'), 'type': params['type'], 'side': params['side'],
+                 'status': 'FILLED' if params['type'] == 'MARKET' else 'NEW'}
+        self.next_id += 1
+        if params['type'] != 'MARKET':
+            self.open_orders[order['orderId']] = order
+        self.by_client_id[order['clientOrderId']] = order
+        if failure is not None:
+            raise failure[0]
+        return order
+
+    def get_open_orders(self, symbol):
+        self.calls.append(('get_open_orders', symbol))
+        return list(self.open_orders.values())
+
+    def get_order(self, symbol, origClientOrderId):
+        self.calls.append(('get_order', origClientOrderId))
+        if origClientOrderId not in self.by_client_id:
+            raise BinanceAPIException(None, 400, '{"code": -2013, "msg": "Order does not exist."}')
+        return self.by_client_id[origClientOrderId]
+
+    def cancel_order(self, symbol, orderId):
+        self.calls.append(('cancel_order', orderId))
+        order = self.open_orders.pop(orderId)
+        order['status'] = 'CANCELED'
+        return order
+
+    def fill(self, order_id):
+        """Executa uma ordem aberta (ex.: stop ou alvo atingido)"""
+        order = self.open_orders.pop(order_id)
+        order['status'] = 'FILLED'
+
+class TestPositionJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.client = FakeBinanceClient()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def restart(self, **kwargs):
+        """Simula um reinício: novo journal e novo Trader sobre o mesmo diretório"""
+        self.client.calls.clear()
+        return Trader(client=self.client, journal=PositionJournal(self.tmp.name, **kwargs))
+
+    def test_restart_restores_position_without_double_entry(self):
+        """Testa se após uma queda o bot continua LONG e não compra de novo"""
+        trader = self.restart()
+        trader.place_buy_order(self.client.price)
+        self.assertEqual(len(self.client.open_orders), 2)
+
+        restarted = self.restart()
+        self.assertEqual(restarted.check_position(), 'LONG')
+        self.assertEqual([c[0] for c in self.client.calls], ['get_open_orders'])
+        self.assertIsNone(restarted.place_buy_order(self.client.price))
+        self.assertEqual(len(self.client.open_orders), 2)
+
+    def test_restart_after_protective_fill_goes_flat(self):
+        """Testa se um stop/alvo executado durante a queda encerra a posição e cancela a outra perna"""
+        self.restart().place_buy_order(self.client.price)
+        take_profit = next(o for o in self.client.open_orders.values() if o['type'] == 'LIMIT')
+        self.client.fill(take_profit['orderId'])
+
+        restarted = self.restart()
+        self.assertIsNone(restarted.check_position())
+        self.assertEqual(self.client.open_orders, {})
+
+    def test_restart_after_failed_protection_stays_long(self):
+        """Testa se a compra executada com falha nas ordens de proteção continua LONG após reiniciar"""
+        self.client.failures[('SELL', 'STOP_LOSS_LIMIT')] = (Exception('timeout'), False)
+        self.restart().place_buy_order(self.client.price)
+
+        restarted = self.restart()
+        self.assertEqual(restarted.check_position(), 'LONG')
+        self.assertIsNone(restarted.place_buy_order(self.client.price))
+        self.assertFalse(any(c[0] == 'create_order' for c in self.client.calls))
+
+    def test_restart_during_exit_only_goes_flat_on_confirmed_fill(self):
+        """Testa quedas entre a intenção de venda e o envio, e entre o envio e o registro da venda"""
+        self.restart().place_buy_order(self.client.price)
+        trader = self.restart()
+        self.client.failures[('SELL', 'MARKET')] = (Crash(), False)
+        with self.assertRaises(Crash):
+            trader.place_sell_order()
+        self.assertEqual(self.client.open_orders, {})  # Proteções já canceladas
+
+        # A venda nunca chegou à exchange: a posição continua aberta
+        trader = self.restart()
+        self.assertEqual(trader.check_position(), 'LONG')
+        self.assertIsNone(trader.place_buy_order(self.client.price))
+
+        # Agora a venda executa, mas o processo cai antes de registrá-la
+        self.client.failures[('SELL', 'MARKET')] = (Crash(), True)
+        with self.assertRaises(Crash):
+            trader.place_sell_order()
+        self.assertIsNone(self.restart().check_position())
+
+    def test_snapshot_and_torn_tail_recovery(self):
+        """Testa a recuperação de snapshot + final do journal com a última linha incompleta"""
+        journal = PositionJournal(self.tmp.name, snapshot_every=5)
+        for i in range(12):
+            journal.record('order', client_id=f'bot{i}-sl', role='sl', order_id=i)
+        journal.sync()
+        with open(journal.journal_path, 'ab') as f:
+            f.write(b'{"seq": 13, "kind": "posi')
+
+        recovered = PositionJournal(self.tmp.name).state
+        self.assertEqual(recovered['seq'], 12)
+        self.assertEqual(len(recovered['orders']), 12)
+
+class TestIncrementalTraining(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.df = DataCollector().calculate_indicators(synthetic_ohlcv(LOOKBACK_PERIOD + 260, seed=7)).dropna()
+        self.df = self.df.reset_index(drop=True)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_resumes_from_saved_weights_on_new_bars_only(self):
+        """Testa se o retreino parte dos pesos salvos e usa só candles novos mais o replay"""
+        base = self.df.iloc[:-5]
+        model = TradingModel()
+        X, y = model.prepare_data(base)
+        model.model.fit(X[:4], y[:4], epochs=1, verbose=0)
+        model.last_trained_timestamp = base['timestamp'].iloc[-1]
+        model.save(self.tmp.name)
+        scaler_max = model.scaler.data_max_.copy()
+
+        resumed = TradingModel()
+        self.assertTrue(resumed.load(self.tmp.name))
+        for saved, loaded in zip(model.model.get_weights(), resumed.model.get_weights()):
+            np.testing.assert_array_equal(saved, loaded)
+
+        with mock.patch.object(resumed.model, 'fit', wraps=resumed.model.fit) as fit:
+            history = resumed.train_incremental(self.df, epochs=2, directory=self.tmp.name, seed=0)
+        # 5 janelas novas + 5 de replay, 20% para validação
+        self.assertEqual(history.params['steps'], 1)
+        self.assertEqual(len(history.history['val_loss']), 2)
+        # As janelas de validação (as mais novas) também entram no treino, numa passada final
+        validation_X = fit.call_args_list[0].kwargs['validation_data'][0]
+        np.testing.assert_array_equal(fit.call_args_list[-1].args[0], validation_X)
+        self.assertEqual(resumed.last_trained_timestamp, self.df['timestamp'].iloc[-1])
+        self.assertIsNone(resumed.train_incremental(self.df, directory=self.tmp.name))
+
+        # Faixa do scaler só muda se os dados novos passarem da tolerância
+        np.testing.assert_array_equal(resumed.scaler.data_max_, scaler_max)
+
+        # Pesos salvos com outra janela ou outras features não são carregados
+        with self.assertRaises(ValueError):
+            TradingModel(lookback=LOOKBACK_PERIOD + 1).load(self.tmp.name)
+
+@pytest.mark.slow
+class TestHyperparameterSearch(unittest.TestCase):
+    def test_search_persists_and_resumes(self):
+        """Testa se a busca grava os trials e, ao retomar, executa apenas os novos"""
+        df = DataCollector().calculate_indicators(synthetic_ohlcv(320, seed=7)).dropna().reset_index(drop=True)
+        space = dict(HPO_SEARCH_SPACE, units=[4], depth=[1, 2], dense_units=[4], lookback=[10, 20],
+                     batch_size=[32])
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'search.db')
+            first = HyperparameterSearch(df, n_trials=2, workers=2, db_path=db_path, rungs=[1, 2],
+                                         space=space).run()
+            self.assertEqual(len(first), 2)
+
+            search = HyperparameterSearch(df, n_trials=3, workers=2, db_path=db_path, rungs=[1, 2],
+                                          space=space)
+            self.assertEqual([trial_id for trial_id, _ in search.enqueue()], [2])
+            best = search.run()
+            self.assertEqual(len(best), 3)
+            self.assertEqual(best, sorted(best, key=lambda t: t['val_loss']))
+            self.assertEqual(search.threads_per_worker, max(1, (os.cpu_count() or 1) // 2))
+
+@pytest.mark.slow
+class TestQuantization(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Converte um único modelo para todos os testes da classe"""
+        cls.model = TradingModel()
+        rng = np.random.default_rng(42)
+        cls.X = rng.random((40, LOOKBACK_PERIOD, len(FEATURES)), dtype=np.float32)
+        cls.y = rng.integers(0, 2, len(cls.X))
+        cls.model.scaler.fit(rng.random((100, len(FEATURES))))
+        cls.quantized = QuantizedModel.from_trading_model(cls.model, cls.X, mode='int8')
+
+    def test_quantized_predictions_close_to_float(self):
+        """Testa se o modelo int8 acompanha o modelo float"""
+        report = evaluate_drift(self.model, self.quantized, self.X, self.y, repeats=1)
+        self.assertEqual(report['samples'], len(self.X))
+        self.assertLess(report['max_probability_diff'], 0.05)
+        self.assertGreater(report['quantized_windows_per_second'], 0)
+
+    def test_deploy_refuses_high_drift(self):
+        """Testa se o deploy recusa artefatos acima do limite de desvio"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'model.tflite')
+            with self.assertRaises(ValueError):
+                deploy_quantized_model(self.model, self.X, self.X, self.y, path, max_drift=-1)
+            self.assertFalse(os.path.exists(path))
+
+    def test_deploy_reload_and_serve(self):
+        """Testa o deploy de um modelo com desvio baixo, a recarga do .tflite e o uso pelo ModelStrategy"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'model.tflite')
+            quantized, report = deploy_quantized_model(self.model, self.X, self.X, self.y, path, mode='float32')
+            self.assertLessEqual(report['accuracy_drift'], 0.02)
+
+            reloaded = QuantizedModel.load_for_model(self.model, path)
+            self.assertEqual(reloaded.mode, 'float32')
+            np.testing.assert_allclose(reloaded.predict_batch(self.X), quantized.predict_batch(self.X), atol=1e-6)
+            np.testing.assert_allclose(reloaded.predict_batch(self.X), self.model.predict_batch(self.X), atol=1e-5)
+
+            strategy = ModelStrategy(self.model, quantized=True, quantized_path=path)
+            self.assertIsInstance(strategy.predictor, QuantizedModel)
+            np.testing.assert_array_equal(strategy.predictor.predict_batch(self.X), reloaded.predict_batch(self.X))
+
+    def test_artifact_follows_model_weights(self):
+        """Testa se o artefato só serve os pesos de origem, inclusive com o modelo carregado depois da estratégia"""
+        window = np.random.default_rng(1).random((LOOKBACK_PERIOD, len(FEATURES)))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'model.tflite')
+            deploy_quantized_model(self.model, self.X, self.X, self.y, path, mode='float32')
+            self.model.last_trained_timestamp = pd.Timestamp('2024-01-01')
+            self.model.save(os.path.join(tmp, 'models'))
+
+            # Como no LiveSession: a estratégia é criada antes de o modelo carregar os pesos salvos
+            model = TradingModel()
+            strategy = ModelStrategy(model, quantized=True, quantized_path=path)
+            with self.assertRaises(ValueError):
+                strategy.predictor
+            self.assertTrue(model.load(os.path.join(tmp, 'models')))
+            self.assertAlmostEqual(float(strategy.predictor.predict(window)), float(self.model.predict(window)),
+                                   places=5)
+
+            # Pesos alterados (ex.: retreino) sem reexportar: o artefato é recusado
+            model.model.set_weights([weights + 0.01 for weights in model.model.get_weights()])
+            with self.assertRaises(ValueError):
+                strategy.predictor
+
+    def test_live_session_reexports_after_retraining(self):
+        """Testa se o ciclo ao vivo reexporta o artefato após o treino e decide com ele"""
+        exchange = LocalExchange(synthetic_ohlcv(300, seed=7))
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = PositionJournal(os.path.join(tmp, 'journal'))
+            collector = DataCollector(exchange=exchange)
+            session = LiveSession(collector=collector, trader=Trader(client=exchange, journal=journal),
+                                  model=TradingModel(units=[4], dense_units=4, lookback=10),
+                                  monitor=MemoryMonitor(trace=False),
+                                  feature_store=FeatureStore(root=os.path.join(tmp, 'features'), collector=collector),
+                                  model_dir=os.path.join(tmp, 'models'), replay_dir=tmp, history_bars=300)
+            strategy = session.engine.strategy
+            strategy.quantized, strategy.quantized_path = True, os.path.join(tmp, 'model.tflite')
+            with mock.patch.object(session.model, 'train', lambda X, y: session.model.model.fit(X, y, verbose=0)):
+                decision = session.run_cycle()
+            journal.close()
+
+            self.assertIsNotNone(decision['probability'])
+            self.assertTrue(strategy.quantized_model.matches(session.model))
+            self.assertTrue(os.path.exists(strategy.quantized_path + '.json'))
+
+def make_market_messages(n, seed=3, symbol='BTC/USDT'):
+    """Feed local sintético: um snapshot do livro a cada cinco mensagens, o resto trades"""
+    rng = np.random.default_rng(seed)
+    messages = []
+    for i in range(n):
+        timestamp = (i + 1) * 1_000_000_000
+        mid = 30000 + rng.normal()
+        if i % 5 == 0:
+            messages.append({'type': 'depth', 'symbol': symbol, 'timestamp': timestamp,
+                             'bids': [(mid - 0.5 - j, rng.uniform(0.1, 2)) for j in range(10)],
+                             'asks': [(mid + 0.5 + j, rng.uniform(0.1, 2)) for j in range(10)]})
+        else:
+            messages.append({'type': 'trade', 'symbol': symbol, 'timestamp': timestamp, 'price': mid,
+                             'amount': rng.uniform(0.001, 1), 'side': 1 if rng.random() < 0.5 else -1})
+    return messages
+
+class TestMicrostructure(unittest.TestCase):
+    def test_buffers_bounded_and_sums_match(self):
+        """Testa se os buffers não crescem e as somas incrementais batem com o recálculo"""
+        book = SymbolMicrostructure(depth_capacity=50, trade_capacity=200)
+        for message in make_market_messages(5000):
+            if message['type'] == 'depth':
+                book.on_depth(message['timestamp'], message['bids'], message['asks'])
+            else:
+                book.on_trade(message['timestamp'], message['price'], message['amount'], message['side'])
+
+        self.assertEqual(len(book.trades), 200)
+        self.assertEqual(len(book.depth), 50)
+        trades = book.trades.ordered()
+        self.assertTrue((np.diff(trades['timestamp']) > 0).all())
+        expected_flow = (trades['side'] * trades['amount']).sum() / trades['amount'].sum()
+        expected_vwap = (trades['price'] * trades['amount']).sum() / trades['amount'].sum()
+        features = book.features()
+        self.assertAlmostEqual(features['trade_flow_imbalance'], expected_flow, places=9)
+        self.assertAlmostEqual(features['vwap'], expected_vwap, places=6)
+
+    def test_candle_features_and_throughput(self):
+        """Testa a agregação por candle no DataFrame de indicadores e a vazão do replay"""
+        store = MicrostructureStore(depth_capacity=1000, trade_capacity=4000)
+        rate = replay(store, make_market_messages(5000))
+        self.assertGreater(rate, 5000)
+
+        # Candles de um minuto: só os que caem no período do feed (5000 s) recebem valores
+        df = synthetic_ohlcv(120, seed=7)
+        df['timestamp'] = pd.to_datetime(np.arange(len(df)) * 60, unit='s')
+        df = DataCollector().calculate_indicators(df, microstructure=store.get('BTC/USDT'), timeframe='1min')
+        covered = df['timestamp'] < pd.Timestamp(5000, unit='s')
+        self.assertFalse(df.loc[covered, 'trade_flow_imbalance'].isna().any())
+        self.assertTrue(df.loc[~covered, 'ob_imbalance'].isna().all())
+        self.assertTrue(df.loc[covered, 'ob_imbalance'].between(-1, 1).all())
+
+    def test_one_sided_book(self):
+        """Testa livros com um lado vazio: spread e mid NaN, sem contaminar a agregação dos candles"""
+        book = SymbolMicrostructure(depth_capacity=10, trade_capacity=10)
+        book.on_depth(0, [(99.0, 1.0)], [(101.0, 3.0)])
+        book.on_depth(1, [(99.0, 2.0)], [])
+        features = book.features()
+        self.assertTrue(np.isnan(features['spread']) and np.isnan(features['spread_bps']))
+        self.assertEqual(features['ob_imbalance'], 1.0)
+        book.on_depth(2, [], [(101.0, 1.0)])
+        book.on_trade(2, 100.0, 1.0, 1)
+
+        candles = book.candle_features([0], 10)
+        self.assertAlmostEqual(candles['spread_bps'][0], 2 / 100 * 1e4)
+        self.assertAlmostEqual(candles['ob_imbalance'][0], (-0.5 + 1 - 1) / 3)
+        self.assertAlmostEqual(candles['vwap_deviation'][0], 0.0)
+
+class TestResultsStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = ResultsStore(os.path.join(self.tmp.name, 'results.db'))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_query_filters_and_ranks_runs(self):
+        """Testa filtros e ordenação das execuções direto no banco"""
+        rng = np.random.default_rng(0)
+        sharpes = rng.normal(0, 1, 300)
+        for i, sharpe in enumerate(sharpes):
+            self.store.record_run('sweep', {'lookback': int(i % 3)}, {'sharpe': sharpe, 'total_trades': i,
+                                                                       'profit_factor': float('inf')})
+
+        top = self.store.query({'sharpe': ('>', 1.0)}, order_by='sharpe', limit=5)
+        self.assertEqual(list(top['sharpe']), sorted(sharpes[sharpes > 1.0], reverse=True)[:5])
+        self.assertEqual(self.store.count({'config_hash': top['config_hash'][0]}), 100)
+        self.assertEqual(sum(len(chunk) for chunk in self.store.iter_runs(chunksize=64)), 300)
+        with self.assertRaises(ValueError):
+            self.store.query({'sharpe; DROP TABLE runs': 1})
+
+    def test_trades_and_equity_round_trip(self):
+        """Testa se operações e curva de patrimônio voltam iguais do banco"""
+        trades = [{'timestamp': pd.Timestamp('2024-01-01'), 'type': 'BUY', 'price': 100.0, 'amount': 1.0,
+                   'fee': 0.1, 'balance': 0.0, 'bar': 0},
+                  {'timestamp': pd.Timestamp('2024-01-03'), 'type': 'SELL', 'price': 110.0, 'amount': 1.0,
+                   'fee': 0.11, 'balance': 109.89, 'bar': 2}]
+        equity = np.array([100.0, 105.0, 109.89])
+        run_id = self.store.record_run('backtest', {'lookback': 60}, {'total_trades': 2, 'return_percentage': 9.89},
+                                       trades, equity, [1, 1, 0])
+
+        stored = self.store.get_trades(run_id)
+        self.assertEqual(list(stored['type']), ['BUY', 'SELL'])
+        self.assertEqual(list(stored['timestamp']), [t['timestamp'] for t in trades])
+        stored_equity, exposure = self.store.get_equity(run_id)
+        np.testing.assert_array_equal(stored_equity, equity)
+        np.testing.assert_array_equal(exposure, [1, 1, 0])
+        self.assertEqual(self.store.get_params(run_id), {'lookback': 60})
+
+class TestSignalConditions(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.indicators = DataCollector().calculate_indicators(synthetic_ohlcv(2000, seed=3))
+        cls.df = StrategyTester.generate_signals(cls.indicators.copy())
+
+    def test_bitmasks_match_conditions(self):
+        """Testa se os bitmasks decodificam para as condições calculadas candle a candle"""
+        df, ind = self.df, self.indicators
+        for i in range(201, len(df), 97):
+            row, prev = ind.iloc[i], ind.iloc[i - 1]
+            buy = {'ABOVE_200MA': row['close'] > row['sma_200'],
+                   'RSI_OVERSOLD': row['rsi'] < 30,
+                   'MACD_CROSS_UP': prev['macd'] < prev['signal'] and row['macd'] > row['signal'],
+                   'PRICE_NEAR_BB_LOW': row['close'] <= row['bollinger_lower'] * 1.02,
+                   'VOLUME_INCREASE': row['volume'] > prev['volume'] * 1.5,
+                   'UPTREND': row['sma_50'] > row['sma_200']}
+            sell = {'RSI_OVERBOUGHT': row['rsi'] > 70,
+                    'MACD_CROSS_DOWN': prev['macd'] > prev['signal'] and row['macd'] < row['signal'],
+                    'PRICE_NEAR_BB_HIGH': row['close'] >= row['bollinger_upper'] * 0.98,
+                    'VOLUME_DECREASE': row['volume'] < prev['volume'] * 0.7,
+                    'DOWNTREND': row['sma_50'] < row['sma_200']}
+            self.assertEqual(decode_conditions(df['buy_conditions'].iloc[i], BUY_CONDITIONS),
+                             [name for name, active in buy.items() if active])
+            self.assertEqual(decode_conditions(df['sell_conditions'].iloc[i], SELL_CONDITIONS),
+                             [name for name, active in sell.items() if active])
+
+        signals = df[df['signal'] != 0]
+        self.assertGreater(len(signals), 0)
+        self.assertTrue((np.diff(signals['signal'].values) != 0).all())
+        for _, row in signals[signals['signal'] == 1].iterrows():
+            reasons = signal_reasons(row)
+            self.assertTrue(reasons.startswith('COMPRA: ABOVE_200MA'))
+            self.assertGreaterEqual(len(reasons.split(', ')), 4)
+
+    def test_condition_combinations(self):
+        """Testa a agregação das combinações de condições pelas operações fechadas"""
+        combos = StrategyTester.condition_combinations(self.df)
+        close, signal = self.df['close'].values, self.df['signal'].values
+        entries, exits = np.flatnonzero(signal == 1), np.flatnonzero(signal == -1)
+        profits = close[exits] / close[entries[:len(exits)]] - 1
+        self.assertEqual(combos['trades'].sum(), len(exits))
+        self.assertEqual(combos['winning_trades'].sum(), (profits > 0).sum())
+        self.assertTrue(all(c.startswith('ABOVE_200MA') for c in combos['conditions']))
+
+class TestLabeling(unittest.TestCase):
+    def test_first_passage_matches_brute_force(self):
+        """Testa a busca do primeiro toque contra a varredura candle a candle"""
+        rng = np.random.default_rng(5)
+        for _ in range(50):
+            n, max_holding = int(rng.integers(1, 120)), int(rng.integers(1, 70))
+            values = np.cumsum(rng.normal(size=n))
+            levels = values + rng.uniform(-1, 3, n)
+            expected = [next((j for j in range(i + 1, min(i + max_holding, n - 1) + 1) if values[j] >= levels[i]), -1)
+                        for i in range(n)]
+            self.assertEqual(list(first_passage(values, levels, max_holding, 'up')), expected)
+
+    def test_triple_barrier_outcomes(self):
+        """Testa take-profit, stop-loss (inclusive no empate), tempo esgotado e rótulos pendentes"""
+        close = np.array([100, 101, 102, 100, 100, 100, 100, 100.0])
+        high = close.copy()
+        low = close.copy()
+        high[1], low[4] = 104, 97  # Candle 1 toca o TP da entrada 0; candle 4 toca o stop das entradas 2 e 3
+        high[4] = 110  # ...e também o TP delas no mesmo candle
+        labels = triple_barrier_labels(high, low, close, take_profit=0.03, stop_loss=0.02, max_holding=2)
+        self.assertEqual(labels['barrier'][0], 1)
+        self.assertEqual(labels['exit_index'][0], 1)
+        self.assertEqual(labels['barrier'][2], -1)
+        self.assertEqual(labels['barrier'][3], -1)
+        self.assertEqual(labels['barrier'][5], 0)
+        self.assertEqual(labels['return'][5], 0)
+        self.assertTrue(np.isnan(labels['barrier'][7]))
+
+        returns = forward_returns(close, [1, 3])
+        self.assertAlmostEqual(returns['forward_return_3'][0], 0.0)
+        self.assertTrue(returns['forward_return_3'][5:].isna().all())
+
+    def test_model_uses_selected_target(self):
+        """Testa se prepare_data usa o alvo configurado e descarta janelas sem rótulo"""
+        df = DataCollector().calculate_indicators(synthetic_ohlcv(300, seed=7))
+        lookback = 20
+        model = TradingModel(units=[4], dense_units=4, lookback=lookback, target='triple_barrier')
+        X, y = model.prepare_data(df)
+        # Janelas com indicadores em aquecimento (NaN) também ficam de fora
+        features, targets = df[FEATURES].values, np.arange(lookback, len(df))
+        complete = np.array([not np.isnan(features[t - lookback:t]).any() for t in targets])
+        expected = make_labels(df, 'triple_barrier')[targets - 1]
+        keep = complete & ~np.isnan(expected)
+        self.assertEqual(len(X), keep.sum())
+        self.assertFalse(np.isnan(X).any())
+        np.testing.assert_array_equal(y, expected[keep])
+
+        direction = TradingModel(units=[4], dense_units=4, lookback=lookback)
+        _, y = direction.prepare_data(df)
+        close = df['close'].values
+        np.testing.assert_array_equal(y, (close[targets] > close[targets - 1])[complete].astype(int))
+
+class TestLiveSession(unittest.TestCase):
+    def test_monitor_alerts_on_sustained_growth(self):
+        """Testa se o alerta só dispara quando a memória cresce em todos os ciclos da janela"""
+        monitor = MemoryMonitor(alert_cycles=4, alert_growth_mb=10, trace=False)
+        readings = [100, 104, 101, 103, 108, 115, 120, 121, 121]
+        with mock.patch('memory_monitor.current_rss_mb', side_effect=readings):
+            alerts = [monitor.sample()['alert'] for _ in readings]
+        self.assertEqual(alerts, [False] * 5 + [True, False, False, False])
+        self.assertLessEqual(len(monitor.history), 4)
+
+    def test_monitor_counts_objects_every_n_samples(self):
+        """Testa se a contagem de objetos (com gc.collect) só roda a cada N amostras"""
+        monitor = MemoryMonitor(trace=False, object_count_every=3)
+        with mock.patch('memory_monitor.gc.collect') as collect:
+            samples = [monitor.sample() for _ in range(7)]
+        self.assertEqual(collect.call_count, 3)
+        self.assertEqual([s['objects'] is not None for s in samples], [True, False, False] * 2 + [True])
+        self.assertEqual(monitor.summary()['objects_end'], samples[-1]['objects'])
+
+        disabled = MemoryMonitor(trace=False, object_count_every=0)
+        with mock.patch('memory_monitor.gc.collect') as collect:
+            disabled.sample()
+        collect.assert_not_called()
+        self.assertIsNone(disabled.summary()['objects_start'])
+
+    def test_first_cycle_collects_before_freezing(self):
+        """Testa se o lixo cíclico do primeiro ciclo é coletado antes de o heap ser congelado"""
+        session = LiveSession(collector=mock.Mock(), trader=mock.Mock(), model=LiveMomentumModel(),
+                              feature_store=mock.Mock(), monitor=mock.Mock())
+        with mock.patch('main.gc') as gc_mock, mock.patch.object(session, '_trade'):
+            session.run_cycle()
+            session.run_cycle()
+        self.assertEqual([name for name, _, _ in gc_mock.method_calls], ['collect', 'freeze'])
+
+    def test_swap_model_restores_saved_weights(self):
+        """Testa se a troca de modelo carrega os pesos salvos e falha sem modelo salvo"""
+        def factory():
+            return TradingModel(units=[4], dense_units=4, lookback=10)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            session = LiveSession(collector=mock.Mock(), trader=mock.Mock(), model=factory(),
+                                  feature_store=mock.Mock(), monitor=MemoryMonitor(trace=False),
+                                  model_dir=os.path.join(tmp, 'models'), replay_dir=tmp)
+            with self.assertRaises(RuntimeError):
+                session.swap_model(factory)
+
+            model = factory()
+            model.last_trained_timestamp = pd.Timestamp('2024-01-01')
+            model.save(session.model_dir)
+            weights = model.model.get_weights()
+            session.swap_model(factory)
+            for restored, saved in zip(session.model.model.get_weights(), weights):
+                np.testing.assert_array_equal(restored, saved)
+            self.assertEqual(session.model.last_trained_timestamp, pd.Timestamp('2024-01-01'))
+            self.assertIs(session.engine.strategy.model, session.model)
+
+    def test_decides_on_closed_candles_and_appends_recording(self):
+        """Testa se o ciclo ao vivo ignora o candle em formação e acumula a gravação para replay"""
+        df = synthetic_ohlcv(300, seed=7)
+        timestamps = df['timestamp'].values.astype('datetime64[ns]').astype(np.int64)
+        half_day = 12 * 3600 * 10 ** 9
+        exchange = LocalExchange(df, start=250)
+        clock = SimulatedClock(timestamps[250] + half_day)  # Candle 250 ainda aberto
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = PositionJournal(os.path.join(tmp, 'journal'))
+            collector = DataCollector(exchange=exchange)
+            session = LiveSession(collector=collector, trader=Trader(client=exchange, journal=journal),
+                                  model=LiveMomentumModel(), monitor=MemoryMonitor(trace=False),
+                                  feature_store=FeatureStore(root=os.path.join(tmp, 'features'), collector=collector),
+                                  model_dir=os.path.join(tmp, 'models'), replay_dir=tmp, history_bars=260,
+                                  clock=clock)
+            self.assertEqual(session.run_cycle()['timestamp'], timestamps[249])
+            exchange.advance()
+            clock.advance_to(timestamps[251] + half_day)
+            self.assertEqual(session.run_cycle()['timestamp'], timestamps[250])
+            journal.close()
+
+            feed = ReplayFeed.from_files(os.path.join(tmp, 'BTCUSDT_1d.npz'))
+            np.testing.assert_array_equal([c.timestamp for c in feed.candles], timestamps[:251])
+
+    def test_client_exits_follow_trader_position(self):
+        """Testa a saída por tempo pelo Trader, sem recompra no candle da saída e com a entrada do journal"""
+        df = synthetic_ohlcv(300, seed=7)
+        df.loc[250:, 'close'] = df.loc[250, 'close']  # Preço parado: só a saída por tempo dispara
+        exchange = LocalExchange(df, start=250)
+        day = 86400 * 10 ** 9
+        start = time.time_ns()  # O journal grava o horário real das ordens
+        clock = SimulatedClock(start)
+        fired = []
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = PositionJournal(os.path.join(tmp, 'journal'))
+            collector = DataCollector(exchange=exchange)
+            feature_store = FeatureStore(root=os.path.join(tmp, 'features'), collector=collector)
+
+            def session_for(trader):
+                exit_to_trader = trader_exit_handler(trader)
+                return LiveSession(collector=collector, trader=trader, model=BuyAndHoldModel(),
+                                   monitor=MemoryMonitor(trace=False), feature_store=feature_store,
+                                   model_dir=os.path.join(tmp, 'models'), replay_dir=tmp, history_bars=260,
+                                   clock=clock,
+                                   exit_engine=ExitEngine(on_exit=lambda e: (fired.append(e), exit_to_trader(e))))
+
+            with mock.patch('main.MAX_HOLDING_SECONDS', 2 * 24 * 3600):
+                session = session_for(Trader(client=exchange, journal=journal))
+                self.assertEqual(session.run_cycle()['action'], 'BUY')
+                self.assertEqual(list(session.exit_engine.positions), [0])
+                clock.advance_to(start + day // 24)
+                self.assertIsNone(session.run_cycle())  # Mesmo candle: nenhuma nova decisão
+
+                # Reinício: a posição volta ao exit_engine com o horário da ordem de entrada
+                trader = Trader(client=exchange, journal=journal)
+                entry_time = int(trader.entry_order()['ts'] * 1e9)
+                session = session_for(trader)
+                exchange.advance()
+                clock.advance_to(start + day)
+                self.assertEqual(session.run_cycle()['action'], 'HOLD')
+                self.assertEqual(session.exit_engine.books[SYMBOL].deadlines[0][0], entry_time + 2 * day)
+
+                # A saída por tempo vende, e o candle da saída não gera nova compra
+                exchange.advance()
+                clock.advance_to(start + 2 * day + 60 * 10 ** 9)
+                self.assertIsNone(session.run_cycle())
+                self.assertEqual([(e.position_id, e.reason) for e in fired], [(0, 'time')])
+                self.assertIsNone(trader.check_position())
+                self.assertEqual(session.exit_engine.positions, {})
+
+                exchange.advance()
+                clock.advance_to(start + 3 * day)
+                self.assertEqual(session.run_cycle()['action'], 'BUY')
+            journal.close()
+
+    @pytest.mark.slow
+    def test_soak_against_local_exchange(self):
+        """Testa vários ciclos acelerados do processo ao vivo, com troca de modelo, contra a exchange local"""
+        summary = run_soak(cycles=12, history_bars=260, swap_every=5, alert_cycles=50)
+        self.assertEqual(summary['samples'], 12)
+        self.assertEqual(summary['alerts'], 0)
+        self.assertLess(summary['rss_end_mb'] - summary['rss_start_mb'], 200)
+
+class LiveMomentumModel(MomentumModel):
+    """MomentumModel com a interface usada pelo LiveSession (sem treino)"""
+    lookback = 20
+    features = FEATURES
+
+    def train_incremental(self, df, directory=None):
+        return None
+
+class BuyAndHoldModel(LiveMomentumModel):
+    """Sempre acima do limiar de compra e nunca abaixo do de venda"""
+    def predict(self, data):
+        return 0.9
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, 'queue.db')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_lease_expiry_and_idempotent_results(self):
+        """Testa se um job de worker morto volta à fila e se só a primeira conclusão vale"""
+        queue = JobQueue(self.db_path, lease_seconds=0.05)
+        self.assertEqual(len(set(queue.submit('sleep', [{'seconds': 0}, {'seconds': 0}]))), 1)
+
+        first = queue.claim('a')
+        self.assertIsNone(queue.claim('b'))  # Lease ainda válido
+        time.sleep(0.1)
+        second = queue.claim('b')
+        self.assertEqual((second.job_id, second.attempt), (first.job_id, 2))
+        self.assertFalse(queue.heartbeat(first.job_id, 'a'))
+        self.assertTrue(queue.complete(second.job_id, 'b', {'slept': 0}))
+        self.assertFalse(queue.complete(first.job_id, 'a', {'slept': 0}))
+        self.assertEqual(queue.counts(), {'done': 1})
+
+        queue.submit('inexistente', {'x': 1}, max_attempts=2)
+        self.assertEqual(Worker(queue, poll_seconds=0.01).run(), 2)
+        self.assertEqual(queue.counts(), {'done': 1, 'failed': 1})
+
+    @pytest.mark.slow
+    def test_local_workers_scale_and_run_sweeps(self):
+        """Testa a vazão com vários processos e a execução de uma varredura sobre o feature store"""
+        spans = {}
+        for workers in (1, 2):
+            path = os.path.join(self.tmp.name, f'scale_{workers}.db')
+            JobQueue(path).submit('sleep', [{'seconds': 0.2, 'i': i} for i in range(12)])
+            self.assertEqual(run_local(path, workers, poll_seconds=0.05), {'done': 12})
+            results = JobQueue(path).results('sleep')
+            spans[workers] = results['finished_at'].max() - results['started_at'].min()
+        self.assertGreater(spans[1] / spans[2], 1.6)
+
+        store = FeatureStore(root=os.path.join(self.tmp.name, 'features'), collector=DataCollector())
+        store.update(synthetic_ohlcv(1200, seed=3))
+        queue = JobQueue(self.db_path)
+        queue.submit('signal_sweep', expand_grid({'rsi_oversold': [30, 40], 'min_buy_conditions': [3, 4]}))
+        Worker(queue, data_root=store.root).run()
+        results = queue.results('signal_sweep')
+        self.assertEqual(len(results), 4)
+        self.assertTrue((results['trades'] >= 0).all())
+
+        timestamps = synthetic_ohlcv(500, seed=7)['timestamp']
+        folds = walk_forward_payloads(timestamps, n_folds=3, train_bars=300, test_bars=30)
+        self.assertEqual([f['fold'] for f in folds], [0, 1, 2])
+        self.assertEqual(folds[0]['train_end'], str(pd.Timestamp('2020-01-01') + pd.Timedelta(days=410)))
+
+class TestExitEngine(unittest.TestCase):
+    def test_exits_match_bar_by_bar_reference(self):
+        """Testa se stops móveis (percentual e ATR) disparam no mesmo tick de uma varredura ingênua"""
+        rng = np.random.default_rng(1)
+        prices = 30000 * np.exp(np.cumsum(rng.normal(0, 3e-3, 400)))
+        engine = ExitEngine()
+        fired, expected = {}, {}
+        for i, price in enumerate(prices):
+            if i % 5 == 0 and i < 300:
+                if i % 10 == 0:
+                    engine.open_position(i, price, trailing_pct=0.02)
+                    stop = lambda high: high * 0.98
+                else:
+                    engine.open_position(i, price, atr=price * 0.004, atr_multiplier=2.0)
+                    stop = lambda high, d=price * 0.008: high - d
+                high = price
+                for j in range(i, len(prices)):
+                    high = max(high, prices[j])
+                    if prices[j] <= stop(high) * (1 + 1e-12):
+                        expected[i] = j
+                        break
+            for exit in engine.on_tick(price, timestamp=i):
+                fired[exit.position_id] = i
+        self.assertEqual(fired, expected)
+
+    def test_fixed_time_and_closed_positions(self):
+        """Testa stop/alvo fixos, saída por tempo, ATR dos indicadores e posições encerradas por fora"""
+        dispatched = []
+        engine = ExitEngine(on_exit=dispatched.append)
+        candles = synthetic_ohlcv(100, seed=7)
+        candles[['open', 'high', 'low', 'close']] /= 300  # Preços perto de 100
+        atr = atr_from_candles(DataCollector(), candles)
+        engine.open_position('sl', 100, stop_loss=95, take_profit=110)
+        engine.open_position('tp', 100, stop_loss=90, take_profit=105)
+        engine.open_position('time', 100, timestamp=0, max_holding=3)
+        engine.open_position('closed', 100, stop_loss=99)
+        engine.open_position('atr', 100, atr=atr, atr_multiplier=4, atr_trailing=False)
+        engine.close_position('closed')
+        engine.run([Tick(1, 106.0), Tick(2, 94.0), Tick(3, 100.0), Tick(4, 100 - 4 * atr)])
+        self.assertEqual([(e.position_id, e.reason, e.timestamp) for e in dispatched],
+                         [('tp', 'take_profit', 1), ('sl', 'stop_loss', 2), ('time', 'time', 3),
+                          ('atr', 'atr_stop', 4)])
+        self.assertEqual(engine.positions, {})
+
+        # Posição registrada depois da entrada: o stop móvel parte da máxima já vista
+        restarted = ExitEngine()
+        restarted.open_position('restarted', 100, trailing_pct=0.05, high=110)
+        self.assertEqual([e.reason for e in restarted.on_tick(104.0)], ['trailing_stop'])
+
+    def test_heaps_compact_after_closed_positions(self):
+        """Testa se os heaps não crescem com posições encerradas cujos níveis nunca são alcançados"""
+        engine = ExitEngine(compact_fraction=0.5)
+        engine.open_position('live', 100, stop_loss=90, take_profit=110, trailing_pct=0.05, timestamp=0,
+                             max_holding=10 ** 6)
+        for i in range(1000):
+            engine.open_position(i, 100, stop_loss=50, take_profit=200, trailing_pct=0.5, atr=1.0,
+                                 timestamp=i, max_holding=10 ** 6)
+            engine.on_tick(100.0, timestamp=i)
+            engine.close_position(i)
+        book = engine.books[SYMBOL]
+        for heap in (book.stops, book.targets, book.deadlines):
+            self.assertLessEqual(len(heap), 10)
+        self.assertLessEqual(len(book.trailing_pct) + len(book.trailing_atr), 10)
+        self.assertLessEqual(len(book.trailing_pct.by_stop) + len(book.trailing_atr.by_stop), 20)
+
+        exits = engine.on_tick(89.0, timestamp=1000)
+        self.assertEqual([(e.position_id, e.reason) for e in exits], [('live', 'stop_loss')])
+        self.assertEqual(engine.positions, {})
+
+    def test_latency_history_is_bounded(self):
+        """Testa se as latências de despacho guardadas não crescem com o processo"""
+        engine = ExitEngine(latency_history=5)
+        for i in range(20):
+            engine.open_position(i, 100, stop_loss=99)
+            engine.on_tick(98.0)
+        self.assertEqual(len(engine.latencies), 5)
+
 def run_tests():
     """Executa todos os testes"""
     unittest.main(argv=[''], verbosity=2, exit=False)
@@ -1,5 +1,10 @@
 from data_collector import DataCollector
+from feature_store import FeatureStore
 from model import TradingModel
+from metrics import compute_metrics
+from engine import periods_per_year
+from results_store import ResultsStore
+from config import SYMBOL
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
@@ -13,65 +18,124 @@ RSI_OVERBOUGHT = 70
 # Constante para aumento de volume
 VOLUME_INCREASE_THRESHOLD = 1.5
 
+# Condições codificadas como bits (condição i -> bit 1 << i) nas colunas buy_conditions/sell_conditions
+BUY_CONDITIONS = ('ABOVE_200MA', 'RSI_OVERSOLD', 'MACD_CROSS_UP', 'PRICE_NEAR_BB_LOW', 'VOLUME_INCREASE', 'UPTREND')
+SELL_CONDITIONS = ('RSI_OVERBOUGHT', 'MACD_CROSS_DOWN', 'PRICE_NEAR_BB_HIGH', 'VOLUME_DECREASE', 'DOWNTREND')
+ABOVE_200MA_BIT = 1 << BUY_CONDITIONS.index('ABOVE_200MA')
+POPCOUNT = np.array([bin(mask).count('1') for mask in range(1 << 8)], dtype=np.uint8)
+
+def encode_conditions(conditions, names):
+    """Combina séries booleanas (na ordem de names) em um bitmask por candle"""
+    mask = np.zeros(len(conditions[names[0]]), dtype=np.uint8)
+    for bit, name in enumerate(names):
+        mask |= np.asarray(conditions[name], dtype=bool).astype(np.uint8) << bit
+    return mask
+
+def decode_conditions(mask, names):
+    """Nomes das condições ativas em um bitmask"""
+    return [name for bit, name in enumerate(names) if int(mask) >> bit & 1]
+
+def signal_reasons(row):
+    """Texto das razões de um sinal, gerado sob demanda a partir dos bitmasks"""
+    if row['signal'] == 1:
+        return 'COMPRA: ' + ', '.join(decode_conditions(row['buy_conditions'], BUY_CONDITIONS))
+    if row['signal'] == -1:
+        return 'VENDA: ' + ', '.join(decode_conditions(row['sell_conditions'], SELL_CONDITIONS))
+    return ''
+
 class StrategyTester:
-    def __init__(self):
+    def __init__(self, results_store=None):
         self.collector = DataCollector()
         self.model = TradingModel()
+        self.feature_store = FeatureStore(collector=self.collector)
+        self.results_store = results_store or ResultsStore()
+        self.timeframe = None
         
     def analyze_signals(self, timeframe='1d', limit=730):
         """Analisa os sinais gerados pela estratégia"""
+        self.timeframe = timeframe
         # Coleta dados históricos
         print("Coletando dados históricos...")
         df = self.collector.fetch_ohlcv_data(timeframe=timeframe, limit=limit)  # 2 anos de dados
-        df = self.collector.calculate_indicators(df)
-        
-        # Gera sinais baseados em múltiplos indicadores
-        df['signal'] = 0  # 0: Neutro, 1: Compra, -1: Venda
-        df['signal_reasons'] = ''  # Armazena as razões para cada sinal
-        last_signal = 0  # Controle para alternar sinais
+        df = self.feature_store.update(df, timeframe=timeframe)
         
-        for i in range(1, len(df)):
-            # Verifica se o preço está acima da média móvel de 200 dias
-            above_200ma = df.iloc[i]['close'] > df.iloc[i]['sma_200']
-            
-            # Condições de Compra
-            buy_conditions = {
-                'ABOVE_200MA': above_200ma,
-                'RSI_OVERSOLD': df.iloc[i]['rsi'] < RSI_OVERSOLD,
-                'MACD_CROSS_UP': df.iloc[i-1]['macd'] < df.iloc[i-1]['signal'] and df.iloc[i]['macd'] > df.iloc[i]['signal'],
-                'PRICE_NEAR_BB_LOW': df.iloc[i]['close'] <= df.iloc[i]['bollinger_lower'] * 1.02,
-                'VOLUME_INCREASE': df.iloc[i]['volume'] > df.iloc[i-1]['volume'] * VOLUME_INCREASE_THRESHOLD,
-                'UPTREND': df.iloc[i]['sma_50'] > df.iloc[i]['sma_200']
-            }
-            
-            # Condições de Venda
-            sell_conditions = {
-                'RSI_OVERBOUGHT': df.iloc[i]['rsi'] > RSI_OVERBOUGHT,
-                'MACD_CROSS_DOWN': df.iloc[i-1]['macd'] > df.iloc[i-1]['signal'] and df.iloc[i]['macd'] < df.iloc[i]['signal'],
-                'PRICE_NEAR_BB_HIGH': df.iloc[i]['close'] >= df.iloc[i]['bollinger_upper'] * 0.98,
-                'VOLUME_DECREASE': df.iloc[i]['volume'] < df.iloc[i-1]['volume'] * 0.7,
-                'DOWNTREND': df.iloc[i]['sma_50'] < df.iloc[i]['sma_200']
-            }
-            
-            # Verifica condições de compra apenas se o último sinal foi venda ou neutro
-            if last_signal <= 0:
-                active_buy_conditions = [cond for cond, is_true in buy_conditions.items() if is_true]
-                # Só gera sinal de compra se estiver acima da média móvel de 200 dias
-                if 'ABOVE_200MA' in active_buy_conditions and len(active_buy_conditions) >= 4:  # Aumentei para 4 pois ABOVE_200MA é obrigatório
-                    df.iloc[i, df.columns.get_loc('signal')] = 1
-                    df.iloc[i, df.columns.get_loc('signal_reasons')] = 'COMPRA: ' + ', '.join(active_buy_conditions)
-                    last_signal = 1
-            
-            # Verifica condições de venda apenas se o último sinal foi compra
-            elif last_signal == 1:
-                active_sell_conditions = [cond for cond, is_true in sell_conditions.items() if is_true]
-                if len(active_sell_conditions) >= 3:
-                    df.iloc[i, df.columns.get_loc('signal')] = -1
-                    df.iloc[i, df.columns.get_loc('signal_reasons')] = 'VENDA: ' + ', '.join(active_sell_conditions)
-                    last_signal = -1
+        df = self.generate_signals(df)
         
         return self.analyze_results(df)
     
+    @staticmethod
+    def generate_signals(df, rsi_oversold=RSI_OVERSOLD, rsi_overbought=RSI_OVERBOUGHT,
+                         volume_increase=VOLUME_INCREASE_THRESHOLD, min_buy_conditions=4, min_sell_conditions=3):
+        """Gera sinais baseados em múltiplos indicadores, com as condições codificadas em bitmasks"""
+        close, volume = df['close'], df['volume']
+        # Linha de sinal do MACD lida antes de a coluna 'signal' receber os sinais de trading
+        macd, macd_signal = df['macd'], df['signal']
+        
+        # Condições avaliadas de uma vez para todos os candles (NaN conta como falso)
+        buy_conditions = {
+            'ABOVE_200MA': close > df['sma_200'],
+            'RSI_OVERSOLD': df['rsi'] < rsi_oversold,
+            'MACD_CROSS_UP': (macd.shift() < macd_signal.shift()) & (macd > macd_signal),
+            'PRICE_NEAR_BB_LOW': close <= df['bollinger_lower'] * 1.02,
+            'VOLUME_INCREASE': volume > volume.shift() * volume_increase,
+            'UPTREND': df['sma_50'] > df['sma_200']
+        }
+        sell_conditions = {
+            'RSI_OVERBOUGHT': df['rsi'] > rsi_overbought,
+            'MACD_CROSS_DOWN': (macd.shift() > macd_signal.shift()) & (macd < macd_signal),
+            'PRICE_NEAR_BB_HIGH': close >= df['bollinger_upper'] * 0.98,
+            'VOLUME_DECREASE': volume < volume.shift() * 0.7,
+            'DOWNTREND': df['sma_50'] < df['sma_200']
+        }
+        buy_mask = encode_conditions(buy_conditions, BUY_CONDITIONS)
+        sell_mask = encode_conditions(sell_conditions, SELL_CONDITIONS)
+        
+        # Compra exige ABOVE_200MA e ao menos 4 condições (por padrão); venda ao menos 3
+        can_buy = ((buy_mask & ABOVE_200MA_BIT) > 0) & (POPCOUNT[buy_mask] >= min_buy_conditions)
+        can_sell = POPCOUNT[sell_mask] >= min_sell_conditions
+        
+        # Alterna compra/venda: só a máquina de estados percorre os candles
+        signal = np.zeros(len(df), dtype=np.int8)  # 0: Neutro, 1: Compra, -1: Venda
+        last_signal = 0
+        for i in range(1, len(df)):
+            if last_signal <= 0 and can_buy[i]:
+                signal[i] = last_signal = 1
+            elif last_signal == 1 and can_sell[i]:
+                signal[i] = last_signal = -1
+        
+        df['signal'] = signal
+        df['buy_conditions'] = buy_mask
+        df['sell_conditions'] = sell_mask
+        return df
+    
+    @staticmethod
+    def condition_combinations(df):
+        """Combinações de condições de compra que precederam operações e sua taxa de acerto"""
+        # Os sinais alternam começando pela compra, então entradas e saídas formam pares em ordem
+        entries = np.flatnonzero(df['signal'].values == 1)
+        exits = np.flatnonzero(df['signal'].values == -1)
+        entries = entries[:len(exits)]
+        close = df['close'].values
+        profit = (close[exits] - close[entries]) / close[entries] * 100
+        masks = df['buy_conditions'].values[entries].astype(np.int64)
+        
+        # Agregação por bitmask com bincount (uma posição por combinação possível)
+        size = 1 << len(BUY_CONDITIONS)
+        trades = np.bincount(masks, minlength=size)
+        wins = np.bincount(masks, weights=profit > 0, minlength=size)
+        total_profit = np.bincount(masks, weights=profit, minlength=size)
+        
+        combinations = np.flatnonzero(trades)
+        result = pd.DataFrame({
+            'mask': combinations,
+            'conditions': [', '.join(decode_conditions(m, BUY_CONDITIONS)) for m in combinations],
+            'trades': trades[combinations],
+            'winning_trades': wins[combinations].astype(int),
+            'win_rate': wins[combinations] / trades[combinations] * 100,
+            'average_profit': total_profit[combinations] / trades[combinations],
+        })
+        return result.sort_values(['winning_trades', 'win_rate'], ascending=False).reset_index(drop=True)
+
     def analyze_results(self, df):
         """Analisa os resultados da estratégia"""
         total_trades = len(df[df['signal'] != 0])
@@ -90,13 +154,16 @@ class StrategyTester:
         total_profit = 0
         winning_trades = 0
         losing_trades = 0
+        trade_records = []  # Entradas e saídas gravadas no banco de resultados
         
-        for idx, row in df.iterrows():
+        for bar, (idx, row) in enumerate(df.iterrows()):
             if row['signal'] == 1 and current_position is None:  # Compra
                 current_position = 'long'
                 entry_price = row['close']
+                trade_records.append({'timestamp': row.get('timestamp'), 'type': 'BUY', 'price': entry_price, 'bar': bar})
             elif row['signal'] == -1 and current_position == 'long':  # Venda
                 exit_price = row['close']
+                trade_records.append({'timestamp': row.get('timestamp'), 'type': 'SELL', 'price': exit_price, 'bar': bar})
                 profit = ((exit_price - entry_price) / entry_price) * 100
                 total_profit += profit
                 trades.append(profit)
@@ -129,6 +196,14 @@ class StrategyTester:
                 for i, trade in enumerate(worst_trades, 1):
                     print(f"{i}. {trade:.2f}%")
         
+        self.record_run(df, trades, trade_records, total_profit, winning_trades, losing_trades)
+        
+        if trades:
+            print("\nCombinações de condições nas compras:")
+            for _, combo in self.condition_combinations(df).head(5).iterrows():
+                print(f"{combo['conditions']}: {combo['winning_trades']}/{combo['trades']} vencedores "
+                      f"({combo['average_profit']:.2f}% em média)")
+        
         print("\n=== Comparativo com Buy and Hold (DCA) ===")
         
         # Simulação de DCA (Dollar Cost Averaging)
@@ -186,6 +261,33 @@ class StrategyTester:
         self.plot_analysis(df)
         return df
 
+    def record_run(self, df, trades, trade_records, total_profit, winning_trades, losing_trades):
+        """Grava a execução (métricas, sinais executados e curva de patrimônio) no banco de resultados"""
+        # Posição comprada do sinal de compra até o de venda; o retorno do candle vale a partir do seguinte
+        position = df['signal'].replace(0, np.nan).ffill().clip(lower=0).fillna(0)
+        returns = df['close'].pct_change().fillna(0) * position.shift(1).fillna(0)
+        equity = (1 + returns).cumprod().values
+        
+        stats = {
+            'total_trades': len(trades),
+            'winning_trades': winning_trades,
+            'losing_trades': losing_trades,
+            'return_percentage': total_profit,
+            'win_rate': (winning_trades / len(trades) * 100) if trades else None,
+        }
+        if len(equity) > 1:
+            stats.update(compute_metrics(equity, position.values,
+                                         periods_per_year=periods_per_year(self.timeframe or '1d')))
+        params = {
+            'timeframe': self.timeframe,
+            'indicator_params': self.feature_store.indicator_params,
+            'rsi_oversold': RSI_OVERSOLD,
+            'rsi_overbought': RSI_OVERBOUGHT,
+            'volume_increase_threshold': VOLUME_INCREASE_THRESHOLD,
+        }
+        return self.results_store.record_run('strategy', params, stats, trade_records, equity, position.values,
+                                             symbol=SYMBOL, timeframe=self.timeframe)
+
     def plot_comparison(self, df, dca_entries, trading_profit, dca_profit):
         """Plota gráfico comparativo entre as estratégias"""
         plt.figure(figsize=(15, 8))
@@ -250,8 +352,8 @@ class StrategyTester:
             marker = '^' if row['signal'] == 1 else 'v'
             ax1.scatter(idx, row['close'], color=color, marker=marker, s=200, zorder=5)
             
-            # Adiciona anotação com as razões
-            ax1.annotate(row['signal_reasons'], 
+            # Adiciona anotação com as razões (decodificadas dos bitmasks)
+            ax1.annotate(signal_reasons(row), 
                         xy=(idx, row['close']),
                         xytext=(20, 20 if row['signal'] == 1 else -20),
                         textcoords='offset points',
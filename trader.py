@@ -1,71 +1,217 @@
 from binance.client import Client
 from binance.enums import *
+from binance.exceptions import BinanceAPIException
 import time
-from config import API_KEY, API_SECRET, SYMBOL, TRADE_QUANTITY, STOP_LOSS_PERCENTAGE, TAKE_PROFIT_PERCENTAGE
+from journal import PositionJournal
+from config import (API_KEY, API_SECRET, SYMBOL, TRADE_QUANTITY, STOP_LOSS_PERCENTAGE, TAKE_PROFIT_PERCENTAGE,
+                    JOURNAL_ORDER_PREFIX)
+
+PROTECTIVE_ROLES = ('sl', 'tp')
+ORDER_NOT_FILLED = ('CANCELED', 'REJECTED', 'EXPIRED')  # Status finais sem execução
+ORDER_DOES_NOT_EXIST = -2013  # Código da Binance para ordem desconhecida
 
 class Trader:
-    def __init__(self):
-        self.client = Client(API_KEY, API_SECRET)
-        self.position = None
+    def __init__(self, client=None, journal=None):
+        self.client = client or Client(API_KEY, API_SECRET)
+        self.journal = journal or PositionJournal()
+        # Estado reconstruído do snapshot + journal, depois conferido com a exchange
+        self.position = self.journal.state['position']
+        self.reconcile()
 
     def get_current_price(self):
         """Obtém o preço atual do Bitcoin"""
         ticker = self.client.get_symbol_ticker(symbol=SYMBOL.replace('/', ''))
         return float(ticker['price'])
 
+    def reconcile(self):
+        """Confere o estado recuperado com a exchange; o journal é a fonte da verdade
+
+        A posição só passa a zerada com uma saída confirmada: a venda pendente ou uma perna de
+        proteção consultada pelo clientOrderId e executada. Sem confirmação, o estado do journal vale.
+        """
+        state = self.journal.state
+        journal_orders = self.journal.open_orders()
+        intent = state['pending_intent']
+        if state['position'] is None and intent is None and not journal_orders:
+            return self.position  # Nada foi enviado à exchange desde o último estado conhecido
+
+        try:
+            open_orders = self.client.get_open_orders(symbol=SYMBOL.replace('/', ''))
+            live = {}
+            for order in open_orders:
+                client_id = order.get('clientOrderId', '')
+                if client_id.startswith(JOURNAL_ORDER_PREFIX):
+                    live[client_id] = {
+                        'role': client_id.rsplit('-', 1)[-1],
+                        'order_id': order['orderId'],
+                        'status': 'NEW',
+                        'price': float(order['price']),
+                    }
+
+            position = state['position']
+            if intent is not None:
+                status = self._order_status(intent['client_id'])
+                if intent['side'] == 'BUY':
+                    # Compra executada (ou ainda aberta na exchange) conta como posição; só a ausência
+                    # da ordem ou uma rejeição confirmam que nada foi comprado
+                    if status is not None and status not in ORDER_NOT_FILLED:
+                        position = 'LONG'
+                        print(f"Compra {intent['client_id']} confirmada ({status}) durante a queda.")
+                elif status == 'FILLED':
+                    position = None
+                else:
+                    print(f"Venda {intent['client_id']} não executada ({status}); posição continua aberta.")
+
+            # Pernas de proteção que sumiram das ordens abertas: só uma execução encerra a posição
+            exited = False
+            for client_id, order in journal_orders.items():
+                if order['role'] in PROTECTIVE_ROLES and client_id not in live:
+                    if self._order_status(client_id) == 'FILLED':
+                        exited = True
+                    else:
+                        print(f"Ordem de proteção {client_id} encerrada sem execução.")
+        except Exception as e:
+            print(f"Erro ao reconciliar com a exchange, mantendo estado do journal: {e}")
+            return self.position
+
+        if exited:
+            # Uma das pernas (stop ou alvo) executou: a posição foi encerrada e a outra sobrou
+            for client_id in [cid for cid, o in live.items() if o['role'] in PROTECTIVE_ROLES]:
+                self._cancel(client_id, live.pop(client_id)['order_id'])
+            position = None
+        elif position == 'LONG' and not any(o['role'] in PROTECTIVE_ROLES for o in live.values()):
+            print("Posição LONG sem ordens de proteção na exchange. Verifique a conta.")
+
+        if position == 'LONG':
+            # A ordem de entrada continua no journal: dela vêm o preço e o horário da posição
+            entries = [cid for cid, o in state['orders'].items() if o['role'] == 'entry']
+            if entries:
+                live[entries[-1]] = state['orders'][entries[-1]]
+        self.journal.record('reconcile', durable=True, position=position, orders=live)
+        self.position = position
+        return position
+
+    def _order_status(self, client_id):
+        """Status da ordem consultada pelo clientOrderId; None se a exchange não a conhece"""
+        try:
+            return self.client.get_order(symbol=SYMBOL.replace('/', ''), origClientOrderId=client_id)['status']
+        except BinanceAPIException as e:
+            if e.code == ORDER_DOES_NOT_EXIST:
+                return None
+            raise
+
+    def _cancel(self, client_id, order_id):
+        try:
+            self.client.cancel_order(symbol=SYMBOL.replace('/', ''), orderId=order_id)
+            self.journal.record('cancel', client_id=client_id)
+        except Exception as e:
+            print(f"Erro ao cancelar ordem {client_id}: {e}")
+
     def place_buy_order(self, price):
         """Coloca uma ordem de compra"""
+        if self.position is not None or self.journal.state['pending_intent'] is not None:
+            print("Já existe posição aberta ou ordem pendente; compra ignorada.")
+            return None
+
+        entry_id = self.journal.next_client_id('entry')
         try:
+            # A intenção é gravada (com fsync) antes de a ordem sair
+            self.journal.record('intent', durable=True, side='BUY', client_id=entry_id)
             order = self.client.create_order(
                 symbol=SYMBOL.replace('/', ''),
                 side=SIDE_BUY,
                 type=ORDER_TYPE_MARKET,
-                quantity=TRADE_QUANTITY
+                quantity=TRADE_QUANTITY,
+                newClientOrderId=entry_id
             )
+            self.journal.record('order', durable=True, client_id=entry_id, role='entry',
+                                order_id=order.get('orderId'), status='FILLED', price=price)
             
             # Define stop loss e take profit
             stop_loss_price = price * (1 - STOP_LOSS_PERCENTAGE)
             take_profit_price = price * (1 + TAKE_PROFIT_PERCENTAGE)
             
             # Coloca ordens de stop loss e take profit
-            self.client.create_order(
+            stop_loss_id = self.journal.next_client_id('sl')
+            stop_loss = self.client.create_order(
                 symbol=SYMBOL.replace('/', ''),
                 side=SIDE_SELL,
                 type=ORDER_TYPE_STOP_LOSS_LIMIT,
                 quantity=TRADE_QUANTITY,
                 price=str(stop_loss_price),
-                stopPrice=str(stop_loss_price)
+                stopPrice=str(stop_loss_price),
+                newClientOrderId=stop_loss_id
             )
+            self.journal.record('order', client_id=stop_loss_id, role='sl',
+                                order_id=stop_loss.get('orderId'), price=stop_loss_price)
             
-            self.client.create_order(
+            take_profit_id = self.journal.next_client_id('tp')
+            take_profit = self.client.create_order(
                 symbol=SYMBOL.replace('/', ''),
                 side=SIDE_SELL,
                 type=ORDER_TYPE_LIMIT,
                 quantity=TRADE_QUANTITY,
-                price=str(take_profit_price)
+                price=str(take_profit_price),
+                newClientOrderId=take_profit_id
             )
+            self.journal.record('order', client_id=take_profit_id, role='tp',
+                                order_id=take_profit.get('orderId'), price=take_profit_price)
             
             self.position = 'LONG'
+            self.journal.record('position', durable=True, position='LONG')
             return order
         except Exception as e:
             print(f"Erro ao executar ordem de compra: {e}")
+            self._resolve_failed_entry(entry_id, e)
             return None
 
+    def _resolve_failed_entry(self, entry_id, error):
+        """Define o estado após erro na compra sem arriscar entrada dupla"""
+        if entry_id in self.journal.state['orders']:
+            # A compra executou; falharam apenas as ordens de proteção
+            self.position = 'LONG'
+            self.journal.record('position', durable=True, position='LONG')
+        elif isinstance(error, BinanceAPIException):
+            # Rejeitada pela exchange: nada foi executado
+            self.journal.record('intent_failed', durable=True)
+        else:
+            # Resultado desconhecido (ex.: timeout): a intenção fica pendente até a reconciliação
+            self.position = 'LONG'
+
     def place_sell_order(self):
         """Coloca uma ordem de venda"""
         try:
+            # Cancela stop loss e take profit antes de vender, para não vender duas vezes
+            for client_id, order in list(self.journal.open_orders().items()):
+                if order['role'] in PROTECTIVE_ROLES:
+                    self._cancel(client_id, order['order_id'])
+
+            exit_id = self.journal.next_client_id('exit')
+            self.journal.record('intent', durable=True, side='SELL', client_id=exit_id)
             order = self.client.create_order(
                 symbol=SYMBOL.replace('/', ''),
                 side=SIDE_SELL,
                 type=ORDER_TYPE_MARKET,
-                quantity=TRADE_QUANTITY
+                quantity=TRADE_QUANTITY,
+                newClientOrderId=exit_id
             )
+            self.journal.record('order', client_id=exit_id, role='exit', order_id=order.get('orderId'),
+                                status='FILLED')
             self.position = None
+            self.journal.record('position', durable=True, position=None)
             return order
         except Exception as e:
             print(f"Erro ao executar ordem de venda: {e}")
+            # Só uma rejeição da exchange garante que a venda não foi executada
+            if isinstance(e, BinanceAPIException) and self.journal.state['pending_intent'] is not None:
+                self.journal.record('intent_failed', durable=True)
             return None
 
+    def entry_order(self):
+        """Ordem de entrada mais recente do journal (preço e horário de envio), ou None"""
+        entries = [order for order in self.journal.state['orders'].values() if order['role'] == 'entry']
+        return entries[-1] if entries else None
+
     def check_position(self):
         """Verifica a posição atual"""
         return self.position